@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "coca_sarli.settings.development")
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WEBHOOK_URL:
+    from meals.webhook import start_webhook
+
+    start_webhook()
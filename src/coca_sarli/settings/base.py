@@ -6,6 +6,10 @@ env = environ.Env(
     TELEGRAM_TOKEN=str,
     CHAT_ID=int,
     DEVELOPER_CHAT_ID=int,
+    WEBHOOK_URL=(str, None),
+    TELEGRAM_BASE_URL=(str, None),
+    UPDATER_WORKERS=(int, 8),
+    METRICS_DIR=(str, None),
 )
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__) - 3
@@ -124,3 +128,53 @@ LOGGING = {
 CHAT_ID = env("CHAT_ID")
 DEVELOPER_CHAT_ID = env("DEVELOPER_CHAT_ID")
 TELEGRAM_TOKEN = env("TELEGRAM_TOKEN")
+WEBHOOK_URL = env("WEBHOOK_URL")
+TELEGRAM_BASE_URL = env("TELEGRAM_BASE_URL")
+UPDATER_WORKERS = env("UPDATER_WORKERS")
+METRICS_DIR = env("METRICS_DIR")
+
+# Segundos que se reusa cada conexión a la base. Los threads del bot corren todo el proceso,
+# así que sin esto cada update, job o envío del outbox abriría y cerraría su propia conexión.
+DATABASE_CONN_MAX_AGE = 60
+
+# Cantidad de gráficos del historial que se guardan para no volver a renderizarlos.
+HISTORY_CHART_CACHE_SIZE = 32
+
+# Límites de envío de mensajes a Telegram, en mensajes por segundo.
+OUTBOUND_GLOBAL_RATE = 30
+OUTBOUND_CHAT_RATE = 20 / 60
+OUTBOUND_CHAT_BURST = 5
+OUTBOUND_MAX_RETRIES = 3
+# Envíos a Telegram en vuelo a la vez, cada uno de un chat distinto.
+OUTBOUND_WORKERS = 4
+# Segundos que se espera un envío cuando hace falta el Message, como el file_id de una media.
+OUTBOUND_RESULT_TIMEOUT = 30
+
+# Envío de los mensajes del outbox: tamaño de cada lote, reintentos con espera exponencial
+# en segundos, y cada cuánto se revisa si hay mensajes de otros procesos o reintentos.
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 5
+OUTBOX_MAX_RETRY_DELAY = 15 * 60
+OUTBOX_POLL_INTERVAL = 5
+# Cuánto tiempo tiene un proceso para enviar cada mensaje de un lote antes de que otro pueda
+# volver a tomarlo. Tiene que ser mayor que OUTBOUND_RESULT_TIMEOUT.
+OUTBOX_LEASE = 60
+
+# Lease del proceso que corre los jobs, en segundos. Si el líder se cae otro proceso
+# toma los jobs cuando vence, y el líder lo renueva cada SCHEDULER_LEASE_RENEW_INTERVAL.
+SCHEDULER_LEASE_TTL = 15
+SCHEDULER_LEASE_RENEW_INTERVAL = 5
+
+# Cada cuántos segundos se buscan jobs programados para correr, y cuánto tarde, en segundos,
+# se corre todavía un job que se pasó de su hora porque el bot estaba caído.
+SCHEDULER_TICK_INTERVAL = 10
+SCHEDULED_JOB_MISFIRE_GRACE = 60 * 60
+# Segundos hasta reintentar un job que falló, mientras los reintentos entren en el margen.
+SCHEDULED_JOB_RETRY_DELAY = 5 * 60
+# Cuántos segundos antes del último tick se vuelven a leer los jobs que cambiaron, por si los
+# cambió una réplica con el reloj atrasado o en una transacción que tardó en commitear.
+SCHEDULER_SYNC_MARGIN = 60
+
+# Cada cuántos segundos escribe cada proceso sus métricas en METRICS_DIR, si está configurado.
+METRICS_WRITE_INTERVAL = 5
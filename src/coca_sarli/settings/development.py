@@ -8,5 +8,6 @@ DATABASES = {
         "PASSWORD": "docker",
         "HOST": "127.0.0.1",
         "PORT": "5432",
+        "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,  # noqa: F405
     }
 }
@@ -3,4 +3,8 @@ from .base import *  # noqa: F401
 
 DEBUG = False
 
-DATABASES = {"default": dj_database_url.config()}
+ALLOWED_HOSTS = env.list("ALLOWED_HOSTS", default=[])  # noqa: F405
+
+DATABASES = {
+    "default": dj_database_url.config(conn_max_age=DATABASE_CONN_MAX_AGE)  # noqa: F405
+}
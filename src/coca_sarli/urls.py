@@ -15,7 +15,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
+from meals.metrics import metrics_view
+from meals.webhook import telegram_webhook
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
+    path("telegram/<str:token>/", telegram_webhook, name="telegram_webhook"),
 ]
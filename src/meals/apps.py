@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MealsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "meals"
+
+    def ready(self):
+        from meals import signals  # noqa: F401
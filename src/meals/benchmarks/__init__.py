@@ -0,0 +1,86 @@
+BENCHMARKS = {}
+# Los que tardan demasiado para correr siempre, solo corren si se los nombra.
+ON_DEMAND = set()
+
+# Un tiempo empeora si supera al del baseline en más de la tolerancia y en más de estos ms,
+# así el ruido de lo que tarda décimas de ms no hace fallar la comparación.
+REGRESSION_MIN_MS = 0.25
+# Los percentiles altos cambian mucho de una corrida a otra, se informan pero no se comparan.
+NOT_COMPARED = {"p95_ms"}
+
+
+def benchmark(name, on_demand=False):
+    """
+    Registra una función como benchmark, para correrla con `python manage.py benchmark <name>`.
+    La función recibe las iteraciones y devuelve un dict con los resultados.
+    """
+
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        if on_demand:
+            ON_DEMAND.add(name)
+        return fn
+
+    return decorator
+
+
+def load_benchmarks():
+    from meals.benchmarks import (  # noqa: F401
+        charts,
+        history,
+        instrumentation,
+        outbox,
+        reactions,
+        views,
+    )
+
+    return BENCHMARKS
+
+
+def flatten(results, prefix=""):
+    """
+    Los valores de un dict de resultados anidado, por su camino separado con puntos.
+    """
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compara los resultados con los de un baseline, por nombre de benchmark.
+    Empeoran los tiempos terminados en _ms que crecen más que `tolerance` (0.5 es un 50%),
+    menos los de NOT_COMPARED, las queries que crecen y los textos que cambian, como la base
+    contra la que se corrió.
+    :return: Una descripción de cada métrica que empeoró.
+    """
+    current = flatten(results)
+    previous = flatten(baseline)
+    regressions = []
+    for path, value in current.items():
+        if path not in previous:
+            continue
+
+        before = previous[path]
+        name = path.rsplit(".", 1)[-1]
+        if name in NOT_COMPARED:
+            continue
+        if isinstance(value, str) or isinstance(before, str):
+            worse = value != before
+        elif name.endswith("_ms"):
+            worse = (
+                value > before * (1 + tolerance) and value - before > REGRESSION_MIN_MS
+            )
+        elif name == "queries" or name.endswith("_queries"):
+            worse = value > before
+        else:
+            continue
+
+        if worse:
+            regressions.append(f"{path}: {before} en el baseline, ahora {value}")
+    return regressions
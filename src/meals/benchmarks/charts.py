@@ -0,0 +1,38 @@
+import time
+from meals.benchmarks import benchmark
+from meals.benchmarks.utils import get_rss_kb
+from meals.graphs import render_history_chart
+
+GRAPH = {
+    "names": ["pablo", "juli", "cele", "fantas", "euge"],
+    "values": [12, 9, 7, 7, 3],
+    "total": 38,
+}
+WARMUP = 100
+
+
+@benchmark("charts")
+def charts_benchmark(iterations=10000):
+    """
+    Renderiza el gráfico del historial muchas veces y mide cuánto crece el RSS.
+    """
+    for _ in range(WARMUP):
+        render_history_chart(GRAPH)
+
+    rss_start = get_rss_kb()
+    samples = []
+    start = time.perf_counter()
+    for iteration in range(1, iterations + 1):
+        render_history_chart(GRAPH)
+        if iteration % max(iterations // 10, 1) == 0:
+            samples.append(get_rss_kb())
+    elapsed = time.perf_counter() - start
+
+    return {
+        "renders": iterations,
+        "renders_per_second": iterations / elapsed,
+        "rss_start_kb": rss_start,
+        "rss_end_kb": samples[-1],
+        "rss_growth_kb": samples[-1] - rss_start,
+        "rss_samples_kb": samples,
+    }
@@ -0,0 +1,123 @@
+import time
+from datetime import timedelta
+from django.db.models import Count
+from django.utils import timezone
+from meals.benchmarks import benchmark
+from meals.benchmarks.utils import build_counters, get_query_count, rolled_back
+from meals.handlers.utils import get_history_window_start
+from meals.models import Meal, MealItem, Participant
+from meals.views import history
+
+CHATS = 20
+PARTICIPANTS_PER_CHAT = 8
+ITEMS_PER_MEAL = 2
+YEARS = 10
+# Un chat que no choca con los de verdad.
+FIRST_CHAT_ID = -1000
+
+
+@benchmark("history")
+def history_benchmark(iterations=200):
+    """
+    Compara /historial leyendo los contadores contra el join con Count sobre las comidas,
+    con 10 años de comidas semanales en varios chats.
+    """
+    today = timezone.now().date()
+    windows = {
+        "all_time": None,
+        "year": get_history_window_start("año", None, today),
+        "12_weeks": get_history_window_start("semanas", 12, today),
+    }
+
+    with rolled_back():
+        meal_items = seed(today)
+        chat_id = FIRST_CHAT_ID
+
+        results = {"meal_items": meal_items}
+        for name, since in windows.items():
+            results[name] = compare(
+                iterations,
+                lambda: list(history(chat_id, since=since)),
+                lambda: list(scan_history(chat_id, since=since)),
+            )
+        results["resume"] = compare(
+            iterations,
+            lambda: list(history(chat_id, month=today.replace(day=1))),
+            lambda: list(scan_history(chat_id)),
+        )
+
+    return results
+
+
+def seed(today):
+    first_day = today - timedelta(weeks=52 * YEARS)
+    chat_ids = [FIRST_CHAT_ID - index for index in range(CHATS)]
+
+    Participant.objects.bulk_create(
+        [
+            Participant(chat_id=chat_id, name=f"participante{index}")
+            for chat_id in chat_ids
+            for index in range(PARTICIPANTS_PER_CHAT)
+        ]
+    )
+    Meal.objects.bulk_create(
+        [
+            Meal(chat_id=chat_id, done=True, done_at=first_day + timedelta(weeks=week))
+            for chat_id in chat_ids
+            for week in range(52 * YEARS)
+        ]
+    )
+
+    participants = {}
+    for participant in Participant.objects.filter(chat_id__in=chat_ids):
+        participants.setdefault(participant.chat_id, []).append(participant)
+
+    meal_items = []
+    for index, meal in enumerate(Meal.objects.filter(chat_id__in=chat_ids)):
+        chat_participants = participants[meal.chat_id]
+        for item in range(ITEMS_PER_MEAL):
+            meal_items.append(
+                MealItem(
+                    meal=meal,
+                    owner=chat_participants[(index + item) % len(chat_participants)],
+                    description="comida",
+                )
+            )
+    MealItem.objects.bulk_create(meal_items, batch_size=1000)
+
+    build_counters()
+
+    return len(meal_items)
+
+
+def scan_history(chat_id, since=None):
+    """
+    Cómo se calculaba el historial antes de los contadores.
+    """
+    meal_filter = {"mealitem__meal__done": True}
+    if since is not None:
+        meal_filter["mealitem__meal__done_at__gte"] = since
+    return (
+        Participant.objects.filter(chat_id=chat_id, **meal_filter)
+        .annotate(total_meals=Count("mealitem__meal__pk"))
+        .order_by("-total_meals")
+    )
+
+
+def compare(iterations, rollup, scan):
+    rollup_ms = measure(iterations, rollup)
+    scan_ms = measure(iterations, scan)
+    return {
+        "rollup_ms": rollup_ms,
+        "scan_ms": scan_ms,
+        "speedup": scan_ms / rollup_ms,
+        "rollup_queries": get_query_count(rollup),
+    }
+
+
+def measure(iterations, fn):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) * 1000 / iterations
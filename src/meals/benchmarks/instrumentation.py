@@ -0,0 +1,35 @@
+import time
+from meals.benchmarks import benchmark
+from meals.instrumentation import HandlerMetrics
+
+
+def noop_handler():
+    pass
+
+
+def run_handler(iterations, metrics=None):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if metrics is None:
+            noop_handler()
+        else:
+            with metrics.measure("noop_handler"):
+                noop_handler()
+    return time.perf_counter() - start
+
+
+@benchmark("instrumentation")
+def instrumentation_benchmark(iterations=200000):
+    """
+    Cuánto le agrega medir con HandlerMetrics a cada corrida de un handler que no hace nada.
+    """
+    metrics = HandlerMetrics()
+    bare_time = run_handler(iterations)
+    measured_time = run_handler(iterations, metrics)
+    record = metrics.snapshot()["noop_handler"]
+
+    return {
+        "iterations": iterations,
+        "overhead_us_per_call": (measured_time - bare_time) / iterations * 1e6,
+        "measured_p99_us": record.latency.percentile(99),
+    }
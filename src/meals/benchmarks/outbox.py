@@ -0,0 +1,103 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from meals import outbox
+from meals.benchmarks import benchmark
+from meals.benchmarks.utils import get_query_count, rolled_back
+from meals.outbox import deliver_outbox
+
+CHATS = 100
+BATCH_SIZES = [1, 10, 50, 200]
+# Chats que no chocan con los de verdad.
+FIRST_CHAT_ID = -2000
+# Lo que tarda Telegram en contestar, y cuántos mensajes se entregan con esa demora.
+LATENCY = 0.02
+LATENCY_MESSAGES = 200
+
+
+class NullBot:
+    """
+    Un bot que no envía nada, así se mide solo lo que cuesta el outbox.
+    """
+
+    def send_message(self, chat_id, text, **kwargs):
+        pass
+
+
+class LatencyBot:
+    """
+    Un bot que tarda LATENCY en enviar cada mensaje, con tantos envíos a la vez como workers
+    tiene el sender y sin sus límites, así se ve si el outbox espera cada envío.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(settings.OUTBOUND_WORKERS)
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.executor.submit(time.sleep, LATENCY)
+
+
+@benchmark("outbox")
+def outbox_benchmark(iterations=2000):
+    """
+    Encola `iterations` mensajes repartidos en varios chats y mide cuántos por segundo
+    se encolan y se entregan, con distintos tamaños de lote. También mide cuántos se
+    entregan por segundo cuando cada envío tarda LATENCY.
+    """
+    results = {"messages": iterations}
+
+    for batch_size in BATCH_SIZES:
+        with rolled_back():
+            start = time.perf_counter()
+            enqueue_messages(iterations, batch_size)
+            enqueue_seconds = time.perf_counter() - start
+
+            bot = NullBot()
+            delivered = []
+            start = time.perf_counter()
+            queries = get_query_count(
+                lambda: delivered.append(deliver_outbox(bot, batch_size))
+            )
+            while delivered[-1]:
+                delivered.append(deliver_outbox(bot, batch_size))
+            deliver_seconds = time.perf_counter() - start
+
+        with rolled_back():
+            enqueue_messages(LATENCY_MESSAGES, batch_size)
+            bot = LatencyBot()
+            start = time.perf_counter()
+            latency_delivered = deliver_all(bot, batch_size)
+            latency_seconds = time.perf_counter() - start
+            bot.executor.shutdown()
+
+        results[f"batch_{batch_size}"] = {
+            "enqueued_per_second": iterations / enqueue_seconds,
+            "delivered_per_second": sum(delivered) / deliver_seconds,
+            "queries_per_batch": queries,
+            "delivered_per_second_with_latency": latency_delivered / latency_seconds,
+        }
+
+    return results
+
+
+def deliver_all(bot, batch_size):
+    delivered = total = deliver_outbox(bot, batch_size)
+    while delivered:
+        delivered = deliver_outbox(bot, batch_size)
+        total += delivered
+    return total
+
+
+def enqueue_messages(count, batch_size):
+    """
+    Encola de a `batch_size` mensajes, como un job que encola varios a la vez.
+    """
+    for start in range(0, count, batch_size):
+        outbox.enqueue(
+            *[
+                outbox.message(
+                    FIRST_CHAT_ID - index % CHATS, "hola", f"benchmark:{index}"
+                )
+                for index in range(start, min(start + batch_size, count))
+            ]
+        )
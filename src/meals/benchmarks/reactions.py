@@ -0,0 +1,98 @@
+import random
+import re
+import time
+from datetime import datetime
+from telegram import Chat, Message, Update
+from telegram.ext import MessageHandler
+from telegram.ext.filters import Filters
+from meals.benchmarks import benchmark
+from meals.handlers.reactions import REACTIONS_ARGS, ReactionFilter
+
+WORDS = (
+    "hola che quien trae el vino mañana a la noche yo llevo pan y queso "
+    "alguien sabe a que hora arrancamos dale nos vemos tipo nueve salio "
+    "bien la ultima vez habria que repetir el postre me quedo corto"
+).split()
+TRIGGERS = ["rica", "comprar", "chocolate", "intentar"]
+EXTRA_WORDS = (
+    "asado birra fernet helado empanada pizza fainá milanesa ñoquis tarta "
+    "vermut picada flan alfajor mate facturas choripan provoleta sorrentinos "
+    "locro humita tamal guiso polenta budin torta medialuna churro dulce "
+    "garrapiñada salame jamon aceituna chimichurri matambre vacio mollejas "
+    "chinchulines morcilla chorizo ensalada rucula tomate cebolla morron "
+    "zapallo batata papas fritas lentejas"
+).split()
+
+
+def get_corpus(size, trigger_ratio=0.1):
+    rng = random.Random(1)
+    corpus = []
+    for _ in range(size):
+        words = rng.choices(WORDS, k=rng.randint(3, 25))
+        if rng.random() < trigger_ratio:
+            words.insert(rng.randrange(len(words)), rng.choice(TRIGGERS))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def get_updates(corpus):
+    chat = Chat(1, Chat.GROUP)
+    return [
+        Update(index, message=Message(index, datetime.now(), chat, text=text))
+        for index, text in enumerate(corpus)
+    ]
+
+
+def get_reactions_args(count):
+    """
+    Las reacciones actuales más reacciones inventadas hasta llegar a `count`.
+    """
+    extra = [(rf"\b{word}\b", None) for word in EXTRA_WORDS]
+    return (list(REACTIONS_ARGS) + extra)[:count]
+
+
+def get_handler_chain(reactions_args):
+    return [
+        MessageHandler(
+            Filters.regex(re.compile(regex, re.IGNORECASE)) & ~Filters.command, handler
+        )
+        for regex, handler in reactions_args
+    ]
+
+
+def run_chain(handlers, updates):
+    hits = 0
+    start = time.perf_counter()
+    for update in updates:
+        for handler in handlers:
+            if handler.check_update(update):
+                hits += 1
+                break
+    return time.perf_counter() - start, hits
+
+
+@benchmark("reactions")
+def reactions_benchmark(iterations=20000):
+    """
+    Compara un handler por regex contra el filtro combinado de reacciones.
+    """
+    updates = get_updates(get_corpus(iterations))
+    results = {"messages": iterations}
+
+    for count in (len(REACTIONS_ARGS), 12, 48):
+        reactions_args = get_reactions_args(count)
+        chain_time, chain_hits = run_chain(get_handler_chain(reactions_args), updates)
+        router = [
+            MessageHandler(ReactionFilter(reactions_args) & ~Filters.command, None)
+        ]
+        router_time, router_hits = run_chain(router, updates)
+        assert chain_hits == router_hits
+
+        results[f"{count}_reactions"] = {
+            "hits": router_hits,
+            "chain_messages_per_second": iterations / chain_time,
+            "router_messages_per_second": iterations / router_time,
+            "speedup": chain_time / router_time,
+        }
+
+    return results
@@ -0,0 +1,65 @@
+import resource
+import sys
+from contextlib import contextmanager
+from os import sysconf
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from meals.models import MonthlyCounter, ParticipantCounter
+
+
+def get_rss_kb():
+    """
+    RSS actual del proceso en KB. Si no hay /proc usa el máximo, que alcanza para ver si crece.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+
+@contextmanager
+def rolled_back():
+    """
+    Corre el bloque en una transacción que se deshace al final, así los datos
+    sintéticos no quedan en la base.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def get_query_count(fn):
+    # El log de queries de la conexión tiene un máximo, si se llenó no se puede contar.
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+    return len(queries)
+
+
+def build_counters():
+    """
+    Arma los contadores del historial desde las comidas. bulk_create no pasa por Meal.save,
+    así que los benchmarks los arman de una después de crear las comidas.
+    """
+    ParticipantCounter.objects.bulk_create(
+        [
+            ParticipantCounter(participant_id=participant_id, total_meals=total)
+            for participant_id, total in ParticipantCounter.get_expected_totals().items()
+        ],
+        ignore_conflicts=True,
+    )
+    MonthlyCounter.objects.bulk_create(
+        [
+            MonthlyCounter(
+                participant_id=participant_id, month=month, total_meals=total
+            )
+            for (
+                participant_id,
+                month,
+            ), total in MonthlyCounter.get_expected_totals().items()
+        ],
+        ignore_conflicts=True,
+    )
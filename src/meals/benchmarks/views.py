@@ -0,0 +1,234 @@
+import time
+from datetime import date, timedelta
+from functools import partial
+from django.db import connection
+from django.utils import timezone
+from meals.benchmarks import benchmark
+from meals.benchmarks.utils import build_counters, get_query_count, rolled_back
+from meals.handlers.commands_user import get_history, get_next_meals_page
+from meals.handlers.utils import get_history_window_start
+from meals.models import CocaSettings, Meal, MealItem, Participant, settings_cache
+from meals.tests.factories import MealFactory, MealItemFactory, ParticipantFactory
+from meals.views import (
+    add_meal,
+    copy_meal,
+    get_next_meal,
+    get_next_meals,
+    get_previous_meals,
+    get_todays_birthdays,
+    history,
+)
+
+# Comidas, participantes y chats de cada escala. Todos los chats tienen 1000 comidas y
+# 10 participantes: lo que crece es lo que hay en los otros chats alrededor del que se mide.
+SCALES = {
+    "1k": (10**3, 10, 1),
+    "10k": (10**4, 10**2, 10),
+    "100k": (10**5, 10**3, 100),
+    "1m": (10**6, 10**4, 1000),
+}
+ITEMS_PER_MEAL = 2
+# La parte de las comidas de cada chat que todavía no se hizo, las últimas que se agregaron.
+PENDING_RATIO = 0.1
+BATCH_SIZE = 5000
+# Un chat que no choca con los de verdad ni con los del benchmark history.
+FIRST_CHAT_ID = -2000
+
+
+def views_benchmark(scale, iterations=100):
+    """
+    Mide las vistas y los mensajes de /proximas y /historial en un chat, con la base llena
+    de comidas de otros chats según la escala. Todo se deshace al terminar, y cada corrida
+    de lo que escribe también, así todas las iteraciones ven los mismos datos.
+    """
+    meals, participants, chats = SCALES[scale]
+    today = timezone.now().date()
+    chat_id = FIRST_CHAT_ID
+
+    with rolled_back():
+        started_at = time.perf_counter()
+        seed(meals, participants, chats, today)
+        seed_s = time.perf_counter() - started_at
+
+        CocaSettings.objects.create(
+            chat_id=chat_id,
+            reminder_hour_utc=14,
+            reminder_day=0,
+            history_resume_day=1,
+            random_run_probability=50,
+        )
+        try:
+            operations = get_operations(chat_id, today)
+            results = {
+                name: measure(iterations, fn, writes)
+                for name, (fn, writes) in operations.items()
+            }
+        finally:
+            # El cache no se entera del rollback.
+            settings_cache.invalidate(chat_id)
+
+    return {
+        "database": connection.vendor,
+        "meals": meals,
+        "meal_items": meals * ITEMS_PER_MEAL,
+        "participants": participants,
+        "chats": chats,
+        "seed_s": round(seed_s, 1),
+        **results,
+    }
+
+
+def seed(meals, participants, chats, today):
+    """
+    Crea las comidas, sus items y los participantes de cada chat con las factories de los tests.
+    Las comidas son semanales hasta hoy y cada participante cumple un día distinto,
+    el primero hoy.
+    """
+    meals_per_chat = meals // chats
+    participants_per_chat = participants // chats
+    pending = int(meals_per_chat * PENDING_RATIO)
+    first_day = today - timedelta(weeks=meals_per_chat)
+
+    for index in range(chats):
+        chat_id = FIRST_CHAT_ID - index
+        Participant.objects.bulk_create(
+            [
+                ParticipantFactory.build(
+                    chat_id=chat_id,
+                    name=f"participante{number}",
+                    birthday=birthday,
+                )
+                for number, birthday in enumerate(
+                    get_birthdays(today, participants_per_chat)
+                )
+            ]
+        )
+        Meal.objects.bulk_create(
+            [
+                MealFactory.build(
+                    chat_id=chat_id,
+                    done=week < meals_per_chat - pending,
+                    done_at=(
+                        first_day + timedelta(weeks=week)
+                        if week < meals_per_chat - pending
+                        else None
+                    ),
+                )
+                for week in range(meals_per_chat)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        owners = list(Participant.objects.filter(chat_id=chat_id).order_by("id"))
+        MealItem.objects.bulk_create(
+            [
+                MealItemFactory.build(
+                    meal=meal,
+                    owner=owners[(position + item) % len(owners)],
+                    description="comida",
+                )
+                for position, meal in enumerate(
+                    Meal.objects.filter(chat_id=chat_id).only("id")
+                )
+                for item in range(ITEMS_PER_MEAL)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    build_counters()
+
+
+def get_birthdays(today, count):
+    # 1992 es bisiesto, así también hay un cumpleaños hoy si es 29 de febrero.
+    first = date(1992, today.month, today.day)
+    return [first + timedelta(days=37 * number) for number in range(count)]
+
+
+def get_operations(chat_id, today):
+    """
+    Lo que se mide, por nombre: la función y si escribe en la base.
+    """
+    pending_ids = list(
+        Meal.objects.filter(chat_id=chat_id, done=False).values_list("id", flat=True)
+    )
+    done_id = (
+        Meal.objects.filter(chat_id=chat_id, done=True)
+        .values_list("id", flat=True)
+        .last()
+    )
+    names = list(
+        Participant.objects.filter(chat_id=chat_id)
+        .order_by("id")
+        .values_list("name", flat=True)[:2]
+    )
+    year_start = get_history_window_start("año", None, today)
+
+    def next_meals_message():
+        meals, has_previous, has_next = get_next_meals(chat_id)
+        return get_next_meals_page(chat_id, meals, 0, has_previous, has_next)
+
+    return {
+        "add_meal": (
+            lambda: add_meal(chat_id, [(name, "asado") for name in names]),
+            True,
+        ),
+        "get_next_meal": (lambda: get_next_meal(chat_id), True),
+        "history": (lambda: list(history(chat_id)), False),
+        "history_year": (lambda: list(history(chat_id, since=year_start)), False),
+        "get_next_meals": (lambda: get_next_meals(chat_id), False),
+        "get_next_meals_deep": (
+            lambda: get_next_meals(
+                chat_id, after_id=pending_ids[len(pending_ids) // 2]
+            ),
+            False,
+        ),
+        "get_previous_meals": (
+            lambda: list(get_previous_meals(chat_id, 5)),
+            False,
+        ),
+        "copy_meal": (lambda: copy_meal(chat_id, done_id), True),
+        "get_todays_birthdays": (lambda: list(get_todays_birthdays(chat_id)), False),
+        "next_meals_message": (next_meals_message, False),
+        "history_message": (
+            lambda: get_history(chat_id, "El historial es:"),
+            False,
+        ),
+    }
+
+
+def measure(iterations, fn, writes=False):
+    """
+    La mediana y el percentil 95 de lo que tarda `fn`, y cuántas queries hace.
+    Si escribe, cada corrida se deshace en un savepoint.
+    """
+    run = partial(run_rolled_back, fn) if writes else fn
+
+    run()
+    times = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started_at) * 1000)
+    times.sort()
+
+    # Las queries se cuentan sin las del savepoint.
+    with rolled_back():
+        queries = get_query_count(fn)
+
+    return {
+        "median_ms": round(times[len(times) // 2], 3),
+        "p95_ms": round(times[min(len(times) - 1, len(times) * 95 // 100)], 3),
+        "queries": queries,
+    }
+
+
+def run_rolled_back(fn):
+    with rolled_back():
+        fn()
+
+
+for scale in SCALES:
+    # Sembrar un millón de comidas tarda minutos, esa escala corre solo si se la nombra.
+    benchmark(f"views_{scale}", on_demand=scale == "1m")(
+        partial(views_benchmark, scale)
+    )
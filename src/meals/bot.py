@@ -0,0 +1,214 @@
+import logging
+import threading
+from concurrent import futures
+from contextlib import contextmanager
+from django.conf import settings
+from functools import partial
+from time import perf_counter_ns
+from meals.dispatcher import get_current_update
+from meals.instrumentation import count_telegram_call, metrics
+from telegram.error import BadRequest
+from telegram.ext import ExtBot
+from telegram.utils.helpers import DEFAULT_NONE
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Endpoints que cuentan para los límites de mensajes de Telegram.
+QUEUED_ENDPOINTS = {"sendMessage", "sendPhoto", "sendAudio", "editMessageText"}
+
+
+def get_bot_id():
+    """
+    El id de usuario del bot es la primera parte del token, antes de los :
+    """
+    return settings.TELEGRAM_TOKEN.split(":")[0]
+
+
+def wait_for_message(send, *args, **kwargs):
+    """
+    Envía con send(*args, **kwargs) y devuelve el Message. QueuedBot devuelve un Future, así que se
+    espera a que salga como mucho OUTBOUND_RESULT_TIMEOUT segundos; si no salió en ese tiempo se
+    cancela y ya no sale. Los errores del envío los recibe el que espera, no los error handlers.
+    """
+    with handle_send_errors(Exception):
+        sent = send(*args, **kwargs)
+
+    if not isinstance(sent, futures.Future):
+        return sent
+
+    try:
+        return sent.result(settings.OUTBOUND_RESULT_TIMEOUT)
+    except futures.TimeoutError:
+        sent.cancel()
+        raise
+
+
+def send_with_fallback(send, fallback):
+    """
+    Envía con send() sin esperar a que salga. Si Telegram lo rechaza con BadRequest envía con
+    fallback(), desde el thread del sender si el primer envío salió por ahí.
+    :return: Un Future con el Message del envío que salió, o el Message si el bot no usa sender.
+    """
+    handled_errors = _get_handled_errors()
+    try:
+        with handle_send_errors(BadRequest):
+            sent = send()
+    except BadRequest:
+        return fallback()
+
+    if not isinstance(sent, futures.Future):
+        return sent
+
+    result = futures.Future()
+
+    def on_done(sent):
+        if sent.cancelled() or not isinstance(sent.exception(), BadRequest):
+            _chain(sent, result)
+            return
+
+        try:
+            with handle_send_errors(*handled_errors):
+                retried = fallback()
+        except Exception as e:
+            result.set_exception(e)
+        else:
+            _chain(retried, result)
+
+    sent.add_done_callback(on_done)
+    return result
+
+
+def on_sent(sent, callback):
+    """
+    Llama a callback con el Message cuando el envío sale, sin esperarlo.
+    """
+    if not isinstance(sent, futures.Future):
+        callback(sent)
+        return
+
+    def on_done(sent):
+        if not sent.cancelled() and sent.exception() is None:
+            callback(sent.result())
+
+    sent.add_done_callback(on_done)
+
+
+@contextmanager
+def handle_send_errors(*errors):
+    """
+    Los envíos hechos adentro no pasan los errores de estos tipos a los error handlers del
+    Dispatcher, porque los maneja el que envía.
+    """
+    previous = _get_handled_errors()
+    _local.handled_errors = previous + errors
+    try:
+        yield
+    finally:
+        _local.handled_errors = previous
+
+
+def _get_handled_errors():
+    return getattr(_local, "handled_errors", ())
+
+
+def _chain(sent, result):
+    """
+    Pasa a result el Message o el error de sent cuando termina.
+    """
+    if not isinstance(sent, futures.Future):
+        result.set_result(sent)
+        return
+
+    def on_done(sent):
+        if sent.cancelled():
+            result.cancel()
+        elif sent.exception() is None:
+            result.set_result(sent.result())
+        else:
+            result.set_exception(sent.exception())
+
+    sent.add_done_callback(on_done)
+
+
+class QueuedBot(ExtBot):
+    """
+    Bot que manda los mensajes a través de un OutboundSender, así los handlers, las respuestas
+    y los jobs respetan los límites de Telegram sin tener que saber que existen.
+    Los envíos devuelven un Future con el Message en lugar de esperar su turno en el sender,
+    así un chat con muchos mensajes no ocupa los threads del Dispatcher. Lo que necesita el
+    Message lo espera con wait_for_message. Los envíos que fallan y nadie espera se pasan a los
+    error handlers de `dispatcher`, con el update que los hizo.
+    """
+
+    def __init__(self, *args, sender, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sender = sender
+        self.dispatcher = None
+
+    def _message(self, endpoint, data, *args, **kwargs):
+        if endpoint not in QUEUED_ENDPOINTS:
+            return super()._message(endpoint, data, *args, **kwargs)
+
+        chat_id = data.get("chat_id")
+        on_done = partial(
+            self._on_send_done,
+            endpoint,
+            chat_id,
+            get_current_update(),
+            _get_handled_errors(),
+        )
+        sent = self.sender.submit(
+            chat_id, super()._message, endpoint, data, *args, **kwargs
+        )
+        # Sin el sender andando ya se envió en este thread y se sabe si falló.
+        count_telegram_call(failed=sent.done() and sent.exception() is not None)
+        sent.add_done_callback(on_done)
+        return sent
+
+    def _on_send_done(self, endpoint, chat_id, update, handled_errors, sent):
+        if sent.cancelled() or sent.exception() is None:
+            return
+
+        error = sent.exception()
+        metrics.inc("telegram_send_errors", (("endpoint", endpoint),))
+        logger.warning(f"Falló un envío a Telegram ({endpoint}): {error!r}")
+
+        # Si falla el envío de un error al chat de desarrollo, informarlo ahí sería un loop.
+        if (
+            self.dispatcher is None
+            or isinstance(error, handled_errors)
+            or str(chat_id) == str(settings.DEVELOPER_CHAT_ID)
+        ):
+            return
+        self.dispatcher.dispatch_error(update, error)
+
+    def _post(self, endpoint, data=None, timeout=DEFAULT_NONE, api_kwargs=None):
+        if endpoint in QUEUED_ENDPOINTS:
+            # Lo llama _message desde el sender, el envío ya se contó al encolarlo.
+            return self._timed_post(
+                endpoint, data, timeout=timeout, api_kwargs=api_kwargs
+            )
+
+        try:
+            result = self._timed_post(
+                endpoint, data, timeout=timeout, api_kwargs=api_kwargs
+            )
+        except Exception:
+            count_telegram_call(failed=True)
+            raise
+        count_telegram_call()
+        return result
+
+    def _timed_post(self, endpoint, data, timeout=DEFAULT_NONE, api_kwargs=None):
+        # Se mide solo el pedido a Telegram, sin la espera en la cola del sender.
+        started_at = perf_counter_ns()
+        try:
+            return super()._post(endpoint, data, timeout=timeout, api_kwargs=api_kwargs)
+        finally:
+            metrics.observe(
+                "telegram_request_duration",
+                (perf_counter_ns() - started_at) // 1000,
+                (("endpoint", endpoint),),
+            )
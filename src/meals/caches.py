@@ -0,0 +1,51 @@
+import copy
+import threading
+
+
+class KeyedCache:
+    """
+    Cache en memoria del proceso, compartido entre los threads del Dispatcher.
+    Los valores se cargan con `loader` la primera vez que se piden y se entregan copiados,
+    así quien los modifica no pisa lo que ven los demás threads.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._values = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                return copy.copy(self._values[key])
+            self.misses += 1
+            generation = self._generation
+
+        value = self._loader(key)
+
+        with self._lock:
+            # Si hubo una invalidación mientras cargábamos, lo leído puede estar viejo.
+            if generation == self._generation:
+                self._values[key] = value
+
+        return copy.copy(value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._values.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._values.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._values)}
@@ -1,8 +1,12 @@
 import random
 import logging
 
+from functools import wraps
 from django.conf import settings
+from django.db import close_old_connections, connection
 
+from meals.leader import scheduler_leader
+from meals.media import media_registry, UNAUTHORIZED_PHOTO
 from meals.models import Meal, CocaSettings
 
 
@@ -14,26 +18,69 @@ def get_handler_name(name):
     return "_".join(parts[: len(parts) - 1])
 
 
+def close_db_connections(fn):
+    """
+    Los handlers y jobs corren en threads que viven todo el proceso, sin el ciclo de request
+    que usa Django para cerrar las conexiones viejas o rotas, así que se cierran acá. Las que
+    siguen sanas se reusan hasta DATABASE_CONN_MAX_AGE.
+    """
+
+    @wraps(fn)
+    def inner(*args, **kwargs):
+        _close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _close_old_connections()
+
+    return inner
+
+
+def leader_only(fn):
+    """
+    Los jobs se registran en todas las réplicas pero corren solo en la que tiene el lease del scheduler.
+    """
+
+    @wraps(fn)
+    def inner(*args, **kwargs):
+        if not scheduler_leader.is_leader():
+            logger.debug(f"Salteando {fn.__name__}, este proceso no es el líder.")
+            return None
+        return fn(*args, **kwargs)
+
+    return inner
+
+
+def _close_old_connections():
+    # Dentro de una transacción (los tests) cerrar la conexión la rompería.
+    if not connection.in_atomic_block:
+        close_old_connections()
+
+
 def chat_id_required(allow_admin_run=False, allow_user_run=True):
     """
-    Marca una función como que requiere que el chat origen sea CHAT_ID.
-    :param bool allow_admin_run: Especifica si el comando se puede correr desde DEVELOPER_CHAT_ID.
+    Marca una función como que requiere que el chat origen tenga un CocaSettings.
+    Deja en context.chat_id el chat sobre el que corre el comando.
+    :param bool allow_admin_run: Especifica si el comando se puede correr desde DEVELOPER_CHAT_ID,
+    en ese caso corre sobre CHAT_ID.
     """
 
     def decorator(fn):
         fnname = get_handler_name(fn.__name__)
 
         def inner(update, context):
-            if (allow_user_run and update.message.chat.id == settings.CHAT_ID) or (
-                allow_admin_run and update.message.chat.id == settings.DEVELOPER_CHAT_ID
-            ):
+            chat_id = get_tenant_chat_id(
+                update.effective_chat.id, allow_admin_run, allow_user_run
+            )
+            if chat_id is not None:
+                context.chat_id = chat_id
                 fn(update, context)
             else:
                 logger.warning(
-                    f"Recibido <{fnname}> desde un chat no configurado: {update.message.chat.id}."
+                    f"Recibido <{fnname}> desde un chat no configurado: {update.effective_chat.id}."
                 )
-                update.message.reply_photo(
-                    "https://pbs.twimg.com/media/E8ozthsWQAMproa.jpg"
+                media_registry.send_photo(
+                    UNAUTHORIZED_PHOTO, update.effective_message.reply_photo
                 )
 
         return inner
@@ -41,10 +88,24 @@ def chat_id_required(allow_admin_run=False, allow_user_run=True):
     return decorator
 
 
+def get_tenant_chat_id(chat_id, allow_admin_run, allow_user_run):
+    if allow_user_run and CocaSettings.instance(chat_id) is not None:
+        return chat_id
+
+    if allow_admin_run and chat_id == settings.DEVELOPER_CHAT_ID:
+        return settings.CHAT_ID
+
+    return None
+
+
 def random_run(fn):
-    def inner(*args, **kwargs):
-        if random.randint(1, 100) <= CocaSettings.instance().random_run_probability:
-            fn(*args, **kwargs)
+    def inner(update, context):
+        coca_settings = CocaSettings.instance(update.effective_chat.id)
+        if (
+            coca_settings is not None
+            and random.randint(1, 100) <= coca_settings.random_run_probability
+        ):
+            fn(update, context)
 
     return inner
 
@@ -55,7 +116,7 @@ def meal_id_required(action_name=None):
             try:
                 if _is_valid_as_id(context.args):
                     meal_id = context.args[0]
-                    fn(update, meal_id)
+                    fn(update, context, meal_id)
                 else:
                     logger.info(
                         f"Recibido {action_name} sin parametro o con parametro invalido."
@@ -0,0 +1,81 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from telegram import Update
+from telegram.ext import Dispatcher
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class ChatOrderedDispatcher(Dispatcher):
+    """
+    Dispatcher que procesa los updates en un pool de `update_workers` threads, de a uno por chat:
+    los de un chat se procesan en el orden en que llegaron y los de chats distintos a la vez.
+    Así un handler esperando a la base no frena a los otros chats, y un /agregar seguido de un
+    /proximas en el mismo chat no se pisan. Los handlers corren sin run_async.
+    """
+
+    def __init__(self, *args, update_workers, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.update_workers = update_workers
+        self._lock = threading.Lock()
+        # Los updates que esperan su turno, por chat. Un chat está acá mientras se procesa uno suyo.
+        self._pending = {}
+        self._executor = self._build_executor()
+
+    def _build_executor(self):
+        return ThreadPoolExecutor(
+            max_workers=self.update_workers, thread_name_prefix="dispatcher"
+        )
+
+    def process_update(self, update):
+        chat_id = get_chat_id(update)
+        with self._lock:
+            pending = self._pending.get(chat_id)
+            if pending is not None:
+                pending.append(update)
+                return
+            self._pending[chat_id] = deque()
+
+        self._executor.submit(self._process_chat, chat_id, update)
+
+    def _process_chat(self, chat_id, update):
+        while True:
+            _local.update = update
+            try:
+                super().process_update(update)
+            except Exception:
+                logger.exception(
+                    f"Falló el procesamiento de un update del chat {chat_id}."
+                )
+            finally:
+                _local.update = None
+
+            with self._lock:
+                pending = self._pending[chat_id]
+                if not pending:
+                    del self._pending[chat_id]
+                    return
+                update = pending.popleft()
+
+    def stop(self):
+        super().stop()
+        # Termina lo que ya estaba encolado, y deja un pool nuevo por si se vuelve a arrancar.
+        self._executor.shutdown()
+        self._executor = self._build_executor()
+
+
+def get_current_update():
+    """
+    El update que se está procesando en este thread, None si no es uno de ChatOrderedDispatcher.
+    """
+    return getattr(_local, "update", None)
+
+
+def get_chat_id(update):
+    if isinstance(update, Update) and update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
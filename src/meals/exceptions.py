@@ -3,11 +3,21 @@ class NoMealConfigured(Exception):
         self.message = "No hay una comida configurada"
 
 
+class UnknownParticipants(Exception):
+    def __init__(self, names, valid_names):
+        self.names = names
+        self.valid_names = valid_names
+
+
 class IncompleteMeal(Exception):
     def __init__(self, message):
         self.message = message
 
 
+class InvalidHistoryWindow(Exception):
+    pass
+
+
 class InvalidDay(Exception):
     pass
 
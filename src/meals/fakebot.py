@@ -0,0 +1,426 @@
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlsplit
+from urllib.request import Request, urlopen
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram.files.inputfile import InputFile
+
+logger = logging.getLogger(__name__)
+
+# Endpoints que devuelven el Message enviado.
+MESSAGE_ENDPOINTS = {"sendMessage", "sendPhoto", "sendAudio", "editMessageText"}
+
+
+class FakeCall:
+    def __init__(self, endpoint, data, status):
+        self.endpoint = endpoint
+        self.data = data
+        self.status = status
+
+
+class FakeBotApi:
+    """
+    Una Bot API de Telegram en memoria, para medir el bot sin salir a internet.
+    Contesta como Telegram: numera los mensajes de cada chat, entrega un file_id por cada archivo
+    subido y rechaza los file_id que no entregó. Cada pedido tarda `latency` segundos y una
+    fracción `retry_after_rate` contesta 429, como cuando se pasan los límites.
+    Guarda cada llamada en `calls` para revisarlas después.
+    Los updates que se agregan con put_update se entregan por getUpdates o, si hay un webhook
+    configurado, se envían a su url; cada envío queda en `calls` como una llamada a "webhook".
+    """
+
+    def __init__(self, token, latency=0, retry_after_rate=0, retry_after=1, seed=None):
+        self.token = token
+        self.bot_id = int(token.split(":")[0])
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_ids = {}
+        self._file_ids = {}
+        self._file_numbers = itertools.count(1)
+        self._updates = deque()
+        self._update_ids = itertools.count(1)
+        self._updates_condition = threading.Condition()
+        self._closed = False
+        self.webhook_url = None
+        self._webhook_executor = None
+        self.calls = []
+
+    def get_bot_user(self):
+        return {
+            "id": self.bot_id,
+            "is_bot": True,
+            "first_name": "Coca",
+            "username": "coca_bot",
+        }
+
+    def handle(self, endpoint, data):
+        """
+        Atiende un pedido a `endpoint` con los parámetros de `data`.
+        :return: El código HTTP y el json que contestaría Telegram.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        if endpoint == "getUpdates":
+            # Espera updates sin el lock, como el long polling de Telegram.
+            status, body = self._get_updates(data)
+            self._record(FakeCall(endpoint, data, status))
+            return status, body
+
+        with self._lock:
+            status, body = self._handle(endpoint, data)
+            self.calls.append(FakeCall(endpoint, data, status))
+        return status, body
+
+    def put_update(self, update):
+        """
+        Agrega un update para el bot, con un update_id nuevo.
+        """
+        with self._lock:
+            update = {**update, "update_id": next(self._update_ids)}
+            if self.webhook_url is not None:
+                self._webhook_executor.submit(self._deliver, self.webhook_url, update)
+                return update
+
+            with self._updates_condition:
+                self._updates.append(update)
+                self._updates_condition.notify_all()
+        return update
+
+    def close(self):
+        """
+        Libera los getUpdates que están esperando y termina los envíos al webhook.
+        """
+        with self._updates_condition:
+            self._closed = True
+            self._updates_condition.notify_all()
+        with self._lock:
+            executor, self._webhook_executor = self._webhook_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def get_calls(self, endpoint=None):
+        with self._lock:
+            return [call for call in self.calls if endpoint in (None, call.endpoint)]
+
+    def _handle(self, endpoint, data):
+        if (
+            endpoint in MESSAGE_ENDPOINTS
+            and self._random.random() < self.retry_after_rate
+        ):
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+
+        if endpoint == "getMe":
+            return _ok(self.get_bot_user())
+        if endpoint == "setWebhook":
+            self._set_webhook(data.get("url") or None, data.get("max_connections"))
+            return _ok(True)
+        if endpoint == "deleteWebhook":
+            self._set_webhook(None)
+            if str(data.get("drop_pending_updates")).lower() == "true":
+                with self._updates_condition:
+                    self._updates.clear()
+            return _ok(True)
+        if endpoint == "answerCallbackQuery":
+            return _ok(True)
+        if endpoint not in MESSAGE_ENDPOINTS:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+        message = self._get_message(data)
+        if endpoint == "sendMessage" or endpoint == "editMessageText":
+            message["text"] = data.get("text", "")
+        elif endpoint == "sendPhoto":
+            file_id = self._get_file_id("photo", data.get("photo"))
+            if file_id is None:
+                return _wrong_file_id()
+            message["photo"] = [
+                {
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "width": 320,
+                    "height": 240,
+                }
+            ]
+        else:
+            file_id = self._get_file_id("audio", data.get("audio"))
+            if file_id is None:
+                return _wrong_file_id()
+            message["audio"] = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "duration": 1,
+            }
+        return _ok(message)
+
+    def _get_updates(self, data):
+        if self.webhook_url is not None:
+            return 409, {
+                "ok": False,
+                "error_code": 409,
+                "description": "Conflict: can't use getUpdates method while webhook is active",
+            }
+
+        offset = int(data.get("offset") or 0)
+        limit = int(data.get("limit") or 100)
+        timeout = float(data.get("timeout") or 0)
+        with self._updates_condition:
+            # Como en Telegram, pedir desde un offset confirma los updates anteriores.
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            self._updates_condition.wait_for(
+                lambda: self._updates or self._closed, timeout
+            )
+            return _ok(list(itertools.islice(self._updates, limit)))
+
+    def _set_webhook(self, url, max_connections=None):
+        # Se llama con el lock tomado.
+        previous, self._webhook_executor = self._webhook_executor, None
+        if previous is not None:
+            previous.shutdown(wait=False)
+
+        self.webhook_url = url
+        if url is None:
+            return
+
+        self._webhook_executor = ThreadPoolExecutor(
+            max_workers=int(max_connections or 40), thread_name_prefix="fake_webhook"
+        )
+        # Lo que esperaba en getUpdates sale por el webhook, como en Telegram.
+        with self._updates_condition:
+            pending, self._updates = list(self._updates), deque()
+        for update in pending:
+            self._webhook_executor.submit(self._deliver, url, update)
+
+    def _deliver(self, url, update):
+        request = Request(
+            url,
+            data=json.dumps(update).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urlopen(request, timeout=10) as response:
+                status = response.status
+        except HTTPError as e:
+            status = e.code
+        except OSError:
+            logger.exception(f"No se pudo enviar el update al webhook {url}.")
+            status = 0
+        self._record(FakeCall("webhook", update, status))
+
+    def _get_message(self, data):
+        chat_id = int(data.get("chat_id", 0))
+        message_id = data.get("message_id")
+        if message_id is None:
+            message_id = self._message_ids.get(chat_id, 0) + 1
+            self._message_ids[chat_id] = message_id
+        return {
+            "message_id": int(message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group"},
+            "from": self.get_bot_user(),
+        }
+
+    def _get_file_id(self, kind, media):
+        """
+        Un file_id nuevo para un archivo subido o una url, el mismo si es uno que ya entregó.
+        :return: None si es un file_id que no entregó.
+        """
+        is_upload = isinstance(media, InputFile) or hasattr(media, "read")
+        if not is_upload and media in self._file_ids:
+            return media
+        if not is_upload and not str(media).startswith("http"):
+            return None
+
+        file_id = f"fake-{kind}-{next(self._file_numbers)}"
+        self._file_ids[file_id] = kind
+        return file_id
+
+
+def _ok(result):
+    return 200, {"ok": True, "result": result}
+
+
+def _wrong_file_id():
+    return 400, {
+        "ok": False,
+        "error_code": 400,
+        "description": "Bad Request: wrong file identifier/HTTP URL specified",
+    }
+
+
+class FakeRequest:
+    """
+    Reemplaza el Request de python-telegram-bot: en lugar de hacer el pedido HTTP se lo pasa
+    a una FakeBotApi, y levanta los mismos errores que el Request con las respuestas de error.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.con_pool_size = 1
+
+    def post(self, url, data, timeout=None):
+        status, body = self.api.handle(url.rsplit("/", 1)[-1], data)
+        if body["ok"]:
+            return body["result"]
+
+        retry_after = body.get("parameters", {}).get("retry_after")
+        if retry_after is not None:
+            raise RetryAfter(retry_after)
+        if status == 400:
+            raise BadRequest(body["description"])
+        raise TelegramError(body["description"])
+
+    def stop(self):
+        pass
+
+
+class FakeBotApiServer(ThreadingHTTPServer):
+    """
+    Atiende por HTTP a una FakeBotApi en las mismas urls que Telegram, así un Updater
+    apuntado a `base_url` hace polling, envía mensajes y sube archivos sin salir a internet.
+    Además tiene POST /updates para agregar updates y GET /calls con las llamadas recibidas.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, api, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeBotApiHandler)
+        self.api = api
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever,
+            kwargs={"poll_interval": 0.1},
+            name="fake_bot_api",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self.api.close()
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        data = dict(parse_qsl(url.query))
+        try:
+            data.update(self._read_body())
+        except ValueError:
+            return self._reply(
+                400, {"ok": False, "error_code": 400, "description": "Bad Request"}
+            )
+
+        if url.path == "/updates" and self.command == "POST":
+            updates = data.get("updates", [data])
+            for update in updates:
+                self.server.api.put_update(update)
+            return self._reply(*_ok(len(updates)))
+
+        if url.path == "/calls":
+            calls = [
+                {"endpoint": call.endpoint, "data": call.data, "status": call.status}
+                for call in self.server.api.get_calls(data.get("endpoint"))
+            ]
+            return self._reply(*_ok(calls))
+
+        token, _, endpoint = url.path[len("/bot") :].partition("/")
+        if not url.path.startswith("/bot") or token != self.server.api.token:
+            return self._reply(
+                401, {"ok": False, "error_code": 401, "description": "Unauthorized"}
+            )
+
+        self._reply(*self.server.api.handle(endpoint, data))
+
+    def _read_body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not body:
+            return {}
+
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            data = json.loads(body)
+            # POST /updates acepta una lista de updates.
+            return data if isinstance(data, dict) else {"updates": data}
+        if content_type.startswith("multipart/form-data"):
+            return parse_multipart(content_type, body)
+        return dict(parse_qsl(body.decode()))
+
+    def _reply(self, status, body):
+        content = json.dumps(body, default=_describe_value).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def parse_multipart(content_type, body):
+    """
+    Los campos de un multipart/form-data, como los manda python-telegram-bot al subir archivos.
+    Cada archivo queda como un BytesIO con su nombre.
+    """
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    data = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        content = part.get_payload(decode=True)
+        filename = part.get_filename()
+        if filename is None:
+            data[name] = content.decode()
+        else:
+            data[name] = BytesIO(content)
+            data[name].name = filename
+    return data
+
+
+def _describe_value(value):
+    # Los archivos subidos, en GET /calls.
+    if isinstance(value, BytesIO):
+        return f"<{getattr(value, 'name', 'archivo')}: {len(value.getvalue())} bytes>"
+    return repr(value)
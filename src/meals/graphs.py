@@ -1,28 +1,109 @@
-import matplotlib.pyplot as plt
-import random
+import hashlib
+import json
+import logging
+from functools import partial
 from io import BytesIO
-from os import remove
+from time import perf_counter_ns
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from meals.bot import get_bot_id, on_sent, send_with_fallback, wait_for_message
+from meals.instrumentation import metrics
+from meals.models import HistoryChart
+
+logger = logging.getLogger(__name__)
+
+CAPTION = "Hice un grafiquito"
+HISTORY_CHART_CACHE = (("cache", "history_chart"),)
 
 
 def send_history_chart(graph, image_callback):
-    image_name = get_image_name()
-    save_graph_image(graph, image_name)
-    with open(image_name, "rb") as image:
-        image_callback(image, caption="Hice un grafiquito")
+    """
+    Envía el gráfico del historial. Si ya se envió el mismo gráfico con este bot reutiliza el
+    file_id de Telegram sin esperar a que salga, si no sube el png guardado o lo renderiza.
+    """
+    chart = get_history_chart(graph)
+    bot_id = get_bot_id()
+
+    if chart.file_id and chart.bot_id == bot_id:
+        return send_with_fallback(
+            lambda: image_callback(chart.file_id, caption=CAPTION),
+            lambda: _upload_again(chart, bot_id, image_callback),
+        )
+
+    message = wait_for_message(image_callback, BytesIO(chart.image), caption=CAPTION)
+    _set_file_id(chart, bot_id, message)
+
+    return message
+
+
+def _upload_again(chart, bot_id, image_callback):
+    logger.info("Telegram rechazó el file_id del gráfico, se vuelve a subir.")
+    sent = image_callback(BytesIO(chart.image), caption=CAPTION)
+    on_sent(sent, partial(_set_file_id, chart, bot_id))
+    return sent
+
+
+def _set_file_id(chart, bot_id, message):
+    chart.file_id = message.photo[-1].file_id
+    chart.bot_id = bot_id
+    chart.save(update_fields=["file_id", "bot_id"])
+
+
+def get_history_chart(graph):
+    key = get_graph_key(graph)
+    chart = HistoryChart.objects.filter(key=key).first()
+
+    if chart is not None:
+        metrics.inc("cache_hits", HISTORY_CHART_CACHE)
+        HistoryChart.objects.filter(pk=chart.pk).update(used_at=timezone.now())
+        return chart
+
+    metrics.inc("cache_misses", HISTORY_CHART_CACHE)
+
+    chart = HistoryChart(
+        key=key, image=render_history_chart(graph).getvalue(), used_at=timezone.now()
+    )
+    try:
+        with transaction.atomic():
+            chart.save()
+    except IntegrityError:
+        # Otro thread guardó el mismo gráfico mientras lo renderizábamos.
+        return HistoryChart.objects.get(key=key)
+
+    _evict_history_charts()
+
+    return chart
+
 
-    remove(image_name)
+def get_graph_key(graph):
+    return hashlib.sha256(
+        json.dumps(graph, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
 
 
-def get_image_name():
-    return f"history_chart{random.randint(0, 10000)}.png"
+def _evict_history_charts():
+    stale = HistoryChart.objects.order_by("-used_at").values_list("pk", flat=True)[
+        settings.HISTORY_CHART_CACHE_SIZE :
+    ]
+    HistoryChart.objects.filter(pk__in=list(stale)).delete()
 
 
-def save_graph_image(graph, image_name):
+def render_history_chart(graph):
+    """
+    Dibuja el gráfico de torta del historial y devuelve el png en memoria.
+    Usa la figura de Agg directamente, sin pyplot, así no queda estado global por cada render.
+    """
+    started_at = perf_counter_ns()
     labels = graph["names"]
     sizes = [value / graph["total"] for value in graph["values"]]
     explode = (0,) * len(graph["names"])
 
-    fig1, ax1 = plt.subplots()
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax1 = figure.subplots()
     ax1.pie(
         sizes,
         explode=explode,
@@ -33,8 +114,11 @@ def save_graph_image(graph, image_name):
     )
     ax1.axis("equal")  # Equal aspect ratio ensures that pie is drawn as a circle.
 
-    f = BytesIO()
-    plt.savefig(f)
+    image = BytesIO()
+    image.name = "historial.png"
+    figure.savefig(image, format="png")
+    figure.clear()
+    image.seek(0)
 
-    with open(image_name, "wb") as ff:
-        ff.write(f.getbuffer())
+    metrics.observe("chart_render_duration", (perf_counter_ns() - started_at) // 1000)
+    return image
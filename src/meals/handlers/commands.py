@@ -1,14 +1,20 @@
-from telegram.ext import CommandHandler
+from telegram.ext import CallbackQueryHandler, CommandHandler
 from telegram.ext.filters import Filters
 
-from meals.handlers.commands_user import COMMANDS_ARGS as USER_COMMANDS_ARGS
+from meals.decorators import close_db_connections
+from meals.instrumentation import instrumented
+
+from meals.handlers.commands_user import (
+    COMMANDS_ARGS as USER_COMMANDS_ARGS,
+    CALLBACK_QUERIES_ARGS,
+)
 from meals.handlers.commands_admin import COMMANDS_ARGS as ADMIN_COMMANDS_ARGS
 
 
 def commandHandler(name, handler):
     return CommandHandler(
         name,
-        handler,
+        close_db_connections(instrumented(f"/{name}")(handler)),
         Filters.command & ~Filters.update.edited_message,
     )
 
@@ -16,3 +22,8 @@ def commandHandler(name, handler):
 COMMANDS_ARGS = USER_COMMANDS_ARGS + ADMIN_COMMANDS_ARGS
 
 COMMANDS = [commandHandler(*cargs) for cargs in COMMANDS_ARGS]
+
+CALLBACK_QUERIES = [
+    CallbackQueryHandler(close_db_connections(instrumented()(handler)), pattern=pattern)
+    for pattern, handler in CALLBACK_QUERIES_ARGS
+]
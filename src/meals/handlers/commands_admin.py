@@ -1,52 +1,115 @@
 import logging
+from django.conf import settings
+from django.db.models import F
 from meals.decorators import chat_id_required
+from meals.instrumentation import handler_metrics
+from meals.jobs import sync_scheduled_jobs
+from meals.models import ScheduledJob
 from telegram import Update
+from telegram.constants import MAX_MESSAGE_LENGTH
 from telegram.ext import CallbackContext
+from telegram.utils.helpers import escape_markdown
 
 logger = logging.getLogger(__name__)
 
 
-@chat_id_required(allow_admin_run=True, allow_user_run=False)
+@chat_id_required(allow_admin_run=True)
 def get_jobs_handler(update: Update, context: CallbackContext):
+    jobs = ScheduledJob.objects.order_by(F("next_run_at").asc(nulls_last=True), "name")
+    # Solo desde DEVELOPER_CHAT_ID se ven los jobs de todos los chats.
+    if update.effective_chat.id != settings.DEVELOPER_CHAT_ID:
+        jobs = jobs.filter(chat_id=context.chat_id)
 
-    jobs = []
-    for job in context.job_queue.jobs():
-        jobs.append(job.name.replace("_", "\\_"))
+    lines = []
+    for job in jobs:
+        line = f"\n\\- {escape_markdown(job.name, version=2)}: " + (
+            f"próxima vez el {format_job_time(job.next_run_at)}"
+            if job.next_run_at is not None
+            else "sin próxima vez"
+        )
+        if job.last_success_at is not None:
+            line += f", última vez el {format_job_time(job.last_success_at)}"
+        lines.append(line)
+    update.message.reply_text(
+        join_lines("Los jobs son:", lines, "\n\\.\\.\\. y {} más")
+    )
 
-    update.message.reply_text(f"Los jobs son: {', '.join(jobs)}\\.")
 
+def format_job_time(moment):
+    return escape_markdown(f"{moment:%d/%m/%Y %H:%M} UTC", version=2)
 
-@chat_id_required(allow_admin_run=True, allow_user_run=False)
-def cleanup_jobs_handler(update: Update, context: CallbackContext):
-    cleanup_jobs(update, context.job_queue.jobs())
 
+def join_lines(header, lines, more):
+    """
+    Junta las líneas después de header sin pasarse del largo de un mensaje de Telegram.
+    Las que no entran se cambian por `more`, formateado con cuántas quedaron afuera.
+    """
+    message = header
+    for index, line in enumerate(lines):
+        rest = more.format(len(lines) - index) if index < len(lines) - 1 else ""
+        if len(message) + len(line) + len(rest) > MAX_MESSAGE_LENGTH:
+            return message + more.format(len(lines) - index)
+        message += line
+    return message
 
-def cleanup_jobs(update: Update, jobs):
-    logger.info("Starting jobs cleanup")
 
-    current_jobs = set()
-    repeated_jobs = set()
+@chat_id_required(allow_admin_run=True, allow_user_run=False)
+def cleanup_jobs_handler(update: Update, context: CallbackContext):
+    logger.info("Starting jobs cleanup")
 
-    for job in jobs:
-        if job.name in current_jobs:
-            repeated_jobs.add(job.name)
-            job.schedule_removal()
-        current_jobs.add(job.name)
-    current_jobs = sorted(current_jobs)
+    created, deleted = sync_scheduled_jobs()
+    current_jobs = ScheduledJob.objects.order_by("name").values_list("name", flat=True)
     message = f"- Los jobs son: {', '.join(current_jobs)}.\n\n" + (
-        f"- Jobs repetidos: {', '.join(repeated_jobs)}"
-        if repeated_jobs
-        else "No hay jobs repetidos."
+        f"- Jobs borrados: {', '.join(deleted)}"
+        if deleted
+        else "No hay jobs de chats sin configuración."
     )
+    if created:
+        message += f"\n- Jobs creados: {', '.join(created)}"
     update.message.reply_text(message, parse_mode=None)
-    if repeated_jobs:
-        update.message.reply_text(
-            "Los jobs repetidos se marcaron para borrar.",
-            parse_mode=None,
-        )
+
+
+@chat_id_required(allow_admin_run=True, allow_user_run=False)
+def get_stats_handler(update: Update, context: CallbackContext):
+    records = handler_metrics.snapshot()
+    if not records:
+        update.message.reply_text("Todavía no hay estadísticas\\.")
+        return
+
+    # Los más lentos primero, así si no entran todos quedan afuera los más rápidos.
+    by_p99 = sorted(
+        records.items(), key=lambda item: (-item[1].latency.percentile(99), item[0])
+    )
+    lines = [
+        f"\n- {name}: {record.latency.count} veces, {record.errors} con error, "
+        f"{record.telegram_calls} llamadas a Telegram ({record.telegram_errors} con error)"
+        f"\n  {format_percentiles(record.latency, format_ms)} ms, "
+        f"{format_percentiles(record.queries, str)} queries, "
+        f"{format_percentiles(record.query_time, format_ms)} ms en la base"
+        for name, record in by_p99
+    ]
+    update.message.reply_text(
+        join_lines(
+            "Estadísticas desde que arrancó el bot, p50/p95/p99, los más lentos primero:",
+            lines,
+            "\n... y {} más",
+        ),
+        parse_mode=None,
+    )
+
+
+def format_percentiles(histogram, formatter):
+    return "/".join(
+        formatter(histogram.percentile(percent)) for percent in (50, 95, 99)
+    )
+
+
+def format_ms(microseconds):
+    return f"{microseconds / 1000:.1f}"
 
 
 COMMANDS_ARGS = [
     ("jobs", get_jobs_handler),
     ("cleanup", cleanup_jobs_handler),
+    ("stats", get_stats_handler),
 ]
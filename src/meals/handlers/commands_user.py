@@ -1,14 +1,30 @@
 import logging
-from datetime import timedelta, datetime
-from django.conf import settings
+from datetime import timedelta
+from django.utils import timezone
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.utils.helpers import escape_markdown
 from meals.decorators import chat_id_required, meal_id_required
-from meals.exceptions import IncompleteMeal, InvalidDay, NoDayReceived
+from meals.exceptions import (
+    IncompleteMeal,
+    InvalidDay,
+    InvalidHistoryWindow,
+    NoDayReceived,
+    UnknownParticipants,
+)
 from meals.graphs import send_history_chart
-from meals.handlers.utils import get_next_meal_date, get_day_from_name
-from meals.jobs import register_send_reminder_daily
-from meals.models import Participant, CocaSettings
-from meals.formatters import format_name, format_meal_with_date
-from meals.parsers import parse_add_meal_args, parse_weekday_name
+from meals.handlers.utils import (
+    get_day_from_name,
+    get_history_window_start,
+    get_next_meal_date,
+)
+from meals.models import CocaSettings
+from meals.formatters import format_month, format_name, format_meal_with_date
+from meals.parsers import (
+    parse_add_meal_args,
+    parse_history_window,
+    parse_next_meals_page,
+    parse_weekday_name,
+)
 from meals.views import (
     add_meal,
     history,
@@ -18,6 +34,7 @@ from meals.views import (
     copy_meal,
     resolve_meal,
     get_previous_meals,
+    get_meal_items,
 )
 
 
@@ -36,31 +53,65 @@ def add_meal_handler(update, context):
     else:
         logger.info("Agregando recordatorio de comida.")
         try:
-            meal_obj = add_meal(meals_to_create)
+            meal_obj = add_meal(context.chat_id, meals_to_create)
 
             send_meal_created_message(meal_obj, update)
-        except Participant.DoesNotExist:
-            valid_names = Participant.objects.all().values_list("name", flat=True)
+        except UnknownParticipants as e:
+            logger.info("Recibido agregar con participantes inexistentes.")
+            unknown_names = ", ".join(
+                escape_markdown(name, version=2) for name in e.names
+            )
             valid_names_joined = ""
-            for valid_name in valid_names:
+            for valid_name in e.valid_names:
                 valid_names_joined += f"\n\\- {valid_name}"
             update.message.reply_text(
-                f"Hay usuarios inválidos, los válidos son:{valid_names_joined}"
+                f"Hay usuarios inválidos: {unknown_names}\\. Los válidos son:{valid_names_joined}"
             )
 
 
 @chat_id_required(allow_admin_run=True)
 def history_handler(update, context):
+    try:
+        window = parse_history_window(context.args)
+    except InvalidHistoryWindow:
+        logger.info("Recibido historial con un período inválido.")
+        update.message.reply_text(
+            "Podes ver el historial completo, del `mes`, del `año` o de las últimas `N semanas`\\."
+        )
+        return
+
+    since = None
+    header = "El historial es:"
+    if window is not None:
+        since = get_history_window_start(*window, timezone.now().date())
+        header = get_history_window_header(*window, since)
+
     logger.info("Enviando historial de comidas.")
-    body, graph = get_history("El historial es:")
+    body, graph = get_history(context.chat_id, header, since=since)
+
+    if since is not None and not body:
+        update.message.reply_text("No hay comidas en ese período\\.")
+        return
 
     update.message.reply_text(body)
 
     send_history_chart(graph, update.message.reply_photo)
 
 
-def get_history(header):
-    participants = history()
+def get_history_window_header(window, weeks, since):
+    if window == "mes":
+        return "El historial del mes es:"
+    if window == "año":
+        return "El historial del año es:"
+    return f"El historial de las últimas {weeks} semanas, desde el 1 de {format_month(since.month - 1)}, es:"
+
+
+def get_history(chat_id, header, since=None, month=None):
+    """
+    Arma el mensaje y los datos del gráfico del historial.
+    :param date month: Si se pasa, cada participante muestra también sus comidas de ese mes.
+    """
+    participants = history(chat_id, since=since, month=month)
     graph_data = {"names": [], "values": [], "total": 0}
     body = ""
     if len(participants) > 0:
@@ -70,14 +121,19 @@ def get_history(header):
             graph_data["values"].append(participant.total_meals)
             graph_data["total"] += participant.total_meals
 
-            body += f"\n\\- {format_name(participant.name)} compró para `{participant.total_meals}` comida{'s' if participant.total_meals > 1 else ''}\\."
+            body += f"\n\\- {format_name(participant.name)} compró para `{participant.total_meals}` comida{'s' if participant.total_meals > 1 else ''}"
+            if month is not None:
+                body += (
+                    f", `{participant.month_meals}` en {format_month(month.month - 1)}"
+                )
+            body += "\\."
 
     return body, graph_data
 
 
 @chat_id_required()
 def skip_handler(update, context):
-    add_skip()
+    add_skip(context.chat_id)
     logger.info("Agregando skip.")
 
     update.message.reply_text("Perfecto, me salteo una comida\\.")
@@ -85,29 +141,82 @@ def skip_handler(update, context):
 
 @chat_id_required(allow_admin_run=True)
 def next_meals_handler(update, context):
-    meals = get_next_meals()
+    meals, has_previous, has_next = get_next_meals(context.chat_id)
 
     if meals:
-        reminder_day = CocaSettings.instance().reminder_day
-        next_date = get_next_meal_date(reminder_day)
         logger.info("Enviando proximas comidas.")
-        message = "*Las próximas comidas son:*"
-        for meal in meals:
-            message += format_meal_with_date(next_date, meal)
-
-            for meal_item in meal.mealitem_set.all():
-                message += f"\n\t\\- {meal_item}"
-
-            next_date += timedelta(weeks=1)
-        update.message.reply_text(message)
+        message, keyboard = get_next_meals_page(
+            context.chat_id, meals, 0, has_previous, has_next
+        )
+        update.message.reply_text(message, reply_markup=keyboard)
     else:
         logger.info("Enviando ausencia de próximas comidas.")
         update.message.reply_text("No hay próximas comidas\\.")
 
 
+@chat_id_required(allow_admin_run=True)
+def next_meals_page_handler(update, context):
+    query = update.callback_query
+    direction, meal_id, position = parse_next_meals_page(query.data)
+    if direction == "after":
+        meals, has_previous, has_next = get_next_meals(
+            context.chat_id, after_id=meal_id
+        )
+    else:
+        meals, has_previous, has_next = get_next_meals(
+            context.chat_id, before_id=meal_id
+        )
+        position = max(position - len(meals), 0)
+
+    query.answer()
+    if meals:
+        logger.info("Enviando página de proximas comidas.")
+        message, keyboard = get_next_meals_page(
+            context.chat_id, meals, position, has_previous, has_next
+        )
+        query.edit_message_text(message, reply_markup=keyboard)
+    else:
+        query.edit_message_text("No hay próximas comidas\\.")
+
+
+def get_next_meals_page(chat_id, meals, position, has_previous, has_next):
+    """
+    Arma el mensaje de una página de /proximas y sus botones.
+    :param int position: Posición en la cola de la primera comida de la página.
+    """
+    reminder_day = CocaSettings.instance(chat_id).reminder_day
+    next_date = get_next_meal_date(reminder_day) + timedelta(weeks=position)
+    message = "*Las próximas comidas son:*"
+    for meal in meals:
+        message += format_meal_with_date(next_date, meal)
+
+        for meal_item in meal.mealitem_set.all():
+            message += f"\n\t\\- {meal_item}"
+
+        next_date += timedelta(weeks=1)
+
+    buttons = []
+    if has_previous:
+        buttons.append(
+            InlineKeyboardButton(
+                "« Anteriores",
+                callback_data=f"proximas:before:{meals[0].id}:{position}",
+            )
+        )
+    if has_next:
+        buttons.append(
+            InlineKeyboardButton(
+                "Siguientes »",
+                callback_data=f"proximas:after:{meals[-1].id}:{position + len(meals)}",
+            )
+        )
+
+    return message, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
 @chat_id_required(allow_admin_run=True)
 def previous_meals_handler(update, context):
-    meals = get_previous_meals(5)
+    meals = get_previous_meals(context.chat_id, 5)
 
     if meals:
         logger.info("Enviando últimas 5 comidas.")
@@ -128,8 +237,8 @@ def previous_meals_handler(update, context):
 @meal_id_required(
     action_name="borrar",
 )
-def delete_meal_handler(update, meal_id):
-    delete_meal(meal_id)
+def delete_meal_handler(update, context, meal_id):
+    delete_meal(context.chat_id, meal_id)
     logger.info("Borrando comida.")
     update.message.reply_text(
         f"Borré la comida {meal_id}\\.",
@@ -140,8 +249,8 @@ def delete_meal_handler(update, meal_id):
 @meal_id_required(
     action_name="resolver",
 )
-def resolve_meal_handler(update, meal_id):
-    meal = resolve_meal(meal_id)
+def resolve_meal_handler(update, context, meal_id):
+    meal = resolve_meal(context.chat_id, meal_id)
     logger.info("Resolviendo comida.")
     update.message.reply_text(
         f"Resolví la comida {meal.id}\\.",
@@ -152,15 +261,15 @@ def resolve_meal_handler(update, meal_id):
 @meal_id_required(
     action_name="copiar",
 )
-def copy_meal_handler(update, meal_id):
-    meal = copy_meal(meal_id)
+def copy_meal_handler(update, context, meal_id):
+    meal = copy_meal(context.chat_id, meal_id)
     logger.info("Copiando comida.")
     send_meal_created_message(meal, update)
 
 
 def send_meal_created_message(meal_obj, update):
     message = "Ahí agregué la comida:"
-    for meal_item in meal_obj.mealitem_set.all():
+    for meal_item in get_meal_items(meal_obj):
         message += f"\n\\- {meal_item}"
 
     update.message.reply_text(
@@ -170,7 +279,7 @@ def send_meal_created_message(meal_obj, update):
 
 @chat_id_required()
 def change_reminder_handler(update, context):
-    setting = CocaSettings.instance()
+    setting = CocaSettings.instance(context.chat_id)
     try:
         day_name = parse_weekday_name(context.args)
         new_day = get_day_from_name(day_name)
@@ -179,16 +288,6 @@ def change_reminder_handler(update, context):
 
             setting.save()
 
-            job_queue = context.job_queue
-
-            job_queue.get_jobs_by_name("send_reminder")[0].schedule_removal()
-            register_send_reminder_daily(
-                job_queue,
-                setting.reminder_day,
-                setting.reminder_hour_utc,
-                0 if not settings.DEBUG else datetime.now().minute + 1,
-            )
-
             update.message.reply_text(
                 f"Se actualizó el día del recordatorio al día {day_name}\\."
             )
@@ -218,3 +317,7 @@ COMMANDS_ARGS = [
     ("ultimas", previous_meals_handler),
     ("recordatorio", change_reminder_handler),
 ]
+
+CALLBACK_QUERIES_ARGS = [
+    (r"^proximas:", next_meals_page_handler),
+]
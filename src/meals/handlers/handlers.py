@@ -3,9 +3,12 @@ import json
 import traceback
 import logging
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from meals import outbox
+from meals.bot import get_bot_id
 from meals.decorators import random_run
 from meals.exceptions import NoMealConfigured
-from meals.graphs import send_history_chart
 from meals.handlers.commands_user import get_history
 from meals.formatters import format_meal, format_name
 from meals.views import get_next_meal, get_skip, get_todays_birthdays
@@ -16,54 +19,76 @@ logger = logging.getLogger(__name__)
 
 
 def send_reminder(context):
-    send_reminder_from_bot(context.bot)
+    enqueue_reminder(context.job.context)
 
 
-def send_reminder_from_bot(bot):
-    if not get_skip():
+def enqueue_reminder(chat_id):
+    """
+    Consume un skip o reclama la próxima comida y encola su recordatorio, todo en la misma
+    transacción: la comida queda hecha solo si el recordatorio queda para enviarse, y un skip
+    consumido a la vez por otro proceso no deja pasar el recordatorio.
+    """
+    with transaction.atomic():
+        if get_skip(chat_id):
+            logger.info("Salteando recordatorio debido a un skip.")
+            return
+
         try:
-            meal, remaining = get_next_meal()
-            logger.info("Enviando recordatorio de comida.")
-            message = "Hola\\!"
-            for meal_item in meal.mealitem_set.all():
-                message += f"\n\\- {format_name(meal_item.owner.name)} te toca comprar los ingredientes para hacer {format_meal(meal_item.description)}\\."
-            bot.send_message(
-                settings.CHAT_ID,
+            meal, remaining = get_next_meal(chat_id)
+        except NoMealConfigured:
+            logger.info("Comida sin configurar.")
+            outbox.enqueue(
+                outbox.message(
+                    chat_id,
+                    "Hola, no hay una comida configurada para mañana, si quieren cenar rico ponganse las pilas\\.",
+                    f"no_meal:{chat_id}:{timezone.now().date()}",
+                )
+            )
+            return
+
+        logger.info("Encolando recordatorio de comida.")
+        message = "Hola\\!"
+        for meal_item in meal.mealitem_set.all():
+            message += f"\n\\- {format_name(meal_item.owner.name)} te toca comprar los ingredientes para hacer {format_meal(meal_item.description)}\\."
+        messages = [
+            outbox.message(
+                chat_id,
                 message,
+                f"reminder:{meal.id}:{meal.done_at.date()}",
                 parse_mode=ParseMode.MARKDOWN_V2,
             )
-            logger.info(f"remaining {remaining}")
-            if remaining == 0:
-                bot.send_message(
-                    settings.CHAT_ID,
+        ]
+        logger.info(f"remaining {remaining}")
+        if remaining == 0:
+            messages.append(
+                outbox.message(
+                    chat_id,
                     "Además les informo que no hay más comidas configuradas, ponganse a pensar\\.",
+                    f"no_more_meals:{meal.id}:{meal.done_at.date()}",
                     parse_mode=ParseMode.MARKDOWN_V2,
                 )
-        except NoMealConfigured:
-            logger.info("Comida sin configurar.")
-            bot.send_message(
-                settings.CHAT_ID,
-                "Hola, no hay una comida configurada para mañana, si quieren cenar rico ponganse las pilas\\.",
             )
-        except Exception as e:
-            meal.done = False
-            meal.done_at = None
-            meal.save()
-            raise e
-    else:
-        logger.info("Salteando recordatorio debido a un skip.")
+        outbox.enqueue(*messages)
 
 
 def send_history_resume(context):
-    body, graph = get_history("Hola, les dejo el resumen del histórico de compras:")
+    enqueue_history_resume(context.job.context)
 
-    context.bot.send_message(settings.CHAT_ID, body)
 
-    send_history_chart(
-        graph,
-        lambda image, **kwargs: context.bot.send_photo(
-            settings.CHAT_ID, image, **kwargs
-        ),
+def enqueue_history_resume(chat_id):
+    month = timezone.now().date().replace(day=1)
+    body, graph = get_history(
+        chat_id,
+        "Hola, les dejo el resumen del histórico de compras:",
+        month=month,
+    )
+    if not body:
+        logger.info("No hay historial para el resumen.")
+        return
+
+    outbox.enqueue(
+        outbox.message(chat_id, body, f"history_resume:{chat_id}:{month}"),
+        outbox.history_chart(chat_id, graph, f"history_resume_chart:{chat_id}:{month}"),
     )
 
 
@@ -92,17 +117,24 @@ def error_handler(update, context):
 
 @random_run
 def reply_to_coca_handler(update: Update, context: CallbackContext):
-    if update.message.reply_to_message.from_user.id == int(
-        settings.TELEGRAM_TOKEN.split(":")[0]
-    ):
+    if update.message.reply_to_message.from_user.id == int(get_bot_id()):
         update.message.reply_text("Soy una entidad virtual, no me contestes\\.")
 
 
 def send_birthdays_handler(context: CallbackContext):
-    today_birthdays = get_todays_birthdays()
+    enqueue_birthdays(context.job.context)
+
 
-    for birthday in today_birthdays:
-        context.bot.send_message(
-            settings.CHAT_ID,
-            f"Feliz cumple {birthday.name}\\!\\! La próxima tenes que llevar flan\\.",
-        )
+def enqueue_birthdays(chat_id):
+    today = timezone.now().date()
+
+    outbox.enqueue(
+        *[
+            outbox.message(
+                chat_id,
+                f"Feliz cumple {birthday.name}\\!\\! La próxima tenes que llevar flan\\.",
+                f"birthday:{birthday.id}:{today}",
+            )
+            for birthday in get_todays_birthdays(chat_id)
+        ]
+    )
@@ -1,15 +1,16 @@
 import re
 import logging
-from os import path
-from pathlib import Path
-from django.conf import settings
 from telegram.ext import MessageHandler
-from telegram.ext.filters import Filters
+from telegram.ext.filters import Filters, MessageFilter
 
-from meals.decorators import chat_id_required, random_run
+from meals.decorators import chat_id_required, close_db_connections, random_run
+from meals.instrumentation import handler_metrics, metrics
+from meals.media import media_registry
 
 logger = logging.getLogger(__name__)
 
+WORD_BOUNDARY = r"\b"
+
 
 @random_run
 @chat_id_required()
@@ -37,17 +38,67 @@ def intentar_handler(update, context):
 
 def _send_audio(update, audio_name, title):
     logger.info(f"Enviando audio {audio_name}")
-    with open(
-        path.join(Path(settings.BASE_DIR).parent, "media", audio_name), "rb"
-    ) as audio:
-        update.message.reply_audio(audio=audio, title=title)
-
-
-def regexMessageHandler(regex, handler):
-    return MessageHandler(
-        Filters.regex(re.compile(regex, re.IGNORECASE)) & ~Filters.command,
-        handler,
-    )
+    media_registry.send_audio(audio_name, update.message.reply_audio, title=title)
+
+
+class ReactionFilter(MessageFilter):
+    """
+    Une las regex de todas las reacciones en una sola alternativa con grupos nombrados,
+    así cada mensaje se recorre una vez sin importar cuántas reacciones haya.
+    Si matchea más de una reacción gana la primera de la lista, igual que con un handler por regex:
+    como la alternativa no encuentra matches superpuestos, las reacciones anteriores a la que
+    matcheó se prueban de a una.
+    """
+
+    __slots__ = ("pattern", "patterns", "handlers")
+    data_filter = True
+
+    def __init__(self, reactions_args):
+        self.handlers = [handler for _, handler in reactions_args]
+        regexes = [regex for regex, _ in reactions_args]
+
+        # Con el \b afuera de la alternativa, re solo prueba las reacciones donde empieza una palabra.
+        prefix = ""
+        if all(regex.startswith(WORD_BOUNDARY) for regex in regexes):
+            prefix = WORD_BOUNDARY
+            regexes = [regex[len(WORD_BOUNDARY) :] for regex in regexes]
+
+        alternatives = [
+            f"(?P<reaction{index}>{regex})" for index, regex in enumerate(regexes)
+        ]
+        self.pattern = re.compile(
+            f"{prefix}(?:{'|'.join(alternatives)})", re.IGNORECASE
+        )
+        self.patterns = [
+            re.compile(f"{prefix}{alternative}", re.IGNORECASE)
+            for alternative in alternatives
+        ]
+        self.name = "ReactionFilter"
+
+    def filter(self, message):
+        if message.text:
+            metrics.inc("reaction_checks")
+            match = self.match(message.text)
+            if match:
+                return {"matches": [match]}
+        return {}
+
+    def match(self, text):
+        match = self.pattern.search(text)
+        if match is None:
+            return None
+        for pattern in self.patterns[: get_reaction_index(match)]:
+            earlier_match = pattern.search(text)
+            if earlier_match:
+                return earlier_match
+        return match
+
+    def get_handler(self, match):
+        return self.handlers[get_reaction_index(match)]
+
+
+def get_reaction_index(match):
+    return int(match.lastgroup[len("reaction") :])
 
 
 REACTIONS_ARGS = [
@@ -57,4 +108,18 @@ REACTIONS_ARGS = [
     (r"\bintentar", intentar_handler),
 ]
 
-REACTIONS = [regexMessageHandler(*rargs) for rargs in REACTIONS_ARGS]
+REACTION_FILTER = ReactionFilter(REACTIONS_ARGS)
+
+
+def reaction_handler(update, context):
+    handler = REACTION_FILTER.get_handler(context.match)
+    metrics.inc("reaction_hits", (("reaction", handler.__name__),))
+    with handler_metrics.measure(handler.__name__):
+        handler(update, context)
+
+
+REACTIONS = [
+    MessageHandler(
+        REACTION_FILTER & ~Filters.command, close_db_connections(reaction_handler)
+    ),
+]
@@ -24,5 +24,17 @@ def get_next_meal_date(reminder_day):
     return now + timedelta(days=days_offset)
 
 
+def get_history_window_start(window, weeks, today):
+    """
+    El primer día del mes desde el que se cuenta el historial. Los contadores son por mes,
+    así que las semanas se redondean al principio del mes en el que caen.
+    """
+    if window == "mes":
+        return today.replace(day=1)
+    if window == "año":
+        return today.replace(month=1, day=1)
+    return (today - timedelta(weeks=weeks)).replace(day=1)
+
+
 def get_day_from_name(day_name):
     return DAYS[day_name]
@@ -0,0 +1,330 @@
+import math
+import threading
+from functools import wraps
+from time import perf_counter_ns
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Los valores menores a 2 ** SUB_BUCKET_BITS tienen un bucket cada uno, y de ahí en adelante cada
+# potencia de 2 se divide en 2 ** (SUB_BUCKET_BITS - 1) buckets: un percentil se aleja del valor
+# real menos de 1 / 2 ** (SUB_BUCKET_BITS - 1), un 3,125% con 6 bits.
+SUB_BUCKET_BITS = 6
+SUB_BUCKET_HALF = 2 ** (SUB_BUCKET_BITS - 1)
+
+
+def get_bucket_index(value):
+    if value < 2 * SUB_BUCKET_HALF:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return shift * SUB_BUCKET_HALF + (value >> shift)
+
+
+def get_bucket_value(index):
+    """
+    El valor más alto que cae en el bucket `index`.
+    """
+    if index < 2 * SUB_BUCKET_HALF:
+        return index
+    shift = index // SUB_BUCKET_HALF - 1
+    return ((index - shift * SUB_BUCKET_HALF + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    Cuenta valores enteros no negativos en buckets logarítmicos. La lista de buckets crece
+    hasta el valor más alto registrado, así un histograma de pocas queries ocupa poco.
+    """
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        index = get_bucket_index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        self.counts[: len(other.counts)] = [
+            count + other_count for count, other_count in zip(self.counts, other.counts)
+        ]
+        self.count += other.count
+        self.total += other.total
+
+    def cumulative_counts(self, boundaries):
+        """
+        Cuántos valores hay hasta cada uno de `boundaries`, ordenados de menor a mayor.
+        Un bucket que cruza un límite cuenta entero en el siguiente.
+        """
+        cumulative = []
+        seen = 0
+        start = 0
+        for boundary in boundaries:
+            end = get_bucket_index(boundary)
+            if get_bucket_value(end) <= boundary:
+                end += 1
+            seen += sum(self.counts[start:end])
+            start = max(start, end)
+            cumulative.append(seen)
+        return cumulative
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return get_bucket_value(index)
+        return get_bucket_value(len(self.counts) - 1)
+
+
+class HandlerRecord:
+    """
+    Lo que se midió de un handler o job: el tiempo total y el tiempo en la base en microsegundos,
+    cuántas queries hizo cada vez y cuántas llamadas a Telegram.
+    """
+
+    __slots__ = (
+        "latency",
+        "queries",
+        "query_time",
+        "errors",
+        "telegram_calls",
+        "telegram_errors",
+    )
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.queries = Histogram()
+        self.query_time = Histogram()
+        self.errors = 0
+        self.telegram_calls = 0
+        self.telegram_errors = 0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.queries.merge(other.queries)
+        self.query_time.merge(other.query_time)
+        self.errors += other.errors
+        self.telegram_calls += other.telegram_calls
+        self.telegram_errors += other.telegram_errors
+
+
+class Measurement:
+    """
+    Mide una corrida de un handler: el tiempo, las queries que cuenta record_query en la conexión
+    del thread y las llamadas a Telegram que cuenta QueuedBot mientras dura.
+    """
+
+    __slots__ = (
+        "metrics",
+        "name",
+        "queries",
+        "query_time",
+        "telegram_calls",
+        "telegram_errors",
+        "_previous",
+        "_started_at",
+    )
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.queries = 0
+        self.query_time = 0
+        self.telegram_calls = 0
+        self.telegram_errors = 0
+
+    def __enter__(self):
+        self._previous = getattr(_current, "measurement", None)
+        _current.measurement = self
+        self._started_at = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = perf_counter_ns() - self._started_at
+        _current.measurement = self._previous
+        if self._previous is not None:
+            # Como el tiempo, lo de una medición anidada cuenta también en la de afuera.
+            self._previous.queries += self.queries
+            self._previous.query_time += self.query_time
+            self._previous.telegram_calls += self.telegram_calls
+            self._previous.telegram_errors += self.telegram_errors
+        self.metrics.record(self, elapsed // 1000, failed=exc_type is not None)
+        return False
+
+
+_current = threading.local()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper que mide cada query en metrics, y la cuenta en la medición en curso
+    del thread si hay una.
+    """
+    started_at = perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter_ns() - started_at
+        metrics.observe("db_query_duration", elapsed // 1000)
+        measurement = getattr(_current, "measurement", None)
+        if measurement is not None:
+            measurement.queries += 1
+            measurement.query_time += elapsed
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Cada thread tiene su conexión, y la misma se puede reconectar varias veces.
+    # Es lo mismo que connection.execute_wrapper, pero para toda la vida de la conexión:
+    # entrar y salir del context manager en cada update costaría más que medir.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def count_telegram_call(failed=False):
+    measurement = getattr(_current, "measurement", None)
+    if measurement is not None:
+        measurement.telegram_calls += 1
+        measurement.telegram_errors += failed
+
+
+class ThreadShards:
+    """
+    Un dict por thread, para que cada thread del Dispatcher escriba en el suyo sin tomar ningún
+    lock. El lock solo se usa la primera vez que escribe un thread y al leer la lista.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def get(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def items(self):
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # list() copia el dict sin soltar el GIL, aunque el thread dueño agregue una clave.
+            yield from list(shard.items())
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class HandlerMetrics:
+    """
+    Las mediciones de los handlers y jobs del proceso, en un ThreadShards.
+    """
+
+    def __init__(self):
+        self._shards = ThreadShards()
+
+    def measure(self, name):
+        return Measurement(self, name)
+
+    def record(self, measurement, elapsed_us, failed=False):
+        shard = self._shards.get()
+        record = shard.get(measurement.name)
+        if record is None:
+            record = shard[measurement.name] = HandlerRecord()
+        record.latency.record(elapsed_us)
+        record.queries.record(measurement.queries)
+        record.query_time.record(measurement.query_time // 1000)
+        record.errors += failed
+        record.telegram_calls += measurement.telegram_calls
+        record.telegram_errors += measurement.telegram_errors
+
+    def snapshot(self):
+        """
+        :return: Un HandlerRecord por nombre, con lo de todos los threads sumado.
+        """
+        totals = {}
+        for name, record in self._shards.items():
+            totals.setdefault(name, HandlerRecord()).merge(record)
+        return totals
+
+    def clear(self):
+        self._shards.clear()
+
+
+class Metrics:
+    """
+    Contadores e histogramas del proceso por nombre y labels, los que exporta meals.metrics.
+    Los labels son una tupla de pares (nombre, valor). Los histogramas son de microsegundos.
+    """
+
+    def __init__(self):
+        self._counters = ThreadShards()
+        self._histograms = ThreadShards()
+
+    def inc(self, name, labels=(), amount=1):
+        shard = self._counters.get()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        shard = self._histograms.get()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            histogram = shard[key] = Histogram()
+        histogram.record(value)
+
+    def snapshot(self):
+        """
+        :return: Los contadores y los histogramas por (nombre, labels), sumando todos los threads.
+        """
+        counters = {}
+        for key, value in self._counters.items():
+            counters[key] = counters.get(key, 0) + value
+        histograms = {}
+        for key, histogram in self._histograms.items():
+            histograms.setdefault(key, Histogram()).merge(histogram)
+        return counters, histograms
+
+    def clear(self):
+        self._counters.clear()
+        self._histograms.clear()
+
+
+handler_metrics = HandlerMetrics()
+metrics = Metrics()
+
+
+def instrumented(name=None):
+    """
+    Mide cada corrida del handler en handler_metrics, con `name` o el nombre de la función.
+    """
+
+    def decorator(fn):
+        metric_name = name or fn.__name__
+
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            with handler_metrics.measure(metric_name):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return decorator
@@ -1,11 +1,246 @@
-import datetime
+import calendar
+import logging
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from meals.instrumentation import handler_metrics, metrics
+from meals.models import CocaSettings, Participant, ScheduledJob
 
+logger = logging.getLogger(__name__)
 
-def register_send_reminder_daily(job_queue, day, hour, minute):
-    from meals.handlers import send_reminder
 
-    job_queue.run_daily(
-        send_reminder,
-        time=datetime.time(hour=hour, minute=minute),
-        days=(day,),
+def get_job_functions():
+    from meals.handlers import (
+        enqueue_birthdays,
+        enqueue_history_resume,
+        enqueue_reminder,
+    )
+
+    return {
+        ScheduledJob.SEND_REMINDER: enqueue_reminder,
+        ScheduledJob.SEND_HISTORY_RESUME: enqueue_history_resume,
+        ScheduledJob.SEND_BIRTHDAYS: enqueue_birthdays,
+    }
+
+
+def get_next_run(kind, coca_settings, after, birthday_keys=()):
+    """
+    La primera vez que le toca correr al job después de `after`, a la hora del recordatorio en UTC.
+    El resumen se envía el día `history_resume_day`, o el último día si el mes es más corto.
+    Los cumpleaños se saludan el próximo día que cumple alguien, según `birthday_keys`.
+    """
+    at_hour = after.astimezone(dt_timezone.utc).replace(
+        hour=coca_settings.reminder_hour_utc, minute=0, second=0, microsecond=0
+    )
+
+    if kind == ScheduledJob.SEND_REMINDER:
+        next_run = at_hour + timedelta(
+            days=(coca_settings.reminder_day - at_hour.weekday()) % 7
+        )
+        return next_run if next_run > after else next_run + timedelta(weeks=1)
+
+    if kind == ScheduledJob.SEND_HISTORY_RESUME:
+        next_run = _get_month_day(at_hour, coca_settings.history_resume_day)
+        if next_run > after:
+            return next_run
+        next_month = (at_hour.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return _get_month_day(next_month, coca_settings.history_resume_day)
+
+    return _get_next_birthday(at_hour, after, birthday_keys)
+
+
+def _get_next_birthday(at_hour, after, birthday_keys):
+    # Como get_todays_birthdays, los del 29 de febrero solo se saludan los años bisiestos,
+    # que en el peor caso están a 8 años.
+    for year in range(at_hour.year, at_hour.year + 9):
+        next_runs = []
+        for birthday_key in birthday_keys:
+            month, day = divmod(birthday_key, 100)
+            try:
+                next_run = at_hour.replace(year=year, month=month, day=day)
+            except ValueError:
+                continue
+            if next_run > after:
+                next_runs.append(next_run)
+        if next_runs:
+            return min(next_runs)
+    return None
+
+
+def _get_month_day(day, month_day):
+    return day.replace(day=min(month_day, calendar.monthrange(day.year, day.month)[1]))
+
+
+def get_birthday_keys(chat_ids=None):
+    """
+    Los Participant.get_birthday_key de los participantes de cada chat, en una sola query.
+    """
+    participants = Participant.objects.filter(birthday__isnull=False)
+    if chat_ids is not None:
+        participants = participants.filter(chat_id__in=chat_ids)
+
+    birthday_keys = defaultdict(set)
+    for chat_id, birthday in participants.values_list("chat_id", "birthday").distinct():
+        birthday_keys[chat_id].add(Participant.get_birthday_key(birthday))
+    return birthday_keys
+
+
+def get_chat_jobs(coca_settings, now, birthday_keys=(), kinds=None):
+    return [
+        ScheduledJob(
+            name=ScheduledJob.get_name(kind, coca_settings.chat_id),
+            kind=kind,
+            chat_id=coca_settings.chat_id,
+            next_run_at=get_next_run(kind, coca_settings, now, birthday_keys),
+            misfire_grace_time=settings.SCHEDULED_JOB_MISFIRE_GRACE,
+        )
+        for kind, _ in ScheduledJob.KINDS
+        if kinds is None or kind in kinds
+    ]
+
+
+def sync_scheduled_jobs(run_soon_chat_id=None):
+    """
+    Crea los jobs que faltan para cada CocaSettings y borra los de chats que ya no tienen.
+    Los jobs que ya existen conservan su próxima corrida, así un reinicio no pierde las que
+    quedaron pendientes. Son unas pocas queries sin importar cuántos chats haya.
+    :param run_soon_chat_id: Programa los jobs de ese chat para el próximo minuto, para probarlos
+        en desarrollo.
+    :return: Los nombres de los jobs creados y de los borrados.
+    """
+    now = timezone.now()
+    birthday_keys = get_birthday_keys()
+    expected = {
+        job.name: job
+        for coca_settings in CocaSettings.objects.all()
+        for job in get_chat_jobs(
+            coca_settings, now, birthday_keys[coca_settings.chat_id]
+        )
+    }
+    existing = set(ScheduledJob.objects.values_list("name", flat=True))
+
+    created = sorted(set(expected) - existing)
+    deleted = sorted(existing - set(expected))
+    ScheduledJob.objects.bulk_create(
+        [expected[name] for name in created], ignore_conflicts=True
+    )
+    ScheduledJob.objects.filter(name__in=deleted).delete()
+
+    if run_soon_chat_id is not None:
+        ScheduledJob.objects.filter(chat_id=run_soon_chat_id).update(
+            next_run_at=now.replace(second=0, microsecond=0) + timedelta(minutes=1),
+            updated_at=now,
+        )
+
+    return created, deleted
+
+
+def reschedule_chat_jobs(coca_settings, kinds=None):
+    """
+    Recalcula la próxima corrida de los jobs del chat, después de cambiar su CocaSettings o
+    los cumpleaños de sus participantes. Si al chat le falta alguno lo crea.
+    """
+    now = timezone.now()
+    birthday_keys = ()
+    if kinds is None or ScheduledJob.SEND_BIRTHDAYS in kinds:
+        birthday_keys = get_birthday_keys([coca_settings.chat_id])[
+            coca_settings.chat_id
+        ]
+
+    for job in get_chat_jobs(coca_settings, now, birthday_keys, kinds):
+        updated = ScheduledJob.objects.filter(name=job.name).update(
+            next_run_at=job.next_run_at, updated_at=now
+        )
+        if not updated:
+            ScheduledJob.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def run_due_jobs(now=None, job_ids=None, batch_size=100):
+    """
+    Corre los jobs cuya próxima corrida ya pasó. Cada job se reprograma con un UPDATE condicional
+    antes de correrlo, así aunque dos procesos lo encuentren corre una sola vez. Si falla se
+    reintenta en SCHEDULED_JOB_RETRY_DELAY segundos mientras los reintentos entren en su
+    misfire_grace_time, después queda para la próxima vez.
+    :param job_ids: Solo mira estos jobs, los que meals.scheduler sacó de su heap.
+    :return: Cuántos jobs se corrieron.
+    """
+    now = now or timezone.now()
+    due_jobs = ScheduledJob.objects.filter(next_run_at__lte=now)
+    if job_ids is not None:
+        due_jobs = due_jobs.filter(id__in=job_ids)
+    else:
+        due_jobs = due_jobs.order_by("next_run_at")[:batch_size]
+    due_jobs = list(due_jobs)
+    if not due_jobs:
+        return 0
+
+    coca_settings = {
+        setting.chat_id: setting
+        for setting in CocaSettings.objects.filter(
+            chat_id__in={job.chat_id for job in due_jobs}
+        )
+    }
+    birthday_chat_ids = {
+        job.chat_id for job in due_jobs if job.kind == ScheduledJob.SEND_BIRTHDAYS
+    }
+    birthday_keys = get_birthday_keys(birthday_chat_ids) if birthday_chat_ids else {}
+    job_functions = get_job_functions()
+
+    ran = 0
+    for job in due_jobs:
+        if job.chat_id not in coca_settings:
+            logger.info(f"Se borra {job.name}, su chat ya no tiene configuración.")
+            ScheduledJob.objects.filter(id=job.id).delete()
+            continue
+
+        next_run_at = get_next_run(
+            job.kind,
+            coca_settings[job.chat_id],
+            now,
+            birthday_keys.get(job.chat_id, ()),
+        )
+        claimed = ScheduledJob.objects.filter(
+            id=job.id, next_run_at=job.next_run_at
+        ).update(next_run_at=next_run_at, retries=0, updated_at=timezone.now())
+        if not claimed:
+            continue
+
+        if (now - job.next_run_at).total_seconds() > job.misfire_grace_time:
+            metrics.inc("job_misfires", (("job", job.kind),))
+            logger.warning(
+                f"Se salteó {job.name}, tenía que correr el {job.next_run_at:%Y-%m-%d %H:%M}."
+            )
+            continue
+
+        logger.info(f"Corriendo {job.name}.")
+        try:
+            with handler_metrics.measure(f"job:{job.kind}"):
+                job_functions[job.kind](job.chat_id)
+        except Exception:
+            logger.exception(f"Error corriendo {job.name}.")
+            ScheduledJob.objects.filter(id=job.id).update(last_run_at=now)
+            retry_job(job, now, next_run_at)
+        else:
+            ScheduledJob.objects.filter(id=job.id).update(
+                last_run_at=now, last_success_at=timezone.now()
+            )
+        ran += 1
+
+    return ran
+
+
+def retry_job(job, now, next_run_at):
+    retries = job.retries + 1
+    if retries * settings.SCHEDULED_JOB_RETRY_DELAY > job.misfire_grace_time:
+        logger.error(
+            f"{job.name} falló {retries} veces seguidas, queda para la próxima vez."
+        )
+        return
+
+    # Si mientras corría se reprogramó el chat, gana la nueva programación.
+    ScheduledJob.objects.filter(id=job.id, next_run_at=next_run_at).update(
+        next_run_at=now + timedelta(seconds=settings.SCHEDULED_JOB_RETRY_DELAY),
+        retries=retries,
+        updated_at=timezone.now(),
     )
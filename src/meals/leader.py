@@ -0,0 +1,124 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import DateTimeField, ExpressionWrapper, Q
+from django.db.models.functions import Now
+from meals.models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """
+    Elige entre los procesos que comparten la base uno solo que corre los jobs programados.
+    El líder tiene un lease en SchedulerLease que vence a los `ttl` segundos y lo renueva
+    cada `renew_interval`; si se cae, otro proceso lo toma cuando vence.
+    El vencimiento se calcula y se compara con el reloj de la base, así la diferencia de reloj
+    entre réplicas no cambia cuándo vence. Además un proceso se considera líder hasta
+    `renew_interval` segundos antes de que venza su lease según su reloj monotónico, por si
+    pedir el lease tardó.
+    """
+
+    def __init__(self, name, ttl, renew_interval, holder=None, clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.holder = (
+            holder or f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        )
+        self._clock = clock
+        self._leader_until = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_leader(self):
+        return self._clock() < self._leader_until
+
+    def try_acquire(self):
+        """
+        Toma el lease si está libre o vencido, o lo renueva si ya es de este proceso.
+        :return: Si este proceso es el líder.
+        """
+        was_leader = self.is_leader()
+        started_at = self._clock()
+        expires_at = ExpressionWrapper(
+            Now() + timedelta(seconds=self.ttl), output_field=DateTimeField()
+        )
+
+        acquired = SchedulerLease.objects.filter(
+            Q(holder=self.holder) | Q(expires_at__lte=Now()), name=self.name
+        ).update(holder=self.holder, expires_at=expires_at)
+        if not acquired:
+            try:
+                with transaction.atomic():
+                    SchedulerLease.objects.create(
+                        name=self.name, holder=self.holder, expires_at=expires_at
+                    )
+                acquired = True
+            except IntegrityError:
+                # Ya existe y es de otro proceso que sigue vivo.
+                pass
+
+        if acquired:
+            self._leader_until = started_at + self.ttl - self.renew_interval
+        else:
+            self._leader_until = 0
+
+        if acquired and not was_leader:
+            logger.info(f"{self.holder} es el líder de {self.name}.")
+        elif was_leader and not acquired:
+            logger.warning(f"{self.holder} dejó de ser el líder de {self.name}.")
+
+        return acquired
+
+    def release(self):
+        """
+        Deja el lease vencido, así otro proceso toma los jobs sin esperar a que venza.
+        """
+        self._leader_until = 0
+        SchedulerLease.objects.filter(name=self.name, holder=self.holder).update(
+            expires_at=Now()
+        )
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._renew()
+        self._thread = threading.Thread(
+            target=self._run, name=f"leader_{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.release()
+
+    def _renew(self):
+        try:
+            self.try_acquire()
+        except Exception:
+            logger.exception(f"Error renovando el lease de {self.name}.")
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        while not self._stop_event.wait(self.renew_interval):
+            self._renew()
+
+
+scheduler_leader = LeaderElection(
+    "scheduler",
+    ttl=settings.SCHEDULER_LEASE_TTL,
+    renew_interval=settings.SCHEDULER_LEASE_RENEW_INTERVAL,
+)
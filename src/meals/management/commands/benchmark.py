@@ -0,0 +1,71 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from meals.benchmarks import ON_DEMAND, find_regressions, load_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Run coca benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help="Benchmarks a correr, si no se pasa ninguno todos menos los que corren solo si se los nombra.",
+        )
+        parser.add_argument("--iterations", type=int)
+        parser.add_argument(
+            "--output",
+            help="Archivo donde guardar los resultados, para usar de baseline.",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="Resultados guardados con --output contra los que comparar; falla si algo empeoró.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Cuánto más pueden tardar los tiempos que en el baseline, 0.5 es un 50%%.",
+        )
+
+    def handle(self, *args, **options):
+        benchmarks = load_benchmarks()
+        names = options["names"] or sorted(set(benchmarks) - ON_DEMAND)
+        unknown = set(names) - set(benchmarks)
+        if unknown:
+            raise CommandError(
+                f"No existen los benchmarks: {', '.join(sorted(unknown))}. Los disponibles son: {', '.join(sorted(benchmarks))}."
+            )
+
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer el baseline: {e}")
+
+        kwargs = {}
+        if options["iterations"]:
+            kwargs["iterations"] = options["iterations"]
+
+        results = {}
+        for name in names:
+            results[name] = benchmarks[name](**kwargs)
+            self.stdout.write(json.dumps({"benchmark": name, **results[name]}))
+
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(results, output_file, indent=2)
+
+        if baseline is not None:
+            missing = sorted(set(names) - set(baseline))
+            if missing:
+                self.stderr.write(
+                    f"El baseline no tiene resultados de: {', '.join(missing)}."
+                )
+            regressions = find_regressions(results, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError(
+                    "Empeoraron respecto del baseline:\n" + "\n".join(regressions)
+                )
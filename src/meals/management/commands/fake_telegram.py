@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from meals.fakebot import FakeBotApi, FakeBotApiServer
+from meals.replay import load_updates
+
+
+class Command(BaseCommand):
+    help = "Run a fake Telegram Bot API over HTTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "updates",
+            nargs="*",
+            help="Archivos con updates para entregar al bot apenas arranca.",
+        )
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8081)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Milisegundos que tarda cada pedido.",
+        )
+        parser.add_argument(
+            "--retry-after-rate",
+            type=float,
+            default=0,
+            help="Fracción de los envíos que contestan 429.",
+        )
+        parser.add_argument(
+            "--retry-after",
+            type=int,
+            default=1,
+            help="Segundos que piden esperar los 429.",
+        )
+        parser.add_argument("--seed", type=int)
+
+    def handle(self, *args, **options):
+        try:
+            updates = load_updates(options["updates"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudieron leer los updates: {e}")
+
+        api = FakeBotApi(
+            settings.TELEGRAM_TOKEN,
+            latency=options["latency"] / 1000,
+            retry_after_rate=options["retry_after_rate"],
+            retry_after=options["retry_after"],
+            seed=options["seed"],
+        )
+        for update in updates:
+            api.put_update(update)
+
+        server = FakeBotApiServer(api, options["host"], options["port"])
+        self.stdout.write(
+            f"Bot API falsa escuchando, usar TELEGRAM_BASE_URL={server.base_url}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            api.close()
+            server.server_close()
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from meals.models import MonthlyCounter, Participant, ParticipantCounter
+
+
+class Command(BaseCommand):
+    help = "Rebuild the participant counters used by /historial"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Solo verifica los contadores, falla si alguno está mal.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            wrong_totals = self.get_wrong_totals()
+            wrong_months = self.get_wrong_months()
+
+            if options["check"]:
+                if wrong_totals or wrong_months:
+                    raise CommandError(
+                        f"Hay {len(wrong_totals) + len(wrong_months)} contadores mal."
+                    )
+                self.stdout.write("Los contadores están bien.")
+                return
+
+            for participant_id, total_meals in wrong_totals.items():
+                ParticipantCounter.objects.update_or_create(
+                    participant_id=participant_id,
+                    defaults={"total_meals": total_meals},
+                )
+            for (participant_id, month), total_meals in wrong_months.items():
+                MonthlyCounter.objects.update_or_create(
+                    participant_id=participant_id,
+                    month=month,
+                    defaults={"total_meals": total_meals},
+                )
+            self.stdout.write(
+                f"Se corrigieron {len(wrong_totals) + len(wrong_months)} contadores."
+            )
+
+    def get_wrong_totals(self):
+        expected = ParticipantCounter.get_expected_totals()
+        current = dict(
+            ParticipantCounter.objects.values_list("participant_id", "total_meals")
+        )
+
+        wrong = {}
+        for participant_id in Participant.objects.values_list("id", flat=True):
+            if current.get(participant_id, 0) != expected.get(participant_id, 0):
+                wrong[participant_id] = expected.get(participant_id, 0)
+                self.stdout.write(
+                    f"Participante {participant_id}: {current.get(participant_id, 0)} en vez de {expected.get(participant_id, 0)}."
+                )
+        return wrong
+
+    def get_wrong_months(self):
+        expected = MonthlyCounter.get_expected_totals()
+        current = {
+            (participant_id, month): total_meals
+            for participant_id, month, total_meals in MonthlyCounter.objects.values_list(
+                "participant_id", "month", "total_meals"
+            )
+        }
+
+        wrong = {}
+        for participant_id, month in set(expected) | set(current):
+            key = (participant_id, month)
+            if current.get(key, 0) != expected.get(key, 0):
+                wrong[key] = expected.get(key, 0)
+                self.stdout.write(
+                    f"Participante {participant_id} en {month:%Y-%m}: {current.get(key, 0)} en vez de {expected.get(key, 0)}."
+                )
+        return wrong
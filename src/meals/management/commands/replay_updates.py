@@ -0,0 +1,70 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from meals.replay import load_updates, run_replay
+
+
+class Command(BaseCommand):
+    help = "Replay recorded or synthetic updates against a fake Telegram Bot API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            help="Archivos con updates grabados, si no se pasa ninguno se usa una mezcla sintética.",
+        )
+        parser.add_argument(
+            "--count",
+            type=int,
+            help="Updates a procesar, por defecto 1000 o los grabados.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Updates por segundo, 0 para mandarlos todos juntos.",
+        )
+        parser.add_argument("--workers", type=int, default=settings.UPDATER_WORKERS)
+        parser.add_argument("--chats", type=int, default=10)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Milisegundos que tarda cada pedido a la Bot API falsa.",
+        )
+        parser.add_argument(
+            "--retry-after-rate",
+            type=float,
+            default=0,
+            help="Fracción de los envíos que contestan 429.",
+        )
+        parser.add_argument(
+            "--telegram-limits",
+            action="store_true",
+            help="Envía con los límites de Telegram de OUTBOUND_*, si no sin límites.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        recorded = None
+        if options["paths"]:
+            try:
+                recorded = load_updates(options["paths"])
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudieron leer los updates: {e}")
+            if not recorded:
+                raise CommandError("Los archivos no tienen updates.")
+
+        count = options["count"] or (len(recorded) if recorded else 1000)
+        result = run_replay(
+            recorded=recorded,
+            count=count,
+            rate=options["rate"],
+            workers=options["workers"],
+            chats=options["chats"],
+            latency=options["latency"] / 1000,
+            retry_after_rate=options["retry_after_rate"],
+            telegram_limits=options["telegram_limits"],
+            seed=options["seed"],
+        )
+        self.stdout.write(json.dumps(result))
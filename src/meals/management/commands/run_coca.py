@@ -1,66 +1,125 @@
-import datetime
+from queue import Queue
+from threading import Event
 from django.conf import settings
+from meals.bot import QueuedBot
+from meals.decorators import close_db_connections
+from meals.dispatcher import ChatOrderedDispatcher
 from meals.handlers import (
-    send_history_resume,
+    CALLBACK_QUERIES,
     COMMANDS,
     REACTIONS,
     error_handler,
     reply_to_coca_handler,
-    send_birthdays_handler,
 )
-from meals.jobs import register_send_reminder_daily
-from meals.models import CocaSettings
+from meals.jobs import sync_scheduled_jobs
+from meals.instrumentation import instrumented
+from meals.leader import scheduler_leader
+from meals.media import media_registry
+from meals.metrics import metrics_writer
+from meals.outbox import outbox_worker
+from meals.scheduler import register_jobs
+from meals.sender import outbound_sender
 from telegram import ParseMode
-from telegram.ext import Updater, MessageHandler, Defaults
+from telegram.ext import Updater, MessageHandler, Defaults, JobQueue
 from telegram.ext.filters import Filters
+from telegram.utils.request import Request
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     help = "Start coca in polling mode"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--run-jobs-soon",
+            action="store_true",
+            help="Programa los jobs de CHAT_ID para el próximo minuto, para probarlos en desarrollo.",
+        )
+
     def handle(self, *args, **options):
-        start_bot()
+        start_bot(run_jobs_soon=options["run_jobs_soon"])
 
 
 def add_handlers(dispatcher):
     for command in COMMANDS:
         dispatcher.add_handler(command)
 
+    for callback_query in CALLBACK_QUERIES:
+        dispatcher.add_handler(callback_query)
+
     for reaction in REACTIONS:
         dispatcher.add_handler(reaction)
 
     dispatcher.add_handler(
-        MessageHandler(Filters.reply & ~Filters.command, reply_to_coca_handler)
+        MessageHandler(
+            Filters.reply & ~Filters.command,
+            close_db_connections(instrumented()(reply_to_coca_handler)),
+        )
     )
 
     dispatcher.add_error_handler(error_handler)
 
 
-def start_bot():
-    defaults = Defaults(quote=False, parse_mode=ParseMode.MARKDOWN_V2)
-    updater = Updater(token=settings.TELEGRAM_TOKEN, defaults=defaults)
+def build_bot(sender, request=None):
+    """
+    El QueuedBot de run_coca, que envía por `sender` y hace los pedidos con `request`.
+    """
+    return QueuedBot(
+        settings.TELEGRAM_TOKEN,
+        base_url=settings.TELEGRAM_BASE_URL,
+        defaults=Defaults(quote=False, parse_mode=ParseMode.MARKDOWN_V2),
+        # Lo mismo que arma el Updater: un pool con lugar para los workers y el polling.
+        request=request or Request(con_pool_size=settings.UPDATER_WORKERS + 4),
+        sender=sender,
+    )
 
-    coca_settings = CocaSettings.instance()
-    day = coca_settings.reminder_day
-    hour = coca_settings.reminder_hour_utc
-    minute = 0 if not settings.DEBUG else datetime.datetime.now().minute + 1
-    register_send_reminder_daily(updater.job_queue, day, hour, minute)
 
-    history_day = coca_settings.history_resume_day
-    updater.job_queue.run_monthly(
-        send_history_resume,
-        when=datetime.time(hour=hour, minute=minute),
-        day=history_day,
+def build_dispatcher(bot, update_workers=None):
+    """
+    El Dispatcher de run_coca con sus handlers, que procesa lo que llega a su update_queue.
+    """
+    # Los workers de PTB solo corren los handlers con run_async, los updates los procesa
+    # el pool de ChatOrderedDispatcher.
+    dispatcher = ChatOrderedDispatcher(
+        bot,
+        Queue(),
+        workers=1,
+        update_workers=update_workers or settings.UPDATER_WORKERS,
+        job_queue=JobQueue(),
+        exception_event=Event(),
     )
+    dispatcher.job_queue.set_dispatcher(dispatcher)
+    bot.dispatcher = dispatcher
+    add_handlers(dispatcher)
+    return dispatcher
+
+
+def build_updater(run_jobs_soon=False):
+    bot = build_bot(outbound_sender)
+    updater = Updater(dispatcher=build_dispatcher(bot), workers=None)
+    outbound_sender.start()
+    outbox_worker.start(bot)
+    metrics_writer.start()
+
+    media_registry.load()
+
+    # Todas las réplicas registran los jobs, pero solo los corre la que tiene el lease.
+    scheduler_leader.start()
+    sync_scheduled_jobs(run_soon_chat_id=settings.CHAT_ID if run_jobs_soon else None)
+    register_jobs(updater.job_queue)
+
+    return updater
 
-    updater.job_queue.run_daily(
-        send_birthdays_handler,
-        time=datetime.time(hour=hour, minute=minute),
-    )
 
-    add_handlers(updater.dispatcher)
+def start_bot(run_jobs_soon=False):
+    if settings.WEBHOOK_URL:
+        raise CommandError(
+            "WEBHOOK_URL está configurado, las actualizaciones llegan por coca_sarli.asgi."
+        )
 
+    updater = build_updater(run_jobs_soon)
     updater.start_polling()
     updater.idle()
+    # Al terminar libera el lease, así otra réplica toma los jobs sin esperar a que venza.
+    scheduler_leader.stop()
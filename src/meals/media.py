@@ -0,0 +1,105 @@
+import logging
+import threading
+from io import BytesIO
+from os import listdir, path
+from pathlib import Path
+from django.conf import settings
+from meals.bot import get_bot_id, on_sent, send_with_fallback, wait_for_message
+from meals.instrumentation import metrics
+from meals.models import MediaFile
+
+logger = logging.getLogger(__name__)
+
+UNAUTHORIZED_PHOTO = "https://pbs.twimg.com/media/E8ozthsWQAMproa.jpg"
+MEDIA_CACHE = (("cache", "media_file_id"),)
+
+
+class MediaRegistry:
+    """
+    Guarda en memoria los archivos de media/ y los file_id que devuelve Telegram,
+    así cada archivo se sube una sola vez por bot y después se envía por file_id.
+    """
+
+    def __init__(self, media_dir):
+        self._media_dir = media_dir
+        self._lock = threading.Lock()
+        self._files = None
+        self._file_ids = None
+
+    def load(self):
+        files = {}
+        for name in listdir(self._media_dir):
+            with open(path.join(self._media_dir, name), "rb") as media:
+                files[name] = media.read()
+
+        file_ids = dict(
+            MediaFile.objects.filter(bot_id=get_bot_id()).values_list("name", "file_id")
+        )
+
+        with self._lock:
+            self._files = files
+            self._file_ids = file_ids
+
+    def clear(self):
+        with self._lock:
+            self._files = None
+            self._file_ids = None
+
+    def send_audio(self, name, send_callback, **kwargs):
+        return self._send(
+            name, send_callback, lambda message: message.audio.file_id, **kwargs
+        )
+
+    def send_photo(self, name, send_callback, **kwargs):
+        return self._send(
+            name, send_callback, lambda message: message.photo[-1].file_id, **kwargs
+        )
+
+    def _send(self, name, send_callback, get_file_id, **kwargs):
+        """
+        Con el file_id guardado no espera a que salga, y si Telegram lo rechaza lo vuelve a subir
+        desde el thread del sender. Sin file_id espera la subida para guardar el que devuelve.
+        """
+        if self._files is None:
+            self.load()
+
+        file_id = self._file_ids.get(name)
+        metrics.inc(
+            "cache_hits" if file_id is not None else "cache_misses", MEDIA_CACHE
+        )
+        if file_id is not None:
+            return send_with_fallback(
+                lambda: send_callback(file_id, **kwargs),
+                lambda: self._upload_again(name, send_callback, get_file_id, **kwargs),
+            )
+
+        message = wait_for_message(send_callback, self._get_upload(name), **kwargs)
+        self._set_file_id(name, get_file_id(message))
+
+        return message
+
+    def _upload_again(self, name, send_callback, get_file_id, **kwargs):
+        logger.info(f"Telegram rechazó el file_id de {name}, se vuelve a subir.")
+        sent = send_callback(self._get_upload(name), **kwargs)
+        on_sent(sent, lambda message: self._set_file_id(name, get_file_id(message)))
+        return sent
+
+    def _get_upload(self, name):
+        if name not in self._files:
+            # No es un archivo de media/, es una url que Telegram descarga.
+            return name
+
+        upload = BytesIO(self._files[name])
+        upload.name = name
+        return upload
+
+    def _set_file_id(self, name, file_id):
+        with self._lock:
+            self._file_ids[name] = file_id
+
+        MediaFile.objects.update_or_create(
+            name=name, bot_id=get_bot_id(), defaults={"file_id": file_id}
+        )
+
+
+media_registry = MediaRegistry(path.join(Path(settings.BASE_DIR).parent, "media"))
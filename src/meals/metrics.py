@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import socket
+import threading
+from glob import glob
+from uuid import uuid4
+from django.conf import settings
+from django.http import HttpResponse
+from meals.instrumentation import Histogram, handler_metrics, metrics
+from meals.models import settings_cache
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Límites de los buckets de los histogramas exportados, en segundos.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Nombre en meals.instrumentation: nombre exportado, tipo y descripción.
+FAMILIES = {
+    "update_runs": (
+        "coca_updates_total",
+        "counter",
+        "Updates procesados por cada handler.",
+    ),
+    "update_errors": (
+        "coca_update_errors_total",
+        "counter",
+        "Updates en los que el handler terminó con una excepción.",
+    ),
+    "update_duration": (
+        "coca_update_duration_seconds",
+        "histogram",
+        "Cuánto tardó cada handler en procesar un update.",
+    ),
+    "job_runs": ("coca_job_runs_total", "counter", "Corridas de cada job."),
+    "job_errors": (
+        "coca_job_errors_total",
+        "counter",
+        "Corridas de jobs que terminaron con una excepción.",
+    ),
+    "job_duration": (
+        "coca_job_duration_seconds",
+        "histogram",
+        "Cuánto tardó cada corrida de un job.",
+    ),
+    "job_misfires": (
+        "coca_job_misfires_total",
+        "counter",
+        "Corridas salteadas porque el job se pasó de su hora más que el margen permitido.",
+    ),
+    "telegram_request_duration": (
+        "coca_telegram_request_duration_seconds",
+        "histogram",
+        "Cuánto tardó cada pedido a la API de Telegram, sin la espera en la cola de envío.",
+    ),
+    "telegram_send_errors": (
+        "coca_telegram_send_errors_total",
+        "counter",
+        "Envíos encolados a Telegram que fallaron, por endpoint.",
+    ),
+    "db_query_duration": (
+        "coca_db_query_duration_seconds",
+        "histogram",
+        "Cuánto tardó cada query a la base.",
+    ),
+    "reaction_checks": (
+        "coca_reaction_checks_total",
+        "counter",
+        "Mensajes de texto revisados por el filtro de reacciones.",
+    ),
+    "reaction_hits": (
+        "coca_reaction_hits_total",
+        "counter",
+        "Mensajes que dispararon cada reacción.",
+    ),
+    "chart_render_duration": (
+        "coca_chart_render_duration_seconds",
+        "histogram",
+        "Cuánto tardó cada render del gráfico del historial.",
+    ),
+    "cache_hits": ("coca_cache_hits_total", "counter", "Aciertos de cada cache."),
+    "cache_misses": ("coca_cache_misses_total", "counter", "Fallos de cada cache."),
+}
+
+_process_name = f"{socket.gethostname()}_{os.getpid()}_{uuid4().hex[:8]}"
+
+
+def collect():
+    """
+    Las métricas de este proceso: las de metrics, las de handler_metrics y las de los caches.
+    :return: Los contadores y los histogramas por (nombre, labels).
+    """
+    counters, histograms = metrics.snapshot()
+
+    for name, record in handler_metrics.snapshot().items():
+        if name.startswith("job:"):
+            prefix, labels = "job", (("job", name[len("job:") :]),)
+        else:
+            prefix, labels = "update", (("handler", name),)
+        counters[(f"{prefix}_runs", labels)] = record.latency.count
+        counters[(f"{prefix}_errors", labels)] = record.errors
+        histograms[(f"{prefix}_duration", labels)] = record.latency
+
+    cache_stats = settings_cache.stats()
+    counters[("cache_hits", (("cache", "settings"),))] = cache_stats["hits"]
+    counters[("cache_misses", (("cache", "settings"),))] = cache_stats["misses"]
+
+    return counters, histograms
+
+
+def render(counters, histograms):
+    """
+    Las métricas en el formato de texto de Prometheus.
+    """
+    lines = []
+    for name, (exported_name, kind, description) in FAMILIES.items():
+        samples = counters if kind == "counter" else histograms
+        keys = sorted(key for key in samples if key[0] == name)
+        if not keys:
+            continue
+
+        lines.append(f"# HELP {exported_name} {description}")
+        lines.append(f"# TYPE {exported_name} {kind}")
+        for _, labels in keys:
+            if kind == "counter":
+                lines.append(
+                    f"{exported_name}{format_labels(labels)} {samples[(name, labels)]}"
+                )
+            else:
+                lines.extend(
+                    _render_histogram(exported_name, labels, samples[(name, labels)])
+                )
+
+    return "\n".join(lines) + "\n"
+
+
+def _render_histogram(exported_name, labels, histogram):
+    # Los histogramas guardan microsegundos y se exportan en segundos.
+    cumulative = histogram.cumulative_counts(
+        [round(boundary * 1_000_000) for boundary in BUCKETS]
+    )
+    for boundary, count in zip(BUCKETS, cumulative):
+        yield f"{exported_name}_bucket{format_labels(labels + (('le', str(boundary)),))} {count}"
+    yield f"{exported_name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}"
+    yield f"{exported_name}_sum{format_labels(labels)} {histogram.total / 1_000_000}"
+    yield f"{exported_name}_count{format_labels(labels)} {histogram.count}"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    formatted = ",".join(
+        f'{name}="{escape_label_value(value)}"' for name, value in labels
+    )
+    return f"{{{formatted}}}"
+
+
+def escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def dump(directory):
+    """
+    Escribe las métricas de este proceso en su archivo de `directory`, para que el proceso
+    que atiende /metrics las sume con las de las otras réplicas.
+    """
+    counters, histograms = collect()
+    data = {
+        "counters": [
+            [name, labels, value] for (name, labels), value in counters.items()
+        ],
+        "histograms": [
+            [
+                name,
+                labels,
+                [
+                    [index, count]
+                    for index, count in enumerate(histogram.counts)
+                    if count
+                ],
+                histogram.total,
+            ]
+            for (name, labels), histogram in histograms.items()
+        ],
+    }
+
+    path = os.path.join(directory, f"{_process_name}.json")
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as metrics_file:
+        json.dump(data, metrics_file)
+    # Con el rename atómico nadie lee un archivo a medio escribir.
+    os.replace(temporary_path, path)
+
+
+def load(directory):
+    """
+    Suma las métricas de todos los procesos que escribieron en `directory`.
+    :return: Los contadores y los histogramas por (nombre, labels), como collect.
+    """
+    counters = {}
+    histograms = {}
+    for path in sorted(glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(path) as metrics_file:
+                data = json.load(metrics_file)
+        except (OSError, ValueError):
+            logger.exception(f"No se pudieron leer las métricas de {path}.")
+            continue
+
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+
+        for name, labels, buckets, total in data["histograms"]:
+            histogram = histograms.setdefault(
+                (name, tuple(map(tuple, labels))), Histogram()
+            )
+            for index, count in buckets:
+                if index >= len(histogram.counts):
+                    histogram.counts.extend([0] * (index + 1 - len(histogram.counts)))
+                histogram.counts[index] += count
+                histogram.count += count
+            histogram.total += total
+
+    return counters, histograms
+
+
+def metrics_view(request):
+    if settings.METRICS_DIR:
+        dump(settings.METRICS_DIR)
+        counters, histograms = load(settings.METRICS_DIR)
+    else:
+        counters, histograms = collect()
+
+    return HttpResponse(render(counters, histograms), content_type=CONTENT_TYPE)
+
+
+class MetricsWriter:
+    """
+    Escribe las métricas del proceso en METRICS_DIR cada `interval` segundos, así las de un
+    proceso que no atiende /metrics, como run_coca, llegan al que sí.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not settings.METRICS_DIR or self._thread is not None:
+            return
+
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics_writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                dump(settings.METRICS_DIR)
+            except Exception:
+                logger.exception("Error escribiendo las métricas.")
+
+
+metrics_writer = MetricsWriter(interval=settings.METRICS_WRITE_INTERVAL)
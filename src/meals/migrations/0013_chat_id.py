@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0012_coca_settings_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="meal",
+            name="chat_id",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="participant",
+            name="chat_id",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="skip",
+            name="chat_id",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="cocasettings",
+            name="chat_id",
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
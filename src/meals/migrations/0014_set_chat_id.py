@@ -0,0 +1,19 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:02
+
+from django.conf import settings
+from django.db import migrations
+
+
+def set_chat_id(apps, schema_editor):
+    for model_name in ("Meal", "Participant", "Skip", "CocaSettings"):
+        model = apps.get_model("meals", model_name)
+        model.objects.filter(chat_id__isnull=True).update(chat_id=settings.CHAT_ID)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0013_chat_id"),
+    ]
+
+    operations = [migrations.RunPython(set_chat_id, migrations.RunPython.noop)]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0014_set_chat_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="meal",
+            name="chat_id",
+            field=models.BigIntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="participant",
+            name="chat_id",
+            field=models.BigIntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="skip",
+            name="chat_id",
+            field=models.BigIntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="cocasettings",
+            name="chat_id",
+            field=models.BigIntegerField(unique=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.6 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0015_alter_chat_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HistoryChart",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("image", models.BinaryField()),
+                ("file_id", models.CharField(max_length=255, null=True)),
+                ("bot_id", models.CharField(max_length=20, null=True)),
+                ("used_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
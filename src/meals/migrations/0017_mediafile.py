@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-18 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0016_historychart"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("bot_id", models.CharField(max_length=20)),
+                ("file_id", models.CharField(max_length=255)),
+            ],
+            options={
+                "unique_together": {("name", "bot_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0017_mediafile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ParticipantCounter",
+            fields=[
+                (
+                    "participant",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="counter",
+                        serialize=False,
+                        to="meals.participant",
+                    ),
+                ),
+                ("total_meals", models.IntegerField(default=0)),
+            ],
+        ),
+    ]
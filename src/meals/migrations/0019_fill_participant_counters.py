@@ -0,0 +1,37 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:20
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_participant_counters(apps, schema_editor):
+    MealItem = apps.get_model("meals", "MealItem")
+    Participant = apps.get_model("meals", "Participant")
+    ParticipantCounter = apps.get_model("meals", "ParticipantCounter")
+
+    totals = dict(
+        MealItem.objects.filter(meal__done=True)
+        .values("owner_id")
+        .annotate(total=Count("id"))
+        .values_list("owner_id", "total")
+    )
+    ParticipantCounter.objects.bulk_create(
+        [
+            ParticipantCounter(
+                participant_id=participant_id,
+                total_meals=totals.get(participant_id, 0),
+            )
+            for participant_id in Participant.objects.values_list("id", flat=True)
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0018_participantcounter"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_participant_counters, migrations.RunPython.noop)
+    ]
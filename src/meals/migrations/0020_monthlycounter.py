@@ -0,0 +1,40 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0019_fill_participant_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField()),
+                ("total_meals", models.IntegerField(default=0)),
+                (
+                    "participant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="meals.participant",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("participant", "month")},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:40
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def fill_monthly_counters(apps, schema_editor):
+    MealItem = apps.get_model("meals", "MealItem")
+    MonthlyCounter = apps.get_model("meals", "MonthlyCounter")
+
+    MonthlyCounter.objects.bulk_create(
+        [
+            MonthlyCounter(participant_id=owner_id, month=month, total_meals=total)
+            for owner_id, month, total in MealItem.objects.filter(
+                meal__done=True, meal__done_at__isnull=False
+            )
+            .annotate(month=TruncMonth("meal__done_at"))
+            .values("owner_id", "month")
+            .annotate(total=Count("id"))
+            .values_list("owner_id", "month", "total")
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0020_monthlycounter"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_monthly_counters, migrations.RunPython.noop)
+    ]
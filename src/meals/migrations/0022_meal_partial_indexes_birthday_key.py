@@ -0,0 +1,41 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0021_fill_monthly_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="participant",
+            name="birthday_key",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="meal",
+            index=models.Index(
+                condition=models.Q(("done", False)),
+                fields=["chat_id", "id"],
+                name="meal_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="meal",
+            index=models.Index(
+                condition=models.Q(("done", True)),
+                fields=["chat_id", "id"],
+                name="meal_done_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="participant",
+            index=models.Index(
+                fields=["chat_id", "birthday_key"],
+                name="meals_parti_chat_id_9440c8_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:57
+
+from django.db import migrations
+
+
+def fill_birthday_key(apps, schema_editor):
+    Participant = apps.get_model("meals", "Participant")
+
+    participants = list(Participant.objects.filter(birthday__isnull=False))
+    for participant in participants:
+        participant.birthday_key = (
+            participant.birthday.month * 100 + participant.birthday.day
+        )
+    Participant.objects.bulk_update(participants, ["birthday_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0022_meal_partial_indexes_birthday_key"),
+    ]
+
+    operations = [migrations.RunPython(fill_birthday_key, migrations.RunPython.noop)]
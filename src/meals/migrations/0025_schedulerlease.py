@@ -0,0 +1,24 @@
+# Generated by Django 4.0.6 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0024_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SchedulerLease",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("holder", models.CharField(max_length=100)),
+                ("expires_at", models.DateTimeField()),
+            ],
+        ),
+    ]
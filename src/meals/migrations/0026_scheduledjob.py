@@ -0,0 +1,44 @@
+# Generated by Django 4.0.6 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0025_schedulerlease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScheduledJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("send_reminder", "Recordatorio"),
+                            ("send_history_resume", "Resumen del historial"),
+                            ("send_birthdays_handler", "Cumpleaños"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                ("chat_id", models.BigIntegerField()),
+                ("next_run_at", models.DateTimeField(db_index=True)),
+                ("last_run_at", models.DateTimeField(null=True)),
+                ("last_success_at", models.DateTimeField(null=True)),
+                ("misfire_grace_time", models.PositiveIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.6 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0026_scheduledjob"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="scheduledjob",
+            name="next_run_at",
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scheduledjob",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
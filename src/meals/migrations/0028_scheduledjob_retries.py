@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0027_scheduledjob_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scheduledjob",
+            name="retries",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
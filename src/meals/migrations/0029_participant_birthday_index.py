@@ -0,0 +1,32 @@
+# Generated by Django 4.0.6 on 2026-10-18 19:05
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0028_scheduledjob_retries"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="participant",
+            name="meals_parti_chat_id_9440c8_idx",
+        ),
+        migrations.RemoveField(
+            model_name="participant",
+            name="birthday_key",
+        ),
+        migrations.AddIndex(
+            model_name="participant",
+            index=models.Index(
+                django.db.models.expressions.F("chat_id"),
+                django.db.models.functions.datetime.ExtractMonth("birthday"),
+                django.db.models.functions.datetime.ExtractDay("birthday"),
+                name="participant_birthday_idx",
+            ),
+        ),
+    ]
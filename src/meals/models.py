@@ -1,19 +1,101 @@
-from django.db import models
+from collections import Counter
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import ExtractDay, ExtractMonth, TruncMonth
 from django.utils import timezone
+from meals.caches import KeyedCache
 from meals.formatters import format_meal, format_name
 
 
 class Meal(models.Model):
+    chat_id = models.BigIntegerField(db_index=True)
     done = models.BooleanField(default=False)
     done_at = models.DateField(null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Cómo está la comida en la base, para saber cuándo cambian los contadores.
+    _saved_done = False
+    _saved_month = None
+
     class Meta:
         ordering = ("id",)
+        indexes = [
+            # La cola de próximas comidas y las últimas comidas de cada chat, en orden de id.
+            models.Index(
+                fields=["chat_id", "id"],
+                condition=Q(done=False),
+                name="meal_pending_idx",
+            ),
+            models.Index(
+                fields=["chat_id", "id"], condition=Q(done=True), name="meal_done_idx"
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._set_saved_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._set_saved_state()
+
+    def claim(self):
+        """
+        Marca la comida como hecha solo si en la base sigue pendiente.
+        :return: True si la marcó esta llamada, False si otro proceso la marcó antes.
+        """
+        done_at = timezone.now()
+        with transaction.atomic(savepoint=False):
+            claimed = Meal.objects.filter(id=self.id, done=False).update(
+                done=True, done_at=done_at
+            )
+            if not claimed:
+                return False
+
+            self.done = True
+            self.done_at = done_at
+            self._update_counters()
+            self._set_saved_state()
+            return True
+
+    def get_counted_month(self):
+        """
+        El mes en el que cuenta la comida para los contadores mensuales, None si no está hecha.
+        """
+        if not self.__dict__.get("done", False):
+            return None
+        return MonthlyCounter.get_month(self.__dict__.get("done_at"))
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            self._update_counters()
+            self._set_saved_state()
 
-    def mark_as_done(self):
-        self.done = True
-        self.done_at = timezone.now()
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            if self._saved_done:
+                meal_items = list(self.mealitem_set.all())
+                ParticipantCounter.add_meal_items(meal_items, -1)
+                MonthlyCounter.add_meal_items(meal_items, -1, self._saved_month)
+            return super().delete(*args, **kwargs)
+
+    def _set_saved_state(self):
+        self._saved_done = self.__dict__.get("done", False)
+        self._saved_month = self.get_counted_month()
+
+    def _update_counters(self):
+        month = self.get_counted_month()
+        if (self.done, month) == (self._saved_done, self._saved_month):
+            return
+
+        meal_items = list(self.mealitem_set.all())
+        if self.done != self._saved_done:
+            ParticipantCounter.add_meal_items(meal_items, 1 if self.done else -1)
+        MonthlyCounter.add_meal_items(meal_items, -1, self._saved_month)
+        MonthlyCounter.add_meal_items(meal_items, 1, month)
 
 
 class MealItem(models.Model):
@@ -21,6 +103,21 @@ class MealItem(models.Model):
     owner = models.ForeignKey("meals.Participant", on_delete=models.CASCADE)
     description = models.CharField(max_length=255)
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding and self.meal.done:
+                ParticipantCounter.add_meal_items([self], 1)
+                MonthlyCounter.add_meal_items([self], 1, self.meal.get_counted_month())
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            if self.meal.done:
+                ParticipantCounter.add_meal_items([self], -1)
+                MonthlyCounter.add_meal_items([self], -1, self.meal.get_counted_month())
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return (
             f"{format_meal(self.description)} a cargo de {format_name(self.owner.name)}"
@@ -28,23 +125,248 @@ class MealItem(models.Model):
 
 
 class Participant(models.Model):
+    chat_id = models.BigIntegerField(db_index=True)
     name = models.CharField(max_length=50)
     birthday = models.DateField(null=True)
 
+    class Meta:
+        indexes = [
+            # Para buscar los cumpleaños del día. Lo calcula la base, así vale también para las
+            # filas que se escriben con bulk_create o update().
+            models.Index(
+                "chat_id",
+                ExtractMonth("birthday"),
+                ExtractDay("birthday"),
+                name="participant_birthday_idx",
+            )
+        ]
+
+    @staticmethod
+    def get_birthday_key(day):
+        """
+        Mes y día del cumpleaños como mes * 100 + día.
+        """
+        if day is None:
+            return None
+        return day.month * 100 + day.day
+
     def __str__(self):
         return f"{self.id} {self.name}"
 
 
+class ParticipantCounter(models.Model):
+    """
+    Cuántos items de comidas hechas tiene cada participante, lo que muestra /historial.
+    Lo mantienen Meal y MealItem al guardarse o borrarse. Cambiar el dueño o la comida
+    de un item existente no lo actualiza, para eso está el comando rebuild_counters.
+    """
+
+    participant = models.OneToOneField(
+        "meals.Participant",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="counter",
+    )
+    total_meals = models.IntegerField(default=0)
+
+    @classmethod
+    def add_meal_items(cls, meal_items, delta):
+        _add_to_counters(cls, meal_items, delta)
+
+    @classmethod
+    def get_expected_totals(cls):
+        """
+        Los totales calculados desde las comidas, por id de participante.
+        """
+        return dict(
+            MealItem.objects.filter(meal__done=True)
+            .values("owner_id")
+            .annotate(total=Count("id"))
+            .values_list("owner_id", "total")
+        )
+
+
+class MonthlyCounter(models.Model):
+    """
+    Lo mismo que ParticipantCounter pero por mes de done_at, para ver el historial de un período.
+    Las comidas hechas sin done_at solo cuentan en ParticipantCounter.
+    """
+
+    participant = models.ForeignKey("meals.Participant", on_delete=models.CASCADE)
+    # Primer día del mes.
+    month = models.DateField()
+    total_meals = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("participant", "month")
+
+    @staticmethod
+    def get_month(day):
+        if day is None:
+            return None
+        day = Meal._meta.get_field("done_at").to_python(day)
+        return day.replace(day=1)
+
+    @classmethod
+    def add_meal_items(cls, meal_items, delta, month):
+        if month is not None:
+            _add_to_counters(cls, meal_items, delta, month=month)
+
+    @classmethod
+    def get_expected_totals(cls):
+        """
+        Los totales calculados desde las comidas, por (id de participante, mes).
+        """
+        return {
+            (owner_id, month): total
+            for owner_id, month, total in MealItem.objects.filter(
+                meal__done=True, meal__done_at__isnull=False
+            )
+            .annotate(month=TruncMonth("meal__done_at"))
+            .values("owner_id", "month")
+            .annotate(total=Count("id"))
+            .values_list("owner_id", "month", "total")
+        }
+
+
+def _add_to_counters(counter_model, meal_items, delta, **keys):
+    owner_counts = Counter(meal_item.owner_id for meal_item in meal_items)
+    if not owner_counts:
+        return
+
+    counter_model.objects.bulk_create(
+        [counter_model(participant_id=owner_id, **keys) for owner_id in owner_counts],
+        ignore_conflicts=True,
+    )
+
+    # Un update por cada cantidad distinta de items, casi siempre es uno solo.
+    owners_by_count = {}
+    for owner_id, count in owner_counts.items():
+        owners_by_count.setdefault(count, []).append(owner_id)
+    for count, owner_ids in owners_by_count.items():
+        counter_model.objects.filter(participant_id__in=owner_ids, **keys).update(
+            total_meals=F("total_meals") + count * delta
+        )
+
+
 class Skip(models.Model):
-    pass
+    chat_id = models.BigIntegerField(db_index=True)
+
+
+class HistoryChart(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    image = models.BinaryField()
+    file_id = models.CharField(max_length=255, null=True)
+    bot_id = models.CharField(max_length=20, null=True)
+    used_at = models.DateTimeField(db_index=True)
+
+
+class MediaFile(models.Model):
+    name = models.CharField(max_length=100)
+    bot_id = models.CharField(max_length=20)
+    file_id = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = ("name", "bot_id")
+
+
+class OutboxMessage(models.Model):
+    """
+    Un mensaje por enviar. Se guarda en la misma transacción que el cambio que lo origina
+    y lo envía meals.outbox, así no se pierde si el envío falla o el proceso se cae.
+    """
+
+    MESSAGE = "message"
+    HISTORY_CHART = "history_chart"
+    KINDS = ((MESSAGE, "Mensaje"), (HISTORY_CHART, "Gráfico del historial"))
+
+    chat_id = models.BigIntegerField()
+    kind = models.CharField(max_length=20, choices=KINDS)
+    payload = models.JSONField()
+    # Identifica lo que avisa el mensaje, así repetir un job no lo encola dos veces.
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # None cuando ya se envió o se descartó.
+    next_attempt_at = models.DateTimeField(null=True)
+    claimed_by = models.CharField(max_length=32, null=True)
+    sent_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Los pendientes en orden de id, así tomar un lote no ordena todo lo pendiente.
+            models.Index(
+                fields=["id"],
+                condition=Q(next_attempt_at__isnull=False),
+                name="outbox_pending_idx",
+            ),
+            models.Index(
+                fields=["chat_id", "id"],
+                condition=Q(next_attempt_at__isnull=False),
+                name="outbox_chat_pending_idx",
+            ),
+        ]
+
+
+class SchedulerLease(models.Model):
+    """
+    Quién corre los jobs programados. Lo maneja meals.leader: el proceso que tiene el lease
+    lo renueva antes de que venza, y si deja de hacerlo otro lo toma.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    holder = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+
+class ScheduledJob(models.Model):
+    """
+    Un job programado de un chat. meals.jobs lo corre cuando llega next_run_at y calcula la próxima
+    vez desde CocaSettings, o desde los cumpleaños de los participantes; si el bot estuvo caído y se
+    pasó por más de misfire_grace_time segundos no lo corre y pasa a la próxima. Si falla se reintenta
+    dentro de ese margen, `retries` cuenta los reintentos seguidos.
+    Sin next_run_at no tiene próxima vez, como los cumpleaños de un chat sin fechas cargadas.
+    updated_at cambia con next_run_at, también en los update(), así meals.scheduler solo lee los
+    jobs que cambiaron.
+    """
+
+    SEND_REMINDER = "send_reminder"
+    SEND_HISTORY_RESUME = "send_history_resume"
+    SEND_BIRTHDAYS = "send_birthdays_handler"
+    KINDS = (
+        (SEND_REMINDER, "Recordatorio"),
+        (SEND_HISTORY_RESUME, "Resumen del historial"),
+        (SEND_BIRTHDAYS, "Cumpleaños"),
+    )
+
+    name = models.CharField(max_length=100, unique=True)
+    kind = models.CharField(max_length=30, choices=KINDS)
+    chat_id = models.BigIntegerField()
+    next_run_at = models.DateTimeField(null=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    last_run_at = models.DateTimeField(null=True)
+    last_success_at = models.DateTimeField(null=True)
+    misfire_grace_time = models.PositiveIntegerField()
+    retries = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def get_name(kind, chat_id):
+        return f"{kind}_{chat_id}"
 
 
 class CocaSettings(models.Model):
+    chat_id = models.BigIntegerField(unique=True)
     reminder_hour_utc = models.PositiveSmallIntegerField()
     reminder_day = models.PositiveSmallIntegerField()
     history_resume_day = models.PositiveSmallIntegerField()
     random_run_probability = models.PositiveSmallIntegerField()
 
     @classmethod
-    def instance(cls):
-        return cls.objects.first()
+    def instance(cls, chat_id):
+        return settings_cache.get(chat_id)
+
+
+settings_cache = KeyedCache(
+    lambda chat_id: CocaSettings.objects.filter(chat_id=chat_id).first()
+)
@@ -0,0 +1,300 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent import futures
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from meals.bot import handle_send_errors
+from meals.graphs import send_history_chart
+from meals.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def message(chat_id, text, key, **options):
+    """
+    Un mensaje de texto para el outbox. `options` se pasan tal cual a send_message.
+    """
+    return OutboxMessage(
+        chat_id=chat_id,
+        kind=OutboxMessage.MESSAGE,
+        payload={"text": text, "options": options},
+        idempotency_key=key,
+    )
+
+
+def history_chart(chat_id, graph, key):
+    return OutboxMessage(
+        chat_id=chat_id,
+        kind=OutboxMessage.HISTORY_CHART,
+        payload={"graph": graph},
+        idempotency_key=key,
+    )
+
+
+def enqueue(*messages):
+    """
+    Guarda los mensajes para enviarlos, en la transacción en curso si hay una.
+    Los que tienen una idempotency_key que ya está en el outbox se ignoran.
+    """
+    now = timezone.now()
+    for outbox_message in messages:
+        outbox_message.next_attempt_at = now
+    OutboxMessage.objects.bulk_create(messages, ignore_conflicts=True)
+    transaction.on_commit(outbox_worker.wake)
+
+
+def deliver_outbox(bot, batch_size=None):
+    """
+    Envía un lote de mensajes pendientes y devuelve cuántos se enviaron.
+    Los chats del lote se envían a la vez, y los mensajes de cada chat en orden: cada uno se
+    encola en el sender cuando salió el anterior, y si uno falla los siguientes de su chat
+    esperan a que se envíe. Antes de encolar cada mensaje se renueva su reserva y apenas sale
+    se marca como enviado, así un lote que tarda más que OUTBOX_LEASE no lo vuelve a enviar
+    otro proceso. Si el proceso se cae entre el envío y la marca el mensaje se vuelve a enviar:
+    cada mensaje llega al menos una vez.
+    """
+    messages = claim_batch(batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not messages:
+        return 0
+
+    chats = {}
+    for outbox_message in messages:
+        chats.setdefault(outbox_message.chat_id, deque()).append(outbox_message)
+
+    in_flight = {}
+    held_ids = []
+
+    def send_next(chat_id):
+        queue = chats[chat_id]
+        if not queue:
+            return
+        outbox_message = queue.popleft()
+        if not renew_claim(outbox_message):
+            # Se venció la reserva y lo tomó otro proceso, que sigue con los de su chat.
+            held_ids.extend(held.id for held in queue)
+            queue.clear()
+            return
+        deadline = time.monotonic() + settings.OUTBOUND_RESULT_TIMEOUT
+        in_flight[submit(bot, outbox_message)] = (outbox_message, deadline)
+
+    for chat_id in chats:
+        send_next(chat_id)
+
+    sent = 0
+    while in_flight:
+        next_deadline = min(deadline for _, deadline in in_flight.values())
+        done, _ = futures.wait(
+            in_flight,
+            max(next_deadline - time.monotonic(), 0),
+            return_when=futures.FIRST_COMPLETED,
+        )
+        # Lo que no salió en OUTBOUND_RESULT_TIMEOUT se cancela y se reintenta.
+        now = time.monotonic()
+        for sent_message, (_, deadline) in in_flight.items():
+            if sent_message not in done and deadline <= now:
+                # Si ya se está enviando no se puede cancelar, igual se reintenta.
+                sent_message.cancel()
+                done.add(sent_message)
+
+        for sent_message in done:
+            outbox_message, _ = in_flight.pop(sent_message)
+            error = get_send_error(sent_message)
+            if error is None:
+                mark_sent(outbox_message)
+                sent += 1
+                send_next(outbox_message.chat_id)
+            else:
+                # Quedan detrás del mensaje que falló, que sigue pendiente.
+                held_ids.extend(held.id for held in chats[outbox_message.chat_id])
+                chats[outbox_message.chat_id].clear()
+                schedule_retry(outbox_message, error)
+
+    OutboxMessage.objects.filter(
+        id__in=held_ids, claimed_by=messages[0].claimed_by
+    ).update(next_attempt_at=timezone.now(), claimed_by=None)
+
+    return sent
+
+
+def submit(bot, outbox_message):
+    """
+    Encola el envío del mensaje sin esperarlo.
+    :return: Un Future con su resultado, ya terminado si el bot envía sin sender o falló al encolar.
+    """
+    try:
+        # Los errores se reintentan acá, no van a los error handlers del Dispatcher.
+        with handle_send_errors(Exception):
+            sent = SENDERS[outbox_message.kind](bot, outbox_message)
+    except Exception as e:
+        sent = futures.Future()
+        sent.set_exception(e)
+        return sent
+
+    if not isinstance(sent, futures.Future):
+        result, sent = sent, futures.Future()
+        sent.set_result(result)
+    return sent
+
+
+def get_send_error(sent):
+    if not sent.done() or sent.cancelled():
+        return futures.TimeoutError(
+            f"No salió en {settings.OUTBOUND_RESULT_TIMEOUT} segundos."
+        )
+    return sent.exception()
+
+
+def claim_batch(batch_size):
+    """
+    Reserva los próximos mensajes pendientes por OUTBOX_LEASE segundos.
+    Un mensaje no se toma mientras haya uno anterior de su chat esperando un reintento
+    o reservado por otro proceso.
+    """
+    now = timezone.now()
+    pending = OutboxMessage.objects.filter(next_attempt_at__isnull=False)
+    waiting_before = pending.filter(
+        chat_id=OuterRef("chat_id"), id__lt=OuterRef("id"), next_attempt_at__gt=now
+    )
+    due_ids = list(
+        pending.filter(next_attempt_at__lte=now)
+        .exclude(Exists(waiting_before))
+        .order_by("id")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not due_ids:
+        return []
+
+    # Si otro proceso leyó los mismos mensajes, el UPDATE condicional deja cada uno en un solo lote.
+    claim = uuid4().hex
+    OutboxMessage.objects.filter(id__in=due_ids, next_attempt_at__lte=now).update(
+        claimed_by=claim,
+        next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE),
+    )
+    return list(
+        OutboxMessage.objects.filter(id__in=due_ids, claimed_by=claim).order_by("id")
+    )
+
+
+def renew_claim(outbox_message):
+    """
+    Extiende la reserva del mensaje por OUTBOX_LEASE segundos, si todavía es de este lote.
+    """
+    return OutboxMessage.objects.filter(
+        id=outbox_message.id, claimed_by=outbox_message.claimed_by
+    ).update(next_attempt_at=timezone.now() + timedelta(seconds=settings.OUTBOX_LEASE))
+
+
+def mark_sent(outbox_message):
+    OutboxMessage.objects.filter(id=outbox_message.id).update(
+        attempts=F("attempts") + 1,
+        sent_at=timezone.now(),
+        next_attempt_at=None,
+        claimed_by=None,
+    )
+
+
+def schedule_retry(outbox_message, error):
+    outbox_message.attempts += 1
+    outbox_message.last_error = repr(error)
+    outbox_message.claimed_by = None
+
+    if outbox_message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        logger.error(
+            f"Se descarta el mensaje {outbox_message.idempotency_key} después de {outbox_message.attempts} intentos: {error!r}"
+        )
+        outbox_message.next_attempt_at = None
+    else:
+        delay = min(
+            settings.OUTBOX_RETRY_DELAY * 2 ** (outbox_message.attempts - 1),
+            settings.OUTBOX_MAX_RETRY_DELAY,
+        )
+        logger.info(
+            f"Falló el envío de {outbox_message.idempotency_key}, se reintenta en {delay} segundos: {error!r}"
+        )
+        outbox_message.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+
+    outbox_message.save(
+        update_fields=["attempts", "last_error", "claimed_by", "next_attempt_at"]
+    )
+
+
+def send_message(bot, outbox_message):
+    return bot.send_message(
+        outbox_message.chat_id,
+        outbox_message.payload["text"],
+        **outbox_message.payload["options"],
+    )
+
+
+def send_chart(bot, outbox_message):
+    return send_history_chart(
+        outbox_message.payload["graph"],
+        lambda image, **kwargs: bot.send_photo(outbox_message.chat_id, image, **kwargs),
+    )
+
+
+SENDERS = {
+    OutboxMessage.MESSAGE: send_message,
+    OutboxMessage.HISTORY_CHART: send_chart,
+}
+
+
+class OutboxWorker:
+    """
+    Thread que envía el outbox, así los jobs solo encolan y no esperan a Telegram.
+    Se despierta al commitearse un mensaje nuevo y cada `poll_interval` segundos,
+    para los reintentos y lo que encolan otros procesos.
+    """
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._wake_event = threading.Event()
+        self._bot = None
+        self._thread = None
+        self._running = False
+
+    def start(self, bot):
+        if self._running:
+            return
+
+        self._bot = bot
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="outbox_worker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake_event.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wake(self):
+        self._wake_event.set()
+
+    def _run(self):
+        while self._running:
+            self._wake_event.clear()
+            try:
+                delivered = deliver_outbox(self._bot)
+            except Exception:
+                logger.exception("Error enviando el outbox.")
+                delivered = 0
+            finally:
+                close_old_connections()
+
+            # Con un lote lleno probablemente queden más, se sigue sin esperar.
+            if delivered < settings.OUTBOX_BATCH_SIZE:
+                self._wake_event.wait(self.poll_interval)
+
+
+outbox_worker = OutboxWorker(poll_interval=settings.OUTBOX_POLL_INTERVAL)
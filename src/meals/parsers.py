@@ -1,6 +1,14 @@
-from meals.exceptions import IncompleteMeal, InvalidDay, NoDayReceived
+from meals.exceptions import (
+    IncompleteMeal,
+    InvalidDay,
+    InvalidHistoryWindow,
+    NoDayReceived,
+)
 from meals.handlers.utils import DAYS
 
+# Diez años, más que el historial que hay y lejos de donde date no se puede restar.
+MAX_HISTORY_WEEKS = 520
+
 
 def parse_add_meal_args(args):
     message = " ".join(args)
@@ -27,3 +35,32 @@ def parse_weekday_name(args):
     if parsed not in DAYS:
         raise InvalidDay()
     return parsed
+
+
+def parse_history_window(args):
+    """
+    Parsea los argumentos de /historial: nada, mes, año o N semanas, con N hasta MAX_HISTORY_WEEKS.
+    :return: None para todo el historial, si no (ventana, semanas).
+    """
+    if len(args) == 0:
+        return None
+
+    window = args[0].lower()
+    if len(args) == 1 and window == "mes":
+        return "mes", None
+    if len(args) == 1 and window in ("año", "ano"):
+        return "año", None
+    if (
+        len(args) == 2
+        and window.isdigit()
+        and 0 < int(window) <= MAX_HISTORY_WEEKS
+        and args[1].lower() in ("semana", "semanas")
+    ):
+        return "semanas", int(window)
+
+    raise InvalidHistoryWindow()
+
+
+def parse_next_meals_page(data):
+    _, direction, meal_id, position = data.split(":")
+    return direction, int(meal_id), int(position)
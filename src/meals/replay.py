@@ -0,0 +1,379 @@
+import copy
+import itertools
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.test.utils import override_settings
+from telegram import Update
+from telegram.ext import TypeHandler
+from meals.benchmarks.reactions import TRIGGERS, WORDS
+from meals.dispatcher import get_chat_id
+from meals.fakebot import FakeBotApi, FakeRequest
+from meals.instrumentation import HandlerMetrics, Histogram
+from meals.management.commands import run_coca
+from meals.media import media_registry
+from meals.models import (
+    CocaSettings,
+    HistoryChart,
+    Meal,
+    MediaFile,
+    OutboxMessage,
+    Participant,
+    Skip,
+)
+from meals.sender import OutboundSender
+from meals.views import get_next_meal
+
+# Los chats de la carga usan ids de grupo que Telegram no entrega, así nunca pisan uno real.
+FIRST_CHAT_ID = -9 * 10**12
+# El bot falso tiene otro id, así los file_id que entrega no se mezclan con los del bot real.
+FAKE_TOKEN = "1000:replay"
+# Sin --telegram-limits el sender no frena nada y se mide solo el bot.
+UNLIMITED_RATE = 1_000_000
+
+NAMES = ("Ana", "Beto", "Caro", "Dani", "Eze", "Fede")
+FOODS = ("asado", "empanadas", "pizza", "flan", "vino", "ensalada", "helado")
+
+# Cuántos updates de cada tipo hay en la mezcla sintética, en proporción.
+MIX = (
+    ("agregar", 15),
+    ("proximas", 15),
+    ("historial", 5),
+    ("chatter", 55),
+    ("reply", 10),
+)
+
+
+class UpdateFactory:
+    """
+    Arma updates de Telegram como los que llegan de los chats, para los chats `chat_ids`.
+    """
+
+    def __init__(self, chat_ids, bot_user, seed=None):
+        self.chat_ids = chat_ids
+        self.bot_user = bot_user
+        self._random = random.Random(seed)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def message(self, chat_id, text, reply_to_bot=False):
+        user_index = self._random.randrange(len(NAMES))
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group", "title": "Carga"},
+            "from": {
+                "id": user_index + 1,
+                "is_bot": False,
+                "first_name": NAMES[user_index],
+            },
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split(" ", 1)[0]
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        if reply_to_bot:
+            message["reply_to_message"] = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": message["chat"],
+                "from": self.bot_user,
+                "text": "Recordatorio",
+            }
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def add_meal(self, chat_id):
+        owners = self._random.sample(NAMES, self._random.randint(1, 3))
+        items = ", ".join(f"{owner} {self._random.choice(FOODS)}" for owner in owners)
+        return self.message(chat_id, f"/agregar {items}")
+
+    def synthetic(self, kind, chat_id):
+        if kind == "agregar":
+            return self.add_meal(chat_id)
+        if kind in ("proximas", "historial"):
+            return self.message(chat_id, f"/{kind}")
+
+        words = self._random.choices(WORDS, k=self._random.randint(3, 25))
+        if kind == "chatter" and self._random.random() < 0.1:
+            words.insert(
+                self._random.randrange(len(words)), self._random.choice(TRIGGERS)
+            )
+        return self.message(chat_id, " ".join(words), reply_to_bot=kind == "reply")
+
+    def get_updates(self, count):
+        """
+        `count` updates de la mezcla MIX repartidos al azar entre los chats.
+        """
+        kinds, weights = zip(*MIX)
+        return [
+            self.synthetic(kind, self._random.choice(self.chat_ids))
+            for kind in self._random.choices(kinds, weights, k=count)
+        ]
+
+    def remap(self, recorded, count):
+        """
+        Repite los updates grabados hasta llegar a `count`, pasándolos a los chats de la carga
+        por turnos. Así una grabación de producción no toca los chats reales.
+        """
+        updates = []
+        for index, data in zip(range(count), itertools.cycle(recorded)):
+            data = copy.deepcopy(data)
+            _replace_chat_ids(data, self.chat_ids[index % len(self.chat_ids)])
+            data["update_id"] = next(self._update_ids)
+            updates.append(data)
+        return updates
+
+
+def _replace_chat_ids(data, chat_id):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == "chat" and isinstance(value, dict):
+                value["id"] = chat_id
+            else:
+                _replace_chat_ids(value, chat_id)
+    elif isinstance(data, list):
+        for value in data:
+            _replace_chat_ids(value, chat_id)
+
+
+def load_updates(paths):
+    """
+    Los updates grabados en `paths`. Cada archivo tiene un update, una lista de updates
+    o un update por línea.
+    """
+    updates = []
+    for path in paths:
+        with open(path) as updates_file:
+            content = updates_file.read()
+        try:
+            data = json.loads(content)
+        except ValueError:
+            updates.extend(
+                json.loads(line) for line in content.splitlines() if line.strip()
+            )
+            continue
+        updates.extend(data if isinstance(data, list) else [data])
+    return updates
+
+
+def delete_chats(chat_ids):
+    Meal.objects.filter(chat_id__in=chat_ids).delete()
+    Participant.objects.filter(chat_id__in=chat_ids).delete()
+    Skip.objects.filter(chat_id__in=chat_ids).delete()
+    OutboxMessage.objects.filter(chat_id__in=chat_ids).delete()
+    # Las señales borran sus ScheduledJob.
+    CocaSettings.objects.filter(chat_id__in=chat_ids).delete()
+
+
+@contextmanager
+def load_chats(count):
+    """
+    Crea `count` chats con participantes para la carga y los borra al terminar,
+    junto con todo lo que hayan creado los handlers y la media del bot falso.
+    """
+    chat_ids = [FIRST_CHAT_ID - index for index in range(count)]
+    fake_bot_id = FAKE_TOKEN.split(":")[0]
+    # Lo que haya quedado de una corrida que no terminó.
+    delete_chats(chat_ids)
+    try:
+        for chat_id in chat_ids:
+            CocaSettings.objects.create(
+                chat_id=chat_id,
+                reminder_hour_utc=14,
+                reminder_day=0,
+                history_resume_day=1,
+                random_run_probability=50,
+            )
+        Participant.objects.bulk_create(
+            [
+                Participant(chat_id=chat_id, name=name)
+                for chat_id in chat_ids
+                for name in NAMES
+            ]
+        )
+        yield chat_ids
+    finally:
+        delete_chats(chat_ids)
+        HistoryChart.objects.filter(bot_id=fake_bot_id).delete()
+        MediaFile.objects.filter(bot_id=fake_bot_id).delete()
+
+
+def build_dispatcher(api, telegram_limits=False, update_workers=None):
+    """
+    El Dispatcher y el QueuedBot de run_coca, con el bot hablándole a `api`.
+    Procesa los updates que llegan a su update_queue mientras corre dispatcher.start().
+    """
+    if telegram_limits:
+        rates = {
+            "global_rate": settings.OUTBOUND_GLOBAL_RATE,
+            "chat_rate": settings.OUTBOUND_CHAT_RATE,
+            "chat_burst": settings.OUTBOUND_CHAT_BURST,
+        }
+    else:
+        rates = {
+            "global_rate": UNLIMITED_RATE,
+            "chat_rate": UNLIMITED_RATE,
+            "chat_burst": UNLIMITED_RATE,
+        }
+    sender = OutboundSender(
+        max_retries=settings.OUTBOUND_MAX_RETRIES,
+        workers=settings.OUTBOUND_WORKERS,
+        **rates,
+    )
+    bot = run_coca.build_bot(sender, request=FakeRequest(api))
+    # CommandHandler necesita el username, se pide antes de medir.
+    bot.get_me()
+
+    return run_coca.build_dispatcher(bot, update_workers)
+
+
+def replay(dispatcher, updates, rate=0):
+    """
+    Pone `updates` en la update_queue del dispatcher, llegando a `rate` por segundo o todos juntos
+    si es 0, y espera a que se procesen. La latencia de cada update se cuenta desde que le tocaba
+    llegar hasta que terminaron sus handlers, incluida la espera detrás de los de su chat y de los
+    workers ocupados.
+    :return: Un dict con el throughput, la latencia, las queries y llamadas por update y cuántos
+        updates se procesaron antes que uno anterior de su chat.
+    """
+    update_metrics = HandlerMetrics()
+    latency = Histogram()
+    lock = threading.Lock()
+    errors = []
+    arrivals = {}
+    measurements = {}
+    last_update_ids = {}
+    out_of_order = 0
+    finished_at = None
+
+    def count_error(update, context):
+        with lock:
+            errors.append(context.error)
+
+    def started(update, context):
+        measurement = update_metrics.measure("update")
+        measurement.__enter__()
+        measurements[update.update_id] = measurement
+
+    def finished(update, context):
+        nonlocal out_of_order, finished_at
+        measurements.pop(update.update_id).__exit__(None, None, None)
+        finished_at = time.perf_counter()
+        chat_id = get_chat_id(update)
+        with lock:
+            latency.record(int((finished_at - arrivals[update.update_id]) * 1_000_000))
+            if update.update_id < last_update_ids.get(chat_id, 0):
+                out_of_order += 1
+            last_update_ids[chat_id] = update.update_id
+
+    # Antes y después de los grupos de los handlers de run_coca, que usan el 0.
+    timers = (
+        (TypeHandler(Update, started), -1),
+        (TypeHandler(Update, finished), 1),
+    )
+    dispatcher.add_error_handler(count_error)
+    for handler, group in timers:
+        dispatcher.add_handler(handler, group)
+
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=dispatcher.start, kwargs={"ready": ready}, name="replay_dispatcher"
+    )
+    thread.start()
+    # Un stop antes de que arranque no lo frenaría.
+    ready.wait()
+    started_at = time.perf_counter()
+    for index, data in enumerate(updates):
+        update = Update.de_json(data, dispatcher.bot)
+        arrived_at = time.perf_counter()
+        if rate:
+            arrived_at = started_at + index / rate
+            wait = arrived_at - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        arrivals[update.update_id] = arrived_at
+        dispatcher.update_queue.put(update)
+    # Termina de procesar lo que quedó en la cola antes de frenar.
+    dispatcher.stop()
+    thread.join()
+    elapsed = (finished_at or time.perf_counter()) - started_at
+
+    dispatcher.remove_error_handler(count_error)
+    for handler, group in timers:
+        dispatcher.remove_handler(handler, group)
+
+    record = update_metrics.snapshot().get("update")
+    count = record.latency.count if record else 0
+    return {
+        "updates": count,
+        "elapsed": round(elapsed, 3),
+        "updates_per_second": round(count / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            f"p{percent}": latency.percentile(percent) / 1000
+            for percent in (50, 95, 99)
+        },
+        "queries_per_update": {
+            "mean": round(record.queries.total / count, 2) if count else 0,
+            **{
+                f"p{percent}": record.queries.percentile(percent) if count else 0
+                for percent in (50, 95, 99)
+            },
+        },
+        "telegram_calls_per_update": (
+            round(record.telegram_calls / count, 2) if count else 0
+        ),
+        "telegram_errors": record.telegram_errors if count else 0,
+        "errors": len(errors),
+        "out_of_order": out_of_order,
+    }
+
+
+def run_replay(
+    recorded=None,
+    count=1000,
+    rate=0,
+    workers=8,
+    chats=10,
+    latency=0,
+    retry_after_rate=0,
+    telegram_limits=False,
+    seed=None,
+):
+    """
+    Corre una carga contra el bot con una Bot API falsa en memoria, en chats creados para eso.
+    :param recorded: Updates grabados, si no se usa la mezcla sintética MIX.
+    :param latency: Segundos que tarda cada pedido a la API falsa.
+    :return: Los resultados de replay.
+    """
+    api = FakeBotApi(
+        FAKE_TOKEN, latency=latency, retry_after_rate=retry_after_rate, seed=seed
+    )
+    with override_settings(TELEGRAM_TOKEN=FAKE_TOKEN), load_chats(chats) as chat_ids:
+        media_registry.clear()
+        dispatcher = build_dispatcher(api, telegram_limits, update_workers=workers)
+        dispatcher.bot.sender.start()
+        try:
+            factory = UpdateFactory(chat_ids, api.get_bot_user(), seed=seed)
+            # Cada chat arranca con comidas por hacer y hechas, como las que deja el recordatorio,
+            # así /proximas y /historial tienen qué mostrar.
+            replay(
+                dispatcher,
+                [factory.add_meal(chat_id) for chat_id in chat_ids for _ in range(4)],
+            )
+            for chat_id in chat_ids:
+                for _ in range(2):
+                    get_next_meal(chat_id)
+
+            if recorded:
+                updates = factory.remap(recorded, count)
+            else:
+                updates = factory.get_updates(count)
+            return replay(dispatcher, updates, rate=rate)
+        finally:
+            dispatcher.bot.sender.stop()
+            media_registry.clear()
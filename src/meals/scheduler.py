@@ -0,0 +1,121 @@
+import heapq
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from meals.decorators import close_db_connections, leader_only
+from meals.instrumentation import instrumented
+from meals.jobs import run_due_jobs
+from meals.models import ScheduledJob
+
+
+class EventQueue:
+    """
+    Cola de prioridad con la próxima corrida de cada job. Reprogramar un job no saca su entrada
+    vieja del heap: queda ahí y se descarta al salir, porque ya no es la última que se cargó.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._next_runs = {}
+        self._lock = threading.Lock()
+
+    def push(self, job_id, next_run_at):
+        with self._lock:
+            if next_run_at is None:
+                self._next_runs.pop(job_id, None)
+                return
+            if self._next_runs.get(job_id) == next_run_at:
+                return
+            self._next_runs[job_id] = next_run_at
+            heapq.heappush(self._heap, (next_run_at, job_id))
+
+    def pop_due(self, now):
+        """
+        Saca los jobs que tenían que correr hasta `now`, sin recorrer los demás.
+        :return: Los ids de los jobs, en el orden en que les tocaba.
+        """
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                next_run_at, job_id = heapq.heappop(self._heap)
+                if self._next_runs.get(job_id) == next_run_at:
+                    del self._next_runs[job_id]
+                    due.append(job_id)
+        return due
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._next_runs = {}
+
+    def __len__(self):
+        return len(self._next_runs)
+
+
+class JobScheduler:
+    """
+    Corre los ScheduledJob desde un heap en memoria con la próxima corrida de cada uno.
+    La primera vez carga todos los jobs y en cada tick solo los que cambiaron desde el anterior,
+    así el costo depende de los jobs que corren o cambian y no de cuántos chats hay.
+    Como los jobs los puede cambiar otra réplica, con otro reloj, se vuelven a leer los que
+    cambiaron hasta `sync_margin` segundos antes del último tick.
+    """
+
+    def __init__(self, sync_margin):
+        self.sync_margin = sync_margin
+        self.events = EventQueue()
+        self._synced_at = None
+
+    def sync(self, now):
+        jobs = ScheduledJob.objects.all()
+        if self._synced_at is not None:
+            jobs = jobs.filter(
+                updated_at__gte=self._synced_at - timedelta(seconds=self.sync_margin)
+            )
+        for job_id, next_run_at in jobs.values_list("id", "next_run_at"):
+            self.events.push(job_id, next_run_at)
+        self._synced_at = now
+
+    def tick(self, now=None):
+        """
+        :return: Cuántos jobs se corrieron.
+        """
+        now = now or timezone.now()
+        try:
+            self.sync(now)
+            due = self.events.pop_due(now)
+            if not due:
+                return 0
+            return run_due_jobs(now=now, job_ids=due)
+        except Exception:
+            # El heap puede haber perdido jobs que no llegaron a reprogramarse, se vuelve a cargar.
+            self.reset()
+            raise
+
+    def reset(self):
+        self.events.clear()
+        self._synced_at = None
+
+
+job_scheduler = JobScheduler(sync_margin=settings.SCHEDULER_SYNC_MARGIN)
+
+
+def run_scheduled_jobs(context):
+    job_scheduler.tick()
+
+
+def register_jobs(job_queue):
+    """
+    Registra en el JobQueue un solo job que corre los ScheduledJob que llegaron a su hora.
+    """
+    job_queue.run_repeating(
+        leader_only(
+            close_db_connections(
+                instrumented("job:run_scheduled_jobs")(run_scheduled_jobs)
+            )
+        ),
+        interval=settings.SCHEDULER_TICK_INTERVAL,
+        first=0,
+        name="run_scheduled_jobs",
+    )
@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from telegram.error import RetryAfter
+from meals.decorators import close_db_connections
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Permite `rate` envíos por segundo con ráfagas de hasta `capacity` envíos.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+
+    def get_wait(self):
+        """
+        Segundos que faltan para que haya un token disponible, 0 si ya hay uno.
+        """
+        self._refill()
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self._tokens -= 1
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+
+class OutboundMessage:
+    def __init__(self, send, args, kwargs):
+        self.send = send
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.future = Future()
+
+
+class OutboundSender:
+    """
+    Envía los mensajes a Telegram respetando un límite global y uno por chat.
+    Cada chat tiene su cola, así los mensajes de un chat salen en el orden en que se encolaron,
+    y los chats se atienden por turnos para que uno con muchos mensajes no frene al resto.
+    Hasta `workers` chats distintos envían a la vez, cada uno con un solo mensaje en vuelo.
+    Si Telegram contesta RetryAfter se pausan todos los envíos y se reintenta el mismo mensaje.
+    """
+
+    def __init__(
+        self,
+        global_rate,
+        chat_rate,
+        chat_burst,
+        max_retries,
+        workers=1,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.workers = workers
+        self._clock = clock
+        self._sleep = sleep
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._running = False
+        self.reset()
+
+    def reset(self):
+        with self._condition:
+            self._queues = OrderedDict()
+            self._global_bucket = TokenBucket(
+                self.global_rate, self.global_rate, self._clock
+            )
+            self._chat_buckets = {}
+            self._in_flight = set()
+            self._paused_until = 0
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="outbound_sender"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="outbound_sender", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+        # Lo que quedó encolado se envía antes de terminar.
+        self.flush()
+
+    def submit(self, chat_id, send, *args, **kwargs):
+        """
+        Encola `send(*args, **kwargs)` para el chat y devuelve un Future con su resultado.
+        Si el sender no está andando (tests, comandos de manage.py) se envía en este thread.
+        """
+        message = OutboundMessage(send, args, kwargs)
+        with self._condition:
+            self._queues.setdefault(chat_id, deque()).append(message)
+            self._condition.notify_all()
+            running = self._running
+
+        if not running:
+            self.flush()
+
+        return message.future
+
+    def flush(self):
+        """
+        Envía todo lo encolado en este thread, esperando lo que pidan los límites.
+        """
+        while True:
+            wait = self.process_next()
+            if wait is None:
+                return
+            if wait > 0:
+                self._sleep(wait)
+
+    def process_next(self):
+        """
+        Envía el próximo mensaje si los límites lo permiten.
+        :return: None si no hay nada para enviar, 0 si se envió un mensaje
+            o los segundos que hay que esperar para poder enviar el próximo.
+        """
+        with self._condition:
+            next_message = self._pop_next()
+
+        if not isinstance(next_message, tuple):
+            return next_message
+
+        self._deliver(*next_message)
+        return 0
+
+    def _pop_next(self):
+        """
+        Saca el próximo mensaje de un chat que no tenga otro en vuelo y lo marca en vuelo.
+        :return: (chat_id, mensaje), los segundos a esperar por los límites
+            o None si no hay nada que se pueda enviar hasta que termine otro envío.
+        """
+        if not self._queues or len(self._in_flight) >= self.workers:
+            return None
+
+        wait = max(self._paused_until - self._clock(), self._global_bucket.get_wait())
+        if wait > 0:
+            return wait
+
+        chat_waits = []
+        for chat_id, queue in self._queues.items():
+            if chat_id in self._in_flight:
+                continue
+            bucket = self._get_chat_bucket(chat_id)
+            chat_wait = bucket.get_wait()
+            if chat_wait == 0:
+                bucket.consume()
+                self._global_bucket.consume()
+                message = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(chat_id)
+                else:
+                    del self._queues[chat_id]
+                self._in_flight.add(chat_id)
+                return chat_id, message
+            chat_waits.append(chat_wait)
+
+        return min(chat_waits, default=None)
+
+    def _get_chat_bucket(self, chat_id):
+        if chat_id not in self._chat_buckets:
+            self._chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst, self._clock
+            )
+        return self._chat_buckets[chat_id]
+
+    def _deliver(self, chat_id, message):
+        try:
+            self._send(chat_id, message)
+        finally:
+            with self._condition:
+                self._in_flight.discard(chat_id)
+                self._condition.notify_all()
+
+    def _send(self, chat_id, message):
+        # El que encoló pudo cancelarlo mientras esperaba, ver meals.bot.wait_for_message.
+        if message.attempts == 0 and not message.future.set_running_or_notify_cancel():
+            return
+
+        message.attempts += 1
+        try:
+            result = message.send(*message.args, **message.kwargs)
+        except RetryAfter as e:
+            if message.attempts > self.max_retries:
+                logger.error(f"Se descarta un mensaje al chat {chat_id}: {e}")
+                message.future.set_exception(e)
+                return
+
+            logger.info(
+                f"Telegram pidió esperar {e.retry_after} segundos, se reintenta el mensaje al chat {chat_id}."
+            )
+            with self._condition:
+                self._paused_until = self._clock() + e.retry_after
+                # Vuelve al principio de su cola para no desordenar el chat.
+                self._queues.setdefault(chat_id, deque()).appendleft(message)
+                self._queues.move_to_end(chat_id, last=False)
+        except Exception as e:
+            message.future.set_exception(e)
+        else:
+            message.future.set_result(result)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                next_message = self._pop_next()
+                if not isinstance(next_message, tuple):
+                    # Sin nada para enviar espera a que se encole algo o termine un envío.
+                    self._condition.wait(next_message)
+                    continue
+
+            # Los callbacks de los envíos pueden usar la base desde estos threads.
+            self._executor.submit(close_db_connections(self._deliver), *next_message)
+
+
+outbound_sender = OutboundSender(
+    global_rate=settings.OUTBOUND_GLOBAL_RATE,
+    chat_rate=settings.OUTBOUND_CHAT_RATE,
+    chat_burst=settings.OUTBOUND_CHAT_BURST,
+    max_retries=settings.OUTBOUND_MAX_RETRIES,
+    workers=settings.OUTBOUND_WORKERS,
+)
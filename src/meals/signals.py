@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from meals.jobs import reschedule_chat_jobs
+from meals.models import CocaSettings, Participant, ScheduledJob, settings_cache
+
+
+@receiver(post_save, sender=CocaSettings)
+@receiver(post_delete, sender=CocaSettings)
+def invalidate_coca_settings(sender, instance, **kwargs):
+    # Se invalida ya, para que quien guardó vea su cambio, y de nuevo al commitear,
+    # por si otro thread recargó el valor anterior mientras la transacción seguía abierta.
+    settings_cache.invalidate(instance.chat_id)
+    transaction.on_commit(lambda: settings_cache.invalidate(instance.chat_id))
+
+
+@receiver(post_save, sender=CocaSettings)
+def reschedule_coca_settings_jobs(sender, instance, **kwargs):
+    reschedule_chat_jobs(instance)
+
+
+@receiver(post_delete, sender=CocaSettings)
+def delete_coca_settings_jobs(sender, instance, **kwargs):
+    ScheduledJob.objects.filter(chat_id=instance.chat_id).delete()
+
+
+@receiver(post_save, sender=Participant)
+def reschedule_birthdays_on_save(sender, instance, created, update_fields, **kwargs):
+    if created and instance.birthday is None:
+        return
+    if update_fields is not None and "birthday" not in update_fields:
+        return
+    _reschedule_birthdays(instance.chat_id)
+
+
+@receiver(post_delete, sender=Participant)
+def reschedule_birthdays_on_delete(sender, instance, **kwargs):
+    if instance.birthday is not None:
+        _reschedule_birthdays(instance.chat_id)
+
+
+def _reschedule_birthdays(chat_id):
+    # Participant.objects.update() y bulk_create no mandan señales, ahí hay que llamar
+    # a reschedule_chat_jobs.
+    coca_settings = CocaSettings.instance(chat_id)
+    if coca_settings is not None:
+        reschedule_chat_jobs(coca_settings, [ScheduledJob.SEND_BIRTHDAYS])
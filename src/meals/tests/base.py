@@ -1,35 +1,90 @@
+import json
+from os import path
 from unittest.mock import MagicMock
+from django.test import TestCase
+from meals.media import media_registry
+from meals.models import settings_cache
+
+
+class CocaTestCase(TestCase):
+    """
+    Limpia los caches del proceso, que no se enteran del rollback de cada test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        settings_cache.clear()
+        media_registry.clear()
+
+
+def get_mock_sent_photo(file_id="photo-file-id"):
+    message = MagicMock()
+    message.photo = [MagicMock(file_id=file_id)]
+    return message
+
+
+def get_mock_sent_audio(file_id="audio-file-id"):
+    message = MagicMock()
+    message.audio.file_id = file_id
+    return message
 
 
 class MockChat:
-    def __init__(self):
-        self.id = 1
+    def __init__(self, chat_id):
+        self.id = chat_id
 
 
 class MockMessage:
-    def __init__(self):
-        self.chat = MockChat()
+    def __init__(self, chat_id):
+        self.chat = MockChat(chat_id)
         self.reply_text = MagicMock()
-        self.reply_photo = MagicMock()
-        self.reply_audio = MagicMock()
+        self.reply_photo = MagicMock(return_value=get_mock_sent_photo())
+        self.reply_audio = MagicMock(return_value=get_mock_sent_audio())
 
 
-def get_mock_update(args=[]):
+def get_mock_update(args=[], chat_id=1):
     class MockUpdate:
         def __init__(self):
-            self.message = MockMessage()
+            self.message = MockMessage(chat_id)
+            self.effective_message = self.message
+            self.effective_chat = self.message.chat
             self.args = args
 
     return MockUpdate()
 
 
-def get_mock_context(args=[]):
+def get_mock_callback_update(data, chat_id=1):
+    class MockCallbackQuery:
+        def __init__(self):
+            self.data = data
+            self.message = MockMessage(chat_id)
+            self.answer = MagicMock()
+            self.edit_message_text = MagicMock()
+
+    class MockUpdate:
+        def __init__(self):
+            self.message = None
+            self.callback_query = MockCallbackQuery()
+            self.effective_message = self.callback_query.message
+            self.effective_chat = self.callback_query.message.chat
+
+    return MockUpdate()
+
+
+def get_mock_context(args=[], chat_id=1):
     class MockContext:
         def __init__(self):
             self.bot = MagicMock()
             self.args = args
             self.bot.send_message = MagicMock()
-            self.bot.send_photo = MagicMock()
+            self.bot.send_photo = MagicMock(return_value=get_mock_sent_photo())
             self.job_queue = MagicMock()
+            self.job = MagicMock()
+            self.job.context = chat_id
 
     return MockContext()
+
+
+def get_recorded_update(name):
+    with open(path.join(path.dirname(__file__), "updates", f"{name}.json")) as update:
+        return json.load(update)
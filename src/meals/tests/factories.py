@@ -7,6 +7,7 @@ class ParticipantFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Participant
 
+    chat_id = 1
     name = "John"
 
 
@@ -14,6 +15,7 @@ class MealFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Meal
 
+    chat_id = 1
     done = False
     done_at = None
     created_at = factory.LazyFunction(datetime.now)
@@ -31,3 +33,5 @@ class MealItemFactory(factory.django.DjangoModelFactory):
 class SkipFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Skip
+
+    chat_id = 1
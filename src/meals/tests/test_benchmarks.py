@@ -0,0 +1,74 @@
+import json
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+
+from meals.benchmarks import find_regressions
+from meals.tests.base import CocaTestCase
+
+
+def get_results(database="sqlite", median_ms=2.0, p95_ms=3.0, queries=2):
+    return {
+        "views_1k": {
+            "database": database,
+            "history": {"median_ms": median_ms, "p95_ms": p95_ms, "queries": queries},
+        }
+    }
+
+
+class FindRegressionsTest(CocaTestCase):
+    def get_regressions(self, baseline_ms=2.0, **results):
+        return find_regressions(
+            get_results(**results), get_results(median_ms=baseline_ms), 0.5
+        )
+
+    def test_times_within_tolerance_or_noise_are_not_regressions(self):
+        self.assertEqual([], self.get_regressions(median_ms=2.9, p95_ms=30.0))
+        self.assertEqual([], self.get_regressions(baseline_ms=0.1, median_ms=0.3))
+
+    def test_slower_times_more_queries_and_other_database_are_regressions(self):
+        self.assertEqual(
+            ["views_1k.history.median_ms: 2.0 en el baseline, ahora 3.5"],
+            self.get_regressions(median_ms=3.5),
+        )
+        self.assertEqual(
+            ["views_1k.history.queries: 2 en el baseline, ahora 3"],
+            self.get_regressions(queries=3),
+        )
+        self.assertEqual(
+            ["views_1k.database: sqlite en el baseline, ahora postgresql"],
+            self.get_regressions(database="postgresql"),
+        )
+
+
+class BenchmarkCommandTest(CocaTestCase):
+    def test_fails_when_queries_grow_over_the_baseline(self):
+        with TemporaryDirectory() as directory:
+            output = path.join(directory, "output.json")
+            call_command(
+                "benchmark",
+                "views_1k",
+                iterations=2,
+                output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as output_file:
+                results = json.load(output_file)
+            self.assertEqual(connection.vendor, results["views_1k"]["database"])
+
+            results["views_1k"]["history"]["queries"] -= 1
+            baseline = path.join(directory, "baseline.json")
+            with open(baseline, "w") as baseline_file:
+                json.dump(results, baseline_file)
+
+            with self.assertRaises(CommandError):
+                call_command(
+                    "benchmark",
+                    "views_1k",
+                    iterations=2,
+                    baseline=baseline,
+                    stdout=StringIO(),
+                )
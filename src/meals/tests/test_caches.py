@@ -0,0 +1,96 @@
+import threading
+from django.test import override_settings
+
+from meals.caches import KeyedCache
+from meals.handlers import change_reminder_handler
+from meals.models import CocaSettings, settings_cache
+from meals.tests.base import CocaTestCase, get_mock_context, get_mock_update
+
+
+class SettingsCacheTest(CocaTestCase):
+    def test_instance_is_cached(self):
+        CocaSettings.instance(1)
+
+        with self.assertNumQueries(0):
+            setting = CocaSettings.instance(1)
+
+        self.assertEqual(1, setting.chat_id)
+        self.assertEqual({"hits": 1, "misses": 1, "size": 1}, settings_cache.stats())
+
+    def test_unknown_chat_is_cached(self):
+        self.assertIsNone(CocaSettings.instance(2))
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(CocaSettings.instance(2))
+
+    def test_save_invalidates(self):
+        setting = CocaSettings.instance(1)
+        setting.random_run_probability = 10
+        setting.save()
+
+        self.assertEqual(10, CocaSettings.instance(1).random_run_probability)
+
+    def test_create_and_delete_invalidate(self):
+        self.assertIsNone(CocaSettings.instance(2))
+
+        setting = CocaSettings.objects.create(
+            chat_id=2,
+            reminder_hour_utc=14,
+            reminder_day=0,
+            history_resume_day=1,
+            random_run_probability=50,
+        )
+        self.assertEqual(setting.pk, CocaSettings.instance(2).pk)
+
+        setting.delete()
+        self.assertIsNone(CocaSettings.instance(2))
+
+    def test_instances_are_copies(self):
+        setting = CocaSettings.instance(1)
+        setting.reminder_day = 5
+
+        self.assertNotEqual(5, CocaSettings.instance(1).reminder_day)
+
+    @override_settings(CHAT_ID=1)
+    def test_change_reminder_sees_its_own_write(self):
+        setting = CocaSettings.instance(1)
+        setting.reminder_day = 2
+        setting.save()
+
+        change_reminder_handler(get_mock_update(), get_mock_context(["lunes"]))
+
+        self.assertEqual(0, CocaSettings.instance(1).reminder_day)
+
+
+class KeyedCacheTest(CocaTestCase):
+    def test_concurrent_gets_load_consistent_values(self):
+        loads = []
+
+        def loader(key):
+            loads.append(key)
+            return {"key": key}
+
+        cache = KeyedCache(loader)
+        results = []
+
+        def worker():
+            for key in range(50):
+                results.append(cache.get(key % 5)["key"] == key % 5)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(results))
+        stats = cache.stats()
+        self.assertEqual(400, stats["hits"] + stats["misses"])
+        self.assertEqual(len(loads), stats["misses"])
+        self.assertEqual(5, stats["size"])
+
+    def test_invalidate_during_load_is_not_stored(self):
+        cache = KeyedCache(lambda key: cache.invalidate(key) or "viejo")
+
+        self.assertEqual("viejo", cache.get(1))
+        self.assertEqual(0, cache.stats()["size"])
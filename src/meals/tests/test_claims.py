@@ -0,0 +1,118 @@
+import threading
+from django.db import connection
+from django.test import TransactionTestCase
+
+from meals.exceptions import NoMealConfigured
+from meals.models import Meal, ParticipantCounter, Skip, settings_cache
+from meals.tests.base import CocaTestCase
+from meals.tests.factories import MealFactory, MealItemFactory, ParticipantFactory
+from meals.views import get_next_meal, get_skip, resolve_meal
+
+CLAIMERS = 8
+
+
+def claim_all(claim):
+    """
+    Corre `claim` en CLAIMERS threads a la vez, cada uno con su conexión,
+    hasta que devuelva None. Devuelve todo lo que reclamaron.
+    """
+    claimed = []
+    errors = []
+    barrier = threading.Barrier(CLAIMERS, timeout=5)
+
+    def claimer():
+        try:
+            barrier.wait()
+            while True:
+                obj = claim()
+                if obj is None:
+                    return
+                claimed.append(obj)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=claimer) for _ in range(CLAIMERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return claimed
+
+
+def claim_next_meal():
+    try:
+        meal, _ = get_next_meal(1)
+    except NoMealConfigured:
+        return None
+    return meal
+
+
+class ConcurrentClaimsTest(TransactionTestCase):
+    # La migración 0012 crea la configuración, hay que restaurarla después de vaciar las tablas.
+    serialized_rollback = True
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest(
+                "La base en memoria de SQLite no deja escribir desde varios threads, hace falta TEST NAME."
+            )
+        settings_cache.clear()
+
+    def test_each_meal_is_claimed_once(self):
+        participant = ParticipantFactory()
+        meals = [MealFactory() for _ in range(40)]
+        for meal in meals:
+            MealItemFactory(meal=meal, owner=participant)
+
+        claimed = claim_all(claim_next_meal)
+
+        self.assertEqual(
+            sorted(meal.id for meal in meals), sorted(meal.id for meal in claimed)
+        )
+        self.assertFalse(Meal.objects.filter(done=False).exists())
+        self.assertEqual(40, ParticipantCounter.objects.get().total_meals)
+
+    def test_meals_resolved_concurrently_count_once(self):
+        participant = ParticipantFactory()
+        meals = [MealFactory() for _ in range(10)]
+        for meal in meals:
+            MealItemFactory(meal=meal, owner=participant)
+
+        def resolve_all():
+            for meal in meals:
+                resolve_meal(1, meal.id)
+            claim_next_meal()
+
+        claim_all(resolve_all)
+
+        self.assertFalse(Meal.objects.filter(done=False).exists())
+        self.assertEqual(10, ParticipantCounter.objects.get().total_meals)
+
+    def test_each_skip_is_consumed_once(self):
+        skips = [Skip.objects.create(chat_id=1) for _ in range(40)]
+
+        claimed = claim_all(lambda: get_skip(1))
+
+        self.assertEqual(
+            sorted(skip.id for skip in skips), sorted(skip.id for skip in claimed)
+        )
+        self.assertFalse(Skip.objects.exists())
+
+
+class MealClaimTest(CocaTestCase):
+    def test_stale_meal_is_not_claimed_again(self):
+        meal = MealFactory()
+        MealItemFactory(meal=meal)
+        stale_meal = Meal.objects.get(id=meal.id)
+
+        self.assertTrue(meal.claim())
+        self.assertFalse(stale_meal.claim())
+
+        self.assertFalse(stale_meal.done)
+        self.assertEqual(1, ParticipantCounter.objects.get().total_meals)
@@ -1,6 +1,6 @@
-from datetime import datetime, timedelta
-from unittest.mock import patch, MagicMock
-from django.test import TestCase, override_settings
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+from django.test import override_settings
 from django.utils import timezone
 
 from meals.formatters import format_meal_with_date
@@ -15,8 +15,18 @@ from meals.handlers import (
     previous_meals_handler,
     change_reminder_handler,
 )
-from meals.models import Meal, MealItem, Participant, Skip, CocaSettings
-from meals.tests.base import get_mock_context, get_mock_update
+from meals.handlers.commands_user import (
+    next_meals_page_handler,
+    send_meal_created_message,
+)
+from meals.jobs import sync_scheduled_jobs
+from meals.models import Meal, MealItem, Participant, ScheduledJob, Skip, CocaSettings
+from meals.tests.base import (
+    CocaTestCase,
+    get_mock_callback_update,
+    get_mock_context,
+    get_mock_update,
+)
 from meals.tests.factories import (
     MealFactory,
     MealItemFactory,
@@ -24,7 +34,7 @@ from meals.tests.factories import (
 )
 
 
-class CommandsTest(TestCase):
+class CommandsTest(CocaTestCase):
     @override_settings(CHAT_ID=1)
     def test_add_meal_handler(self, *args):
         ParticipantFactory(name="test")
@@ -36,9 +46,43 @@ class CommandsTest(TestCase):
         self.assertEquals(0, Meal.objects.count())
         self.assertEquals(2, Participant.objects.count())
         update.message.reply_text.assert_called_once_with(
-            "Hay usuarios inválidos, los válidos son:\n\\- test\n\\- test2"
+            "Hay usuarios inválidos: name\\. Los válidos son:\n\\- test\n\\- test2"
         )
 
+    @override_settings(CHAT_ID=1)
+    def test_add_meal_handler_reports_all_unknown_names(self):
+        ParticipantFactory(name="test")
+        context = get_mock_context(
+            ["ana", "meal,", "test", "other meal,", "juan.p", "dessert,", "Ana", "flan"]
+        )
+        update = get_mock_update()
+        CocaSettings.instance(1)
+
+        with self.assertNumQueries(1):
+            add_meal_handler(update, context)
+
+        self.assertEquals(0, Meal.objects.count())
+        update.message.reply_text.assert_called_once_with(
+            "Hay usuarios inválidos: ana, juan\\.p, Ana\\. Los válidos son:\n\\- test"
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_add_meal_handler_query_count_does_not_grow_with_items(self):
+        ParticipantFactory(name="test")
+        ParticipantFactory(name="test2")
+        items = [
+            f"{'test' if index % 2 else 'Test2'} meal {index}" for index in range(10)
+        ]
+        context = get_mock_context(", ".join(items).split(" "))
+        update = get_mock_update()
+        CocaSettings.instance(1)
+
+        # Participantes, savepoint, comida, items, release y el mensaje con los items.
+        with self.assertNumQueries(6):
+            add_meal_handler(update, context)
+
+        self.assertEquals(10, MealItem.objects.count())
+
     @override_settings(CHAT_ID=1)
     def test_meal_is_added_existing_participant(self):
         ParticipantFactory(name="existing")
@@ -76,10 +120,10 @@ class CommandsTest(TestCase):
             "Para que pueda agregar necesito que me pases un nombre y una comida\\."
         )
 
-    @override_settings(CHAT_ID=2)
+    @override_settings(CHAT_ID=1)
     def test_add_meal_handler_unknown_chat(self, *args):
         context = get_mock_context([1, 2])
-        update = get_mock_update()
+        update = get_mock_update(chat_id=2)
         add_meal_handler(update, context)
 
         update.message.reply_photo.assert_called_once_with(
@@ -143,7 +187,7 @@ class CommandsTest(TestCase):
             "El historial es: \n\n\\- *test1* compró para `2` comidas\\.\n\\- *test2* compró para `1` comida\\."
         )
 
-    @override_settings(CHAT_ID=2, DEVELOPER_CHAT_ID=1)
+    @override_settings(CHAT_ID=1, DEVELOPER_CHAT_ID=3)
     def test_history_handler_unknown_chat(self, *args):
         p1 = ParticipantFactory(name="test1")
         p2 = ParticipantFactory(name="test2")
@@ -152,13 +196,115 @@ class CommandsTest(TestCase):
         MealItemFactory(meal=MealFactory(done=True), owner=p1)
         MealItemFactory(meal=MealFactory(done=True), owner=p2)
         context = get_mock_context()
-        update = get_mock_update()
+        update = get_mock_update(chat_id=3)
         history_handler(update, context)
 
         update.message.reply_text.assert_called_once_with(
             "El historial es: \n\n\\- *test1* compró para `2` comidas\\.\n\\- *test2* compró para `1` comida\\."
         )
 
+    @override_settings(CHAT_ID=1)
+    def test_history_handler_ignores_other_chats(self, *args):
+        p1 = ParticipantFactory(name="test1")
+        p2 = ParticipantFactory(name="test2", chat_id=2)
+
+        MealItemFactory(meal=MealFactory(done=True), owner=p1)
+        MealItemFactory(meal=MealFactory(done=True, chat_id=2), owner=p2)
+        context = get_mock_context()
+        update = get_mock_update()
+        history_handler(update, context)
+
+        update.message.reply_text.assert_called_once_with(
+            "El historial es: \n\n\\- *test1* compró para `1` comida\\."
+        )
+
+    @override_settings(CHAT_ID=1)
+    @patch(
+        "meals.handlers.commands_user.timezone.now",
+        side_effect=lambda: datetime.strptime(
+            "2022-04-20 15:27:05.004573 -0300", "%Y-%m-%d %H:%M:%S.%f %z"
+        ),
+    )
+    def test_history_handler_windows(self, *args):
+        p1 = ParticipantFactory(name="test1")
+        p2 = ParticipantFactory(name="test2")
+        MealItemFactory(
+            meal=MealFactory(done=True, done_at=date(2021, 12, 1)), owner=p1
+        )
+        MealItemFactory(
+            meal=MealFactory(done=True, done_at=date(2022, 2, 28)), owner=p2
+        )
+        MealItemFactory(meal=MealFactory(done=True, done_at=date(2022, 4, 2)), owner=p1)
+
+        for args, expected in [
+            (
+                ["mes"],
+                "El historial del mes es: \n\n\\- *test1* compró para `1` comida\\.",
+            ),
+            (
+                ["año"],
+                "El historial del año es: \n\n\\- *test1* compró para `1` comida\\.\n\\- *test2* compró para `1` comida\\.",
+            ),
+            (
+                ["8", "semanas"],
+                "El historial de las últimas 8 semanas, desde el 1 de febrero, es: \n\n\\- *test1* compró para `1` comida\\.\n\\- *test2* compró para `1` comida\\.",
+            ),
+        ]:
+            update = get_mock_update()
+            history_handler(update, get_mock_context(args))
+
+            update.message.reply_text.assert_called_once_with(expected)
+
+    @override_settings(CHAT_ID=1)
+    def test_history_handler_empty_window(self, *args):
+        MealItemFactory(meal=MealFactory(done=True, done_at=date(2021, 12, 1)))
+        update = get_mock_update()
+
+        history_handler(update, get_mock_context(["mes"]))
+
+        update.message.reply_text.assert_called_once_with(
+            "No hay comidas en ese período\\."
+        )
+        update.message.reply_photo.assert_not_called()
+
+    @override_settings(CHAT_ID=1)
+    def test_history_handler_invalid_window(self, *args):
+        update = get_mock_update()
+
+        history_handler(update, get_mock_context(["semanas"]))
+
+        update.message.reply_text.assert_called_once_with(
+            "Podes ver el historial completo, del `mes`, del `año` o de las últimas `N semanas`\\."
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_history_handler_too_many_weeks(self, *args):
+        update = get_mock_update()
+
+        history_handler(update, get_mock_context(["99999999", "semanas"]))
+
+        update.message.reply_text.assert_called_once_with(
+            "Podes ver el historial completo, del `mes`, del `año` o de las últimas `N semanas`\."
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_skip_handler_other_configured_chat(self, *args):
+        CocaSettings.objects.create(
+            chat_id=2,
+            reminder_hour_utc=14,
+            reminder_day=0,
+            history_resume_day=1,
+            random_run_probability=50,
+        )
+        context = get_mock_context()
+        update = get_mock_update(chat_id=2)
+        skip_handler(update, context)
+
+        self.assertEquals(2, Skip.objects.get().chat_id)
+        update.message.reply_text.assert_called_once_with(
+            "Perfecto, me salteo una comida\\."
+        )
+
     @override_settings(CHAT_ID=1)
     def test_skip_handler(self, *args):
         context = get_mock_context()
@@ -170,10 +316,10 @@ class CommandsTest(TestCase):
             "Perfecto, me salteo una comida\\."
         )
 
-    @override_settings(CHAT_ID=2)
+    @override_settings(CHAT_ID=1)
     def test_skip_handler_unknown_chat(self, *args):
         context = get_mock_context()
-        update = get_mock_update()
+        update = get_mock_update(chat_id=2)
         skip_handler(update, context)
 
         update.message.reply_photo.assert_called_once_with(
@@ -225,6 +371,148 @@ martes 12 de abril _\\(id: {meal.id}\\)_
 
 martes 19 de abril _\\(id: {meal2.id}\\)_
 \t\\- `test meal4` a cargo de *test name4*""",
+            reply_markup=None,
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_next_meals_handler_query_count(self, *args):
+        for index in range(10):
+            meal = MealFactory()
+            MealItemFactory(meal=meal, owner=ParticipantFactory(name=f"test{index}"))
+            MealItemFactory(meal=meal, owner=ParticipantFactory(name=f"other{index}"))
+        CocaSettings.instance(1)
+        context = get_mock_context()
+        update = get_mock_update()
+
+        with self.assertNumQueries(2):
+            next_meals_handler(update, context)
+
+        self.assertEqual(
+            20, update.message.reply_text.call_args.args[0].count("a cargo de")
+        )
+
+    def create_meals(self, count):
+        meals = []
+        for index in range(count):
+            meal = MealFactory()
+            MealItemFactory(
+                meal=meal,
+                owner=ParticipantFactory(name=f"test{index}"),
+                description=f"meal{index}",
+            )
+            meals.append(meal)
+        return meals
+
+    def get_buttons(self, keyboard):
+        return [
+            (button.text, button.callback_data)
+            for button in keyboard.inline_keyboard[0]
+        ]
+
+    @override_settings(CHAT_ID=1)
+    def test_next_meals_handler_first_page(self, *args):
+        meals = self.create_meals(25)
+        context = get_mock_context()
+        update = get_mock_update()
+        next_meals_handler(update, context)
+
+        message = update.message.reply_text.call_args.args[0]
+        keyboard = update.message.reply_text.call_args.kwargs["reply_markup"]
+        self.assertEqual(10, message.count("a cargo de"))
+        self.assertIn("`meal9`", message)
+        self.assertNotIn("`meal10`", message)
+        self.assertEqual(
+            [("Siguientes »", f"proximas:after:{meals[9].id}:10")],
+            self.get_buttons(keyboard),
+        )
+
+    @override_settings(CHAT_ID=1)
+    @patch(
+        "meals.handlers.utils.timezone.now",
+        side_effect=lambda: datetime.strptime(
+            "2022-04-02 15:27:05.004573 -0300", "%Y-%m-%d %H:%M:%S.%f %z"
+        ),
+    )
+    def test_next_meals_page_handler_middle_page(self, *args):
+        meals = self.create_meals(25)
+        CocaSettings.instance(1)
+        context = get_mock_context()
+        update = get_mock_callback_update(f"proximas:after:{meals[9].id}:10")
+
+        with self.assertNumQueries(2):
+            next_meals_page_handler(update, context)
+
+        update.callback_query.answer.assert_called_once()
+        message = update.callback_query.edit_message_text.call_args.args[0]
+        keyboard = update.callback_query.edit_message_text.call_args.kwargs[
+            "reply_markup"
+        ]
+        self.assertEqual(10, message.count("a cargo de"))
+        self.assertIn(f"martes 14 de junio _\\(id: {meals[10].id}\\)_", message)
+        self.assertIn("`meal19`", message)
+        self.assertEqual(
+            [
+                ("« Anteriores", f"proximas:before:{meals[10].id}:10"),
+                ("Siguientes »", f"proximas:after:{meals[19].id}:20"),
+            ],
+            self.get_buttons(keyboard),
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_next_meals_page_handler_last_page(self, *args):
+        meals = self.create_meals(25)
+        context = get_mock_context()
+        update = get_mock_callback_update(f"proximas:after:{meals[19].id}:20")
+        next_meals_page_handler(update, context)
+
+        message = update.callback_query.edit_message_text.call_args.args[0]
+        keyboard = update.callback_query.edit_message_text.call_args.kwargs[
+            "reply_markup"
+        ]
+        self.assertEqual(5, message.count("a cargo de"))
+        self.assertEqual(
+            [("« Anteriores", f"proximas:before:{meals[20].id}:20")],
+            self.get_buttons(keyboard),
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_next_meals_page_handler_previous_page(self, *args):
+        meals = self.create_meals(25)
+        context = get_mock_context()
+        update = get_mock_callback_update(f"proximas:before:{meals[10].id}:10")
+        next_meals_page_handler(update, context)
+
+        message = update.callback_query.edit_message_text.call_args.args[0]
+        keyboard = update.callback_query.edit_message_text.call_args.kwargs[
+            "reply_markup"
+        ]
+        self.assertIn("`meal0`", message)
+        self.assertIn("`meal9`", message)
+        self.assertEqual(
+            [("Siguientes »", f"proximas:after:{meals[9].id}:10")],
+            self.get_buttons(keyboard),
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_next_meals_page_handler_meals_resolved(self, *args):
+        meals = self.create_meals(3)
+        context = get_mock_context()
+        update = get_mock_callback_update(f"proximas:after:{meals[2].id}:3")
+        next_meals_page_handler(update, context)
+
+        update.callback_query.edit_message_text.assert_called_once_with(
+            "No hay próximas comidas\\."
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_next_meals_page_handler_unknown_chat(self, *args):
+        context = get_mock_context()
+        update = get_mock_callback_update("proximas:after:1:10", chat_id=2)
+        next_meals_page_handler(update, context)
+
+        update.callback_query.edit_message_text.assert_not_called()
+        update.effective_message.reply_photo.assert_called_once_with(
+            "https://pbs.twimg.com/media/E8ozthsWQAMproa.jpg"
         )
 
     @override_settings(CHAT_ID=1)
@@ -235,10 +523,10 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
 
         update.message.reply_text.assert_called_once_with("No hay próximas comidas\\.")
 
-    @override_settings(CHAT_ID=2, DEVELOPER_CHAT_ID=1)
+    @override_settings(CHAT_ID=1, DEVELOPER_CHAT_ID=3)
     def test_next_meals_handler_unknown_chat(self, *args):
         context = get_mock_context()
-        update = get_mock_update()
+        update = get_mock_update(chat_id=3)
         next_meals_handler(update, context)
 
         update.message.reply_text.assert_called_once_with("No hay próximas comidas\\.")
@@ -268,6 +556,19 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
             "Nada que borrar, no hay comida con id 1\\.",
         )
 
+    @override_settings(CHAT_ID=1)
+    def test_delete_meal_handler_other_chat(self, *args):
+        meal_item = MealItemFactory(meal=MealFactory(chat_id=2))
+
+        context = get_mock_context([meal_item.meal.id])
+        update = get_mock_update()
+        delete_meal_handler(update, context)
+
+        self.assertEquals(1, Meal.objects.count())
+        update.message.reply_text.assert_called_once_with(
+            f"Nada que borrar, no hay comida con id {meal_item.meal.id}\\.",
+        )
+
     @override_settings(CHAT_ID=1)
     def test_delete_meal_handler_invalid_id(self, *args):
         context = get_mock_context(["asd"])
@@ -278,10 +579,10 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
             "Para borrar necesito un id\\. Podes ver el id usando \\/proximas\\."
         )
 
-    @override_settings(CHAT_ID=2)
+    @override_settings(CHAT_ID=1)
     def test_delete_meal_handler_unknown_chat(self, *args):
         context = get_mock_context()
-        update = get_mock_update()
+        update = get_mock_update(chat_id=2)
         delete_meal_handler(update, context)
 
         update.message.reply_photo.assert_called_once_with(
@@ -325,10 +626,10 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
             "Para resolver necesito un id\\. Podes ver el id usando \\/proximas\\."
         )
 
-    @override_settings(CHAT_ID=2)
+    @override_settings(CHAT_ID=1)
     def test_resolve_meal_handler_unknown_chat(self, *args):
         context = get_mock_context()
-        update = get_mock_update()
+        update = get_mock_update(chat_id=2)
         resolve_meal_handler(update, context)
 
         update.message.reply_photo.assert_called_once_with(
@@ -387,6 +688,23 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
 \t\\- `test meal2` a cargo de *test name2*""",
         )
 
+    @override_settings(CHAT_ID=1)
+    def test_previous_meals_handler_query_count(self, *args):
+        for index in range(10):
+            meal = MealFactory(done=True, done_at=datetime.now())
+            MealItemFactory(meal=meal, owner=ParticipantFactory(name=f"test{index}"))
+            MealItemFactory(meal=meal, owner=ParticipantFactory(name=f"other{index}"))
+        CocaSettings.instance(1)
+        context = get_mock_context()
+        update = get_mock_update()
+
+        with self.assertNumQueries(2):
+            previous_meals_handler(update, context)
+
+        self.assertEqual(
+            10, update.message.reply_text.call_args.args[0].count("a cargo de")
+        )
+
     @override_settings(CHAT_ID=1)
     def test_previous_meals_handler_no_meals(self, *args):
         context = get_mock_context()
@@ -395,10 +713,10 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
 
         update.message.reply_text.assert_called_once_with("No hay últimas comidas\\.")
 
-    @override_settings(CHAT_ID=2, DEVELOPER_CHAT_ID=1)
+    @override_settings(CHAT_ID=1, DEVELOPER_CHAT_ID=3)
     def test_previous_meals_handler_unknown_chat(self, *args):
         context = get_mock_context()
-        update = get_mock_update()
+        update = get_mock_update(chat_id=3)
         previous_meals_handler(update, context)
 
         update.message.reply_text.assert_called_once_with("No hay últimas comidas\\.")
@@ -431,6 +749,26 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
             "Ahí agregué la comida:\n\\- `test meal` a cargo de *other*\n\\- `test meal2` a cargo de *other2*"
         )
 
+    @override_settings(CHAT_ID=1)
+    def test_add_meal_handler_message_query_count(self, *args):
+        names = [f"test{index}" for index in range(5)]
+        for name in names:
+            ParticipantFactory(name=name)
+        CocaSettings.instance(1)
+        update = get_mock_update()
+        meal = MealFactory()
+        for name in names:
+            MealItemFactory(meal=meal, owner=Participant.objects.get(name=name))
+
+        meal = Meal.objects.get()
+
+        with self.assertNumQueries(1):
+            send_meal_created_message(meal, update)
+
+        self.assertEqual(
+            5, update.message.reply_text.call_args.args[0].count("a cargo de")
+        )
+
     @override_settings(CHAT_ID=1)
     def test_copy_meal_handler_no_more_participants(self, *args):
         participant1 = ParticipantFactory(name="other")
@@ -476,10 +814,10 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
             "Para copiar necesito un id\\. Podes ver el id usando \\/proximas\\."
         )
 
-    @override_settings(CHAT_ID=2)
+    @override_settings(CHAT_ID=1)
     def test_copy_meal_handler_unknown_chat(self, *args):
         context = get_mock_context()
-        update = get_mock_update()
+        update = get_mock_update(chat_id=2)
         copy_meal_handler(update, context)
 
         update.message.reply_photo.assert_called_once_with(
@@ -488,7 +826,7 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
 
     @override_settings(CHAT_ID=1)
     def test_change_reminder(self, *args):
-        setting = CocaSettings.instance()
+        setting = CocaSettings.instance(1)
         setting.reminder_day = 2
         setting.save()
         context = get_mock_context(["lunes"])
@@ -504,7 +842,7 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
 
     @override_settings(CHAT_ID=1)
     def test_change_reminder_uppercase_day(self, *args):
-        setting = CocaSettings.instance()
+        setting = CocaSettings.instance(1)
         setting.reminder_day = 2
         setting.save()
         context = get_mock_context(["luNes"])
@@ -541,45 +879,34 @@ martes 19 de abril _\\(id: {meal2.id}\\)_
         )
 
     @override_settings(CHAT_ID=1)
-    def test_change_reminder_removes_current_job(self, *args):
+    def test_change_reminder_reschedules_job(self, *args):
+        sync_scheduled_jobs()
         context = get_mock_context(["jueves"])
-        job = MagicMock()
-        job.schedule_removal = MagicMock()
-        context.job_queue.get_jobs_by_name.return_value = (job,)
         update = get_mock_update()
 
-        with patch(
-            "meals.handlers.commands_user.register_send_reminder_daily"
-        ) as register_mock:
-
-            change_reminder_handler(update, context)
-            setting = CocaSettings.instance()
+        change_reminder_handler(update, context)
 
-            register_mock.assert_called_once_with(
-                context.job_queue, setting.reminder_day, setting.reminder_hour_utc, 0
-            )
-            job.schedule_removal.assert_called_once()
+        job = ScheduledJob.objects.get(name="send_reminder_1")
+        self.assertEqual(3, job.next_run_at.weekday())
+        self.assertGreater(job.next_run_at, timezone.now())
 
     @override_settings(CHAT_ID=1)
     def test_change_reminder_to_the_same_day_does_not_reschedules_job(self, *args):
-        setting = CocaSettings.instance()
+        setting = CocaSettings.instance(1)
         setting.reminder_day = 2
         setting.save()
+        sync_scheduled_jobs()
+        next_run_at = timezone.now()
+        ScheduledJob.objects.update(next_run_at=next_run_at)
 
         context = get_mock_context(["miercoles"])
-        job = MagicMock()
-        job.schedule_removal = MagicMock()
-        context.job_queue.get_jobs_by_name.return_value = (job,)
         update = get_mock_update()
 
-        with patch(
-            "meals.handlers.commands_user.register_send_reminder_daily"
-        ) as register_mock:
-
-            change_reminder_handler(update, context)
+        change_reminder_handler(update, context)
 
-            register_mock.assert_not_called()
-            job.schedule_removal.assert_not_called()
-            update.message.reply_text.assert_called_once_with(
-                "El recordatorio ya estaba configurado para el día miercoles\\."
-            )
+        self.assertEqual(
+            next_run_at, ScheduledJob.objects.get(name="send_reminder_1").next_run_at
+        )
+        update.message.reply_text.assert_called_once_with(
+            "El recordatorio ya estaba configurado para el día miercoles\\."
+        )
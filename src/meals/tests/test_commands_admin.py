@@ -1,70 +1,178 @@
-from unittest.mock import MagicMock, call
-from django.test import TestCase, override_settings
+from datetime import datetime, timezone
+from django.test import override_settings
+from telegram.constants import MAX_MESSAGE_LENGTH
 
+from unittest.mock import patch
 from meals.handlers.commands_admin import (
     get_jobs_handler,
+    get_stats_handler,
     cleanup_jobs_handler,
 )
-from meals.tests.base import get_mock_context, get_mock_update
+from meals.instrumentation import HandlerMetrics
+from meals.jobs import sync_scheduled_jobs
+from meals.models import ScheduledJob
+from meals.tests.base import CocaTestCase, get_mock_context, get_mock_update
 
 
-class AdminCommandsTest(TestCase):
+class AdminCommandsTest(CocaTestCase):
     @override_settings(DEVELOPER_CHAT_ID=1)
     def test_get_jobs_handler(self, *args):
+        ScheduledJob.objects.create(
+            name="send_reminder_1",
+            kind=ScheduledJob.SEND_REMINDER,
+            chat_id=1,
+            next_run_at=datetime(2022, 9, 6, 21, tzinfo=timezone.utc),
+            last_success_at=datetime(2022, 8, 30, 21, 0, 2, tzinfo=timezone.utc),
+            misfire_grace_time=60,
+        )
+        ScheduledJob.objects.create(
+            name="send_birthdays_handler_1",
+            kind=ScheduledJob.SEND_BIRTHDAYS,
+            chat_id=1,
+            next_run_at=datetime(2022, 9, 1, 21, tzinfo=timezone.utc),
+            misfire_grace_time=60,
+        )
+        ScheduledJob.objects.create(
+            name="send_birthdays_handler_2",
+            kind=ScheduledJob.SEND_BIRTHDAYS,
+            chat_id=2,
+            next_run_at=None,
+            misfire_grace_time=60,
+        )
         context = get_mock_context()
         update = get_mock_update()
-        job1 = MagicMock()
-        job1.name = "jobcito"
-        job2 = MagicMock()
-        job2.name = "jobcito2"
-        context.job_queue = MagicMock()
-        context.job_queue.jobs = MagicMock(return_value=[job1, job2])
         get_jobs_handler(update, context)
 
         update.message.reply_text.assert_called_once_with(
-            "Los jobs son: jobcito, jobcito2\\."
+            "Los jobs son:"
+            "\n\\- send\\_birthdays\\_handler\\_1: próxima vez el 01/09/2022 21:00 UTC"
+            "\n\\- send\\_reminder\\_1: próxima vez el 06/09/2022 21:00 UTC, última vez el 30/08/2022 21:00 UTC"
+            "\n\\- send\\_birthdays\\_handler\\_2: sin próxima vez"
+        )
+
+    @override_settings(DEVELOPER_CHAT_ID=99)
+    def test_get_jobs_handler_only_lists_the_chat_jobs(self, *args):
+        for chat_id in (1, 2):
+            ScheduledJob.objects.create(
+                name=f"send_reminder_{chat_id}",
+                kind=ScheduledJob.SEND_REMINDER,
+                chat_id=chat_id,
+                misfire_grace_time=60,
+            )
+        context = get_mock_context()
+        update = get_mock_update()
+        get_jobs_handler(update, context)
+
+        update.message.reply_text.assert_called_once_with(
+            "Los jobs son:\n\\- send\\_reminder\\_1: sin próxima vez"
         )
 
     @override_settings(DEVELOPER_CHAT_ID=1)
-    def test_cleanup_jobs_handler_no_repeated_jobs(self, *args):
+    def test_get_jobs_handler_fits_in_a_message(self, *args):
+        ScheduledJob.objects.bulk_create(
+            ScheduledJob(
+                name=f"send_reminder_{chat_id}",
+                kind=ScheduledJob.SEND_REMINDER,
+                chat_id=chat_id,
+                misfire_grace_time=60,
+            )
+            for chat_id in range(1000)
+        )
+        context = get_mock_context()
+        update = get_mock_update()
+        get_jobs_handler(update, context)
+
+        message = update.message.reply_text.call_args.args[0]
+        self.assertLessEqual(len(message), MAX_MESSAGE_LENGTH)
+        shown = message.count("\n\\- ")
+        self.assertTrue(message.endswith(f"\n\\.\\.\\. y {1000 - shown} más"))
+
+    @override_settings(DEVELOPER_CHAT_ID=1)
+    def test_cleanup_jobs_handler_nothing_to_clean(self, *args):
+        sync_scheduled_jobs()
         context = get_mock_context()
         update = get_mock_update()
-        job1 = MagicMock()
-        job1.name = "job1"
-        job2 = MagicMock()
-        job2.name = "job2"
-        context.job_queue = MagicMock()
-        context.job_queue.jobs = MagicMock(return_value=[job1, job2])
         cleanup_jobs_handler(update, context)
 
         update.message.reply_text.assert_called_once_with(
-            "- Los jobs son: job1, job2.\n\nNo hay jobs repetidos.",
+            "- Los jobs son: send_birthdays_handler_1, send_history_resume_1, send_reminder_1.\n\n"
+            "No hay jobs de chats sin configuración.",
             parse_mode=None,
         )
 
     @override_settings(DEVELOPER_CHAT_ID=1)
-    def test_cleanup_jobs_handler_repeated_jobs(self, *args):
+    def test_cleanup_jobs_handler_removes_and_creates_jobs(self, *args):
+        sync_scheduled_jobs()
+        ScheduledJob.objects.filter(kind=ScheduledJob.SEND_BIRTHDAYS).delete()
+        ScheduledJob.objects.create(
+            name="send_reminder_2",
+            kind=ScheduledJob.SEND_REMINDER,
+            chat_id=2,
+            next_run_at=datetime(2022, 9, 6, 21, tzinfo=timezone.utc),
+            misfire_grace_time=60,
+        )
         context = get_mock_context()
         update = get_mock_update()
-        job1 = MagicMock()
-        job1.name = "jobcito"
-        job2 = MagicMock()
-        job2.name = "jobcito"
-        context.job_queue = MagicMock()
-        context.job_queue.jobs = MagicMock(return_value=[job1, job2])
         cleanup_jobs_handler(update, context)
 
-        update.message.reply_text.assert_has_calls(
-            [
-                call(
-                    "- Los jobs son: jobcito.\n\n- Jobs repetidos: jobcito",
-                    parse_mode=None,
-                ),
-                call(
-                    "Los jobs repetidos se marcaron para borrar.",
-                    parse_mode=None,
-                ),
-            ]
+        update.message.reply_text.assert_called_once_with(
+            "- Los jobs son: send_birthdays_handler_1, send_history_resume_1, send_reminder_1.\n\n"
+            "- Jobs borrados: send_reminder_2\n"
+            "- Jobs creados: send_birthdays_handler_1",
+            parse_mode=None,
+        )
+
+    @override_settings(DEVELOPER_CHAT_ID=1)
+    def test_get_stats_handler(self, *args):
+        metrics = HandlerMetrics()
+        for elapsed_us in (1000, 2000, 40000):
+            measurement = metrics.measure("/agregar")
+            measurement.queries = 3
+            measurement.query_time = 500000
+            measurement.telegram_calls = 1
+            metrics.record(measurement, elapsed_us)
+        metrics.record(metrics.measure("job:send_reminder"), 100, failed=True)
+        context = get_mock_context()
+        update = get_mock_update()
+
+        with patch("meals.handlers.commands_admin.handler_metrics", metrics):
+            get_stats_handler(update, context)
+
+        update.message.reply_text.assert_called_once_with(
+            "Estadísticas desde que arrancó el bot, p50/p95/p99, los más lentos primero:"
+            "\n- /agregar: 3 veces, 0 con error, 3 llamadas a Telegram (0 con error)"
+            "\n  2.0/41.0/41.0 ms, 3/3/3 queries, 0.5/0.5/0.5 ms en la base"
+            "\n- job:send_reminder: 1 veces, 1 con error, 0 llamadas a Telegram (0 con error)"
+            "\n  0.1/0.1/0.1 ms, 0/0/0 queries, 0.0/0.0/0.0 ms en la base",
+            parse_mode=None,
         )
 
-        job2.schedule_removal.assert_called_once()
+    @override_settings(DEVELOPER_CHAT_ID=1)
+    def test_get_stats_handler_fits_in_a_message(self, *args):
+        metrics = HandlerMetrics()
+        for index in range(200):
+            metrics.record(metrics.measure(f"/comando{index}"), 1000)
+        metrics.record(metrics.measure("/lento"), 10000000)
+        context = get_mock_context()
+        update = get_mock_update()
+
+        with patch("meals.handlers.commands_admin.handler_metrics", metrics):
+            get_stats_handler(update, context)
+
+        message = update.message.reply_text.call_args.args[0]
+        self.assertLessEqual(len(message), MAX_MESSAGE_LENGTH)
+        lines = message.split("\n- ")[1:]
+        self.assertTrue(lines[0].startswith("/lento:"))
+        self.assertTrue(lines[-1].endswith(f"\n... y {201 - len(lines)} más"))
+
+    @override_settings(DEVELOPER_CHAT_ID=1)
+    def test_get_stats_handler_without_stats(self, *args):
+        context = get_mock_context()
+        update = get_mock_update()
+
+        with patch("meals.handlers.commands_admin.handler_metrics", HandlerMetrics()):
+            get_stats_handler(update, context)
+
+        update.message.reply_text.assert_called_once_with(
+            "Todavía no hay estadísticas\\."
+        )
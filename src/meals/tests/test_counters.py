@@ -0,0 +1,227 @@
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from meals.handlers import send_reminder
+from meals.models import MealItem, MonthlyCounter, ParticipantCounter
+from meals.tests.base import CocaTestCase, get_mock_context
+from meals.tests.factories import MealFactory, MealItemFactory, ParticipantFactory
+from meals.views import delete_meal, get_next_meal, history, resolve_meal
+
+
+def get_month_meals(participant, month):
+    counter = MonthlyCounter.objects.filter(
+        participant=participant, month=month
+    ).first()
+    return counter.total_meals if counter else 0
+
+
+def get_total_meals(participant):
+    counter = ParticipantCounter.objects.filter(participant=participant).first()
+    return counter.total_meals if counter else 0
+
+
+class ParticipantCounterTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.participant = ParticipantFactory(name="test")
+        self.meal = MealFactory()
+        MealItemFactory(meal=self.meal, owner=self.participant)
+        MealItemFactory(meal=self.meal, owner=self.participant)
+
+    def test_get_next_meal_counts(self):
+        get_next_meal(1)
+
+        self.assertEqual(2, get_total_meals(self.participant))
+
+    def test_resolve_meal_counts(self):
+        resolve_meal(1, self.meal.id)
+        resolve_meal(1, self.meal.id)
+
+        self.assertEqual(2, get_total_meals(self.participant))
+
+    def test_delete_done_meal_discounts(self):
+        resolve_meal(1, self.meal.id)
+
+        delete_meal(1, self.meal.id)
+
+        self.assertEqual(0, get_total_meals(self.participant))
+
+    def test_delete_pending_meal_keeps_counter(self):
+        resolve_meal(1, MealItemFactory(owner=self.participant).meal.id)
+
+        delete_meal(1, self.meal.id)
+
+        self.assertEqual(1, get_total_meals(self.participant))
+
+    def test_items_of_done_meal(self):
+        done_meal = MealFactory(done=True)
+        item = MealItemFactory(meal=done_meal, owner=self.participant)
+        self.assertEqual(1, get_total_meals(self.participant))
+
+        MealItem.objects.get(pk=item.pk).delete()
+        self.assertEqual(0, get_total_meals(self.participant))
+
+    def test_send_reminder_rollback_discounts(self):
+        context = get_mock_context()
+
+        with patch(
+            "meals.handlers.handlers.outbox.enqueue", side_effect=Exception()
+        ), self.assertRaises(Exception):
+            send_reminder(context)
+
+        self.assertEqual(0, get_total_meals(self.participant))
+
+    def test_history_reads_counters(self):
+        other = ParticipantFactory(name="other")
+        for _ in range(20):
+            MealItemFactory(meal=MealFactory(done=True), owner=other)
+        resolve_meal(1, self.meal.id)
+
+        with self.assertNumQueries(1):
+            participants = list(history(1))
+
+        self.assertEqual(
+            [("other", 20), ("test", 2)],
+            [
+                (participant.name, participant.total_meals)
+                for participant in participants
+            ],
+        )
+
+
+class MonthlyCounterTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.participant = ParticipantFactory(name="test")
+        self.meal = MealFactory()
+        MealItemFactory(meal=self.meal, owner=self.participant)
+
+    def test_done_meal_counts_in_its_month(self):
+        self.meal.done = True
+        self.meal.done_at = date(2022, 3, 15)
+        self.meal.save()
+
+        self.assertEqual(1, get_month_meals(self.participant, date(2022, 3, 1)))
+
+    def test_changing_done_at_moves_month(self):
+        self.meal.done = True
+        self.meal.done_at = date(2022, 3, 15)
+        self.meal.save()
+
+        self.meal.done_at = date(2022, 4, 2)
+        self.meal.save()
+
+        self.assertEqual(0, get_month_meals(self.participant, date(2022, 3, 1)))
+        self.assertEqual(1, get_month_meals(self.participant, date(2022, 4, 1)))
+        self.assertEqual(1, get_total_meals(self.participant))
+
+    def test_send_reminder_rollback_discounts_month(self):
+        context = get_mock_context()
+
+        with patch(
+            "meals.handlers.handlers.outbox.enqueue", side_effect=Exception()
+        ), self.assertRaises(Exception):
+            send_reminder(context)
+
+        self.assertEqual(
+            0, sum(MonthlyCounter.objects.values_list("total_meals", flat=True))
+        )
+
+    def test_done_meal_without_done_at_only_counts_total(self):
+        MealItemFactory(meal=MealFactory(done=True), owner=self.participant)
+
+        self.assertEqual(1, get_total_meals(self.participant))
+        self.assertFalse(MonthlyCounter.objects.exists())
+
+    def test_history_since(self):
+        other = ParticipantFactory(name="other")
+        for month in range(1, 13):
+            MealItemFactory(
+                meal=MealFactory(done=True, done_at=date(2021, month, 10)), owner=other
+            )
+        MealItemFactory(
+            meal=MealFactory(done=True, done_at=date(2022, 1, 10)), owner=other
+        )
+        for _ in range(2):
+            MealItemFactory(
+                meal=MealFactory(done=True, done_at=date(2022, 2, 10)),
+                owner=self.participant,
+            )
+
+        with self.assertNumQueries(1):
+            participants = list(history(1, since=date(2021, 12, 1)))
+
+        self.assertEqual(
+            [("other", 2), ("test", 2)],
+            sorted(
+                (participant.name, participant.total_meals)
+                for participant in participants
+            ),
+        )
+
+    def test_history_with_month(self):
+        MealItemFactory(
+            meal=MealFactory(done=True, done_at=date(2022, 2, 10)),
+            owner=self.participant,
+        )
+        MealItemFactory(meal=MealFactory(done=True), owner=self.participant)
+
+        with self.assertNumQueries(1):
+            participant = history(1, month=date(2022, 2, 1))[0]
+
+        self.assertEqual(2, participant.total_meals)
+        self.assertEqual(1, participant.month_meals)
+
+
+class RebuildCountersTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.participant = ParticipantFactory(name="test")
+        MealItemFactory(meal=MealFactory(done=True), owner=self.participant)
+        MealItemFactory(owner=self.participant)
+
+    def test_check_passes(self):
+        out = StringIO()
+
+        call_command("rebuild_counters", "--check", stdout=out)
+
+        self.assertIn("Los contadores están bien.", out.getvalue())
+
+    def test_check_fails_and_rebuild_fixes(self):
+        ParticipantCounter.objects.update(total_meals=5)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_counters", "--check", stdout=StringIO())
+
+        call_command("rebuild_counters", stdout=StringIO())
+
+        self.assertEqual(1, get_total_meals(self.participant))
+        call_command("rebuild_counters", "--check", stdout=StringIO())
+
+    def test_rebuild_fixes_monthly_counters(self):
+        MealItemFactory(
+            meal=MealFactory(done=True, done_at=date(2022, 2, 10)),
+            owner=self.participant,
+        )
+        MonthlyCounter.objects.update(total_meals=3)
+        MonthlyCounter.objects.create(
+            participant=self.participant, month=date(2022, 5, 1), total_meals=1
+        )
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_counters", "--check", stdout=StringIO())
+
+        call_command("rebuild_counters", stdout=StringIO())
+
+        self.assertEqual(1, get_month_meals(self.participant, date(2022, 2, 1)))
+        self.assertEqual(0, get_month_meals(self.participant, date(2022, 5, 1)))
+
+    def test_rebuild_creates_missing_counters(self):
+        ParticipantCounter.objects.all().delete()
+
+        call_command("rebuild_counters", stdout=StringIO())
+
+        self.assertEqual(1, get_total_meals(self.participant))
@@ -0,0 +1,181 @@
+import threading
+import time
+from queue import Queue
+from unittest.mock import MagicMock, patch
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from meals.decorators import close_db_connections
+from meals.dispatcher import ChatOrderedDispatcher
+from meals.fakebot import FakeBotApi
+from meals.models import MealItem, settings_cache
+from meals.replay import FAKE_TOKEN, UpdateFactory, build_dispatcher, load_chats
+from meals.tests.base import CocaTestCase, get_recorded_update
+
+
+class CloseDbConnectionsTest(CocaTestCase):
+    @patch("meals.decorators.close_old_connections")
+    def test_closes_before_and_after(self, close_old_connections):
+        handler = MagicMock(return_value="ok")
+
+        with patch("meals.decorators.connection") as connection:
+            connection.in_atomic_block = False
+            result = close_db_connections(handler)("update", "context")
+
+        self.assertEqual("ok", result)
+        handler.assert_called_once_with("update", "context")
+        self.assertEqual(2, close_old_connections.call_count)
+
+    @patch("meals.decorators.close_old_connections")
+    def test_closes_after_error(self, close_old_connections):
+        handler = MagicMock(side_effect=ValueError())
+
+        with patch("meals.decorators.connection") as connection:
+            connection.in_atomic_block = False
+            with self.assertRaises(ValueError):
+                close_db_connections(handler)("update", "context")
+
+        self.assertEqual(2, close_old_connections.call_count)
+
+    @patch("meals.decorators.close_old_connections")
+    def test_keeps_connection_inside_transaction(self, close_old_connections):
+        close_db_connections(MagicMock())("update", "context")
+
+        close_old_connections.assert_not_called()
+
+
+class CloseDbConnectionsReuseTest(SimpleTestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("La base en memoria de SQLite nunca se cierra.")
+        max_age = connection.settings_dict["CONN_MAX_AGE"]
+        self.addCleanup(connection.settings_dict.__setitem__, "CONN_MAX_AGE", max_age)
+        connection.close()
+
+    def connect_wrapped(self, max_age):
+        connection.settings_dict["CONN_MAX_AGE"] = max_age
+        close_db_connections(connection.ensure_connection)()
+
+    def test_reuses_connection_within_max_age(self):
+        self.connect_wrapped(60)
+        self.assertIsNotNone(connection.connection)
+
+    def test_closes_connection_without_max_age(self):
+        self.connect_wrapped(0)
+        self.assertIsNone(connection.connection)
+
+
+def get_update(chat_id, update_id, bot):
+    data = get_recorded_update("chatter")
+    data["update_id"] = update_id
+    data["message"]["chat"]["id"] = chat_id
+    return Update.de_json(data, bot)
+
+
+class ChatOrderedDispatcherTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bot = MagicMock(defaults=None)
+        self.dispatcher = ChatOrderedDispatcher(
+            self.bot, Queue(), workers=1, update_workers=4
+        )
+        self.started = []
+        self.finished = []
+        self.handlers = {}
+
+        def handle(update, context):
+            self.started.append(update.update_id)
+            self.handlers.get(update.update_id, lambda: None)()
+            self.finished.append(update.update_id)
+
+        self.dispatcher.add_handler(TypeHandler(Update, handle))
+
+    def process(self, *updates):
+        for chat_id, update_id in updates:
+            self.dispatcher.process_update(get_update(chat_id, update_id, self.bot))
+
+    def wait_finished(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.finished) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_chats_are_processed_concurrently(self):
+        # Cada handler espera al otro, si corrieran de a uno el barrier se rompe.
+        barrier = threading.Barrier(2, timeout=5)
+        self.handlers = {1: barrier.wait, 2: barrier.wait}
+
+        self.process((1, 1), (2, 2))
+        self.wait_finished(2)
+        self.dispatcher.stop()
+
+        self.assertFalse(barrier.broken)
+        self.assertEqual({1, 2}, set(self.finished))
+
+    def test_updates_of_a_chat_are_processed_in_order(self):
+        release = threading.Event()
+        self.handlers = {1: lambda: release.wait(5)}
+
+        self.process((1, 1), (1, 2), (2, 3), (1, 4))
+        self.wait_finished(1)
+        # El otro chat sigue mientras el primer update del chat 1 está trabado.
+        self.assertEqual([3], self.finished)
+        self.assertEqual([1, 3], sorted(self.started))
+
+        release.set()
+        self.wait_finished(4)
+        self.dispatcher.stop()
+
+        self.assertEqual([3, 1, 2, 4], self.finished)
+
+    def test_stop_finishes_pending_updates(self):
+        self.handlers = {1: lambda: time.sleep(0.05)}
+
+        self.process((1, 1), (1, 2))
+        self.dispatcher.stop()
+
+        self.assertEqual([1, 2], self.finished)
+
+
+class ChatOrderedDispatcherDatabaseTest(TransactionTestCase):
+    # La migración 0012 crea la configuración, hay que restaurarla después de vaciar las tablas.
+    serialized_rollback = True
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest(
+                "La base en memoria de SQLite no deja escribir desde varios threads, hace falta TEST NAME."
+            )
+        settings_cache.clear()
+
+    def test_agregar_in_a_chat_keeps_its_order(self):
+        api = FakeBotApi(FAKE_TOKEN)
+        with override_settings(TELEGRAM_TOKEN=FAKE_TOKEN), load_chats(2) as chat_ids:
+            dispatcher = build_dispatcher(api, update_workers=4)
+            bot = dispatcher.bot
+            factory = UpdateFactory(chat_ids, api.get_bot_user())
+
+            for number in range(10):
+                for chat_id in chat_ids:
+                    dispatcher.process_update(
+                        Update.de_json(
+                            factory.message(chat_id, f"/agregar Ana comida{number}"),
+                            bot,
+                        )
+                    )
+            dispatcher.stop()
+
+            for chat_id in chat_ids:
+                self.assertEqual(
+                    [f"comida{number}" for number in range(10)],
+                    list(
+                        MealItem.objects.filter(meal__chat_id=chat_id)
+                        .order_by("meal_id")
+                        .values_list("description", flat=True)
+                    ),
+                )
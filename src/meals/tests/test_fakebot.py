@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from queue import Queue
+from urllib.request import Request, urlopen
+from telegram import Bot, ParseMode
+from telegram.error import BadRequest, Conflict, RetryAfter, Unauthorized
+from telegram.ext import Defaults, Updater
+
+from meals.bot import QueuedBot
+from meals.fakebot import FakeBotApi, FakeBotApiServer, FakeRequest
+from meals.management.commands.run_coca import add_handlers
+from meals.sender import OutboundSender
+from meals.tests.base import CocaTestCase, get_recorded_update
+
+TOKEN = "1000:fake"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FakeBotApiTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api = FakeBotApi("1000:fake")
+
+    def test_numbers_messages_per_chat(self):
+        ids = [
+            self.api.handle("sendMessage", {"chat_id": chat_id, "text": "Hola"})[1][
+                "result"
+            ]["message_id"]
+            for chat_id in (1, 1, 2)
+        ]
+
+        self.assertEqual([1, 2, 1], ids)
+        self.assertEqual(3, len(self.api.get_calls("sendMessage")))
+
+    def test_only_accepts_issued_file_ids(self):
+        status, body = self.api.handle(
+            "sendPhoto", {"chat_id": 1, "photo": BytesIO(b"png")}
+        )
+        file_id = body["result"]["photo"][0]["file_id"]
+
+        self.assertEqual(200, status)
+        self.assertEqual(
+            200, self.api.handle("sendPhoto", {"chat_id": 1, "photo": file_id})[0]
+        )
+        self.assertEqual(
+            400, self.api.handle("sendPhoto", {"chat_id": 1, "photo": "otro"})[0]
+        )
+
+    def test_answers_retry_after(self):
+        api = FakeBotApi("1000:fake", retry_after_rate=1, retry_after=3)
+
+        with self.assertRaises(RetryAfter) as cm:
+            FakeRequest(api).post(
+                "https://api.telegram.org/bot1000:fake/sendMessage",
+                {"chat_id": 1, "text": "Hola"},
+            )
+
+        self.assertEqual(3, cm.exception.retry_after)
+        self.assertEqual([429], [call.status for call in api.get_calls()])
+
+    def test_request_raises_bad_request(self):
+        with self.assertRaises(BadRequest):
+            FakeRequest(self.api).post(
+                "https://api.telegram.org/bot1000:fake/sendAudio",
+                {"chat_id": 1, "audio": "otro"},
+            )
+
+
+class FakeBotApiServerTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api = FakeBotApi(TOKEN)
+        self.server = FakeBotApiServer(self.api)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.bot = Bot(TOKEN, base_url=self.server.base_url)
+
+    def test_sends_messages(self):
+        message = self.bot.send_message(1, "Hola")
+
+        self.assertEqual("Hola", message.text)
+        self.assertEqual(
+            ["Hola"], [call.data["text"] for call in self.api.get_calls("sendMessage")]
+        )
+
+    def test_uploads_get_a_file_id(self):
+        message = self.bot.send_photo(1, BytesIO(b"\x89PNG\r\n\x00\xff"))
+        file_id = message.photo[-1].file_id
+
+        self.assertEqual(
+            b"\x89PNG\r\n\x00\xff",
+            self.api.get_calls("sendPhoto")[0].data["photo"].getvalue(),
+        )
+        self.assertEqual(file_id, self.bot.send_photo(1, file_id).photo[-1].file_id)
+        with self.assertRaises(BadRequest):
+            self.bot.send_photo(1, "otro")
+
+    def test_answers_retry_after(self):
+        self.api.retry_after_rate = 1
+
+        with self.assertRaises(RetryAfter):
+            self.bot.send_message(1, "Hola")
+
+    def test_rejects_other_tokens(self):
+        with self.assertRaises(Unauthorized):
+            Bot("1001:otro", base_url=self.server.base_url).get_me()
+
+    def test_get_updates_waits_for_updates(self):
+        threading.Timer(
+            0.1, self.api.put_update, [get_recorded_update("proximas")]
+        ).start()
+
+        updates = self.bot.get_updates(timeout=5)
+
+        self.assertEqual(["/proximas"], [update.message.text for update in updates])
+        self.assertEqual(
+            [], self.bot.get_updates(offset=updates[0].update_id + 1, timeout=0)
+        )
+
+    def test_post_updates_adds_updates(self):
+        request = Request(
+            self.server.base_url.replace("/bot", "/updates"),
+            data=json.dumps(
+                [get_recorded_update("proximas"), get_recorded_update("saltear")]
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urlopen(request) as response:
+            self.assertEqual(2, json.load(response)["result"])
+
+        self.assertEqual(
+            [1, 2], [update.update_id for update in self.bot.get_updates()]
+        )
+
+    def test_webhook_receives_updates(self):
+        received = Queue()
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.put(
+                    json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                )
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        webhook = HTTPServer(("127.0.0.1", 0), WebhookHandler)
+        threading.Thread(target=webhook.serve_forever, daemon=True).start()
+        self.addCleanup(webhook.server_close)
+        self.addCleanup(webhook.shutdown)
+
+        self.bot.set_webhook(f"http://127.0.0.1:{webhook.server_address[1]}/telegram/")
+        self.api.put_update(get_recorded_update("proximas"))
+
+        self.assertEqual("/proximas", received.get(timeout=5)["message"]["text"])
+        with self.assertRaises(Conflict):
+            self.bot.get_updates()
+
+    def test_updater_polls_and_replies(self):
+        bot = QueuedBot(
+            TOKEN,
+            base_url=self.server.base_url,
+            defaults=Defaults(quote=False, parse_mode=ParseMode.MARKDOWN_V2),
+            sender=OutboundSender(
+                global_rate=30, chat_rate=1, chat_burst=5, max_retries=0
+            ),
+        )
+        updater = Updater(bot=bot, workers=1)
+        add_handlers(updater.dispatcher)
+        updater.start_polling(poll_interval=0, timeout=0.1)
+        self.addCleanup(updater.stop)
+
+        self.api.put_update(get_recorded_update("proximas"))
+
+        self.assertTrue(wait_for(lambda: self.api.get_calls("sendMessage")))
+        self.assertEqual(
+            "No hay próximas comidas\\.",
+            self.api.get_calls("sendMessage")[0].data["text"],
+        )
@@ -0,0 +1,130 @@
+import os
+from concurrent import futures
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+from django.test import override_settings
+from matplotlib import pyplot
+from telegram.error import BadRequest
+
+from meals.graphs import render_history_chart, send_history_chart
+from meals.models import HistoryChart
+from meals.tests.base import CocaTestCase, get_mock_sent_photo
+
+GRAPH = {"names": ["test1", "test2"], "values": [2, 1], "total": 3}
+
+
+class GraphsTest(CocaTestCase):
+    def test_render_history_chart_returns_png(self):
+        image = render_history_chart(GRAPH)
+
+        self.assertTrue(image.read().startswith(b"\x89PNG"))
+
+    def test_render_history_chart_leaves_no_state(self):
+        files = set(os.listdir())
+
+        render_history_chart(GRAPH)
+
+        self.assertEqual(files, set(os.listdir()))
+        self.assertEqual([], pyplot.get_fignums())
+
+    def test_send_history_chart_sends_image_from_memory(self):
+        callback = MagicMock(return_value=get_mock_sent_photo())
+
+        send_history_chart(GRAPH, callback)
+
+        image = callback.call_args.args[0]
+        self.assertIsInstance(image, BytesIO)
+        self.assertTrue(image.read().startswith(b"\x89PNG"))
+        self.assertEqual("Hice un grafiquito", callback.call_args.kwargs["caption"])
+
+
+@override_settings(TELEGRAM_TOKEN="25:test")
+class HistoryChartCacheTest(CocaTestCase):
+    def test_second_send_reuses_file_id(self):
+        send_history_chart(GRAPH, MagicMock(return_value=get_mock_sent_photo("abc")))
+        callback = MagicMock()
+
+        with patch("meals.graphs.render_history_chart") as render_mock:
+            send_history_chart(GRAPH, callback)
+
+        render_mock.assert_not_called()
+        callback.assert_called_once_with("abc", caption="Hice un grafiquito")
+
+    def test_same_graph_other_key_order_reuses_file_id(self):
+        send_history_chart(GRAPH, MagicMock(return_value=get_mock_sent_photo("abc")))
+        callback = MagicMock()
+
+        send_history_chart(
+            {"total": 3, "values": [2, 1], "names": ["test1", "test2"]}, callback
+        )
+
+        callback.assert_called_once_with("abc", caption="Hice un grafiquito")
+
+    def test_other_graph_is_rendered(self):
+        send_history_chart(GRAPH, MagicMock(return_value=get_mock_sent_photo("abc")))
+        callback = MagicMock(return_value=get_mock_sent_photo("def"))
+
+        send_history_chart({**GRAPH, "values": [1, 2]}, callback)
+
+        self.assertIsInstance(callback.call_args.args[0], BytesIO)
+        self.assertEqual(2, HistoryChart.objects.count())
+
+    def test_file_id_from_other_bot_is_not_sent(self):
+        send_history_chart(GRAPH, MagicMock(return_value=get_mock_sent_photo("abc")))
+        callback = MagicMock(return_value=get_mock_sent_photo("def"))
+
+        with override_settings(TELEGRAM_TOKEN="26:test"), patch(
+            "meals.graphs.render_history_chart"
+        ) as render_mock:
+            send_history_chart(GRAPH, callback)
+
+        render_mock.assert_not_called()
+        self.assertIsInstance(callback.call_args.args[0], BytesIO)
+        chart = HistoryChart.objects.get()
+        self.assertEqual(("def", "26"), (chart.file_id, chart.bot_id))
+
+    def test_rejected_file_id_is_uploaded_again(self):
+        send_history_chart(GRAPH, MagicMock(return_value=get_mock_sent_photo("abc")))
+        callback = MagicMock(
+            side_effect=[
+                BadRequest("Wrong file identifier"),
+                get_mock_sent_photo("def"),
+            ]
+        )
+
+        send_history_chart(GRAPH, callback)
+
+        self.assertEqual(2, callback.call_count)
+        self.assertIsInstance(callback.call_args.args[0], BytesIO)
+        self.assertEqual("def", HistoryChart.objects.get().file_id)
+
+    def test_send_with_file_id_does_not_wait(self):
+        send_history_chart(GRAPH, MagicMock(return_value=get_mock_sent_photo("abc")))
+        rejected = futures.Future()
+        uploaded = futures.Future()
+        callback = MagicMock(side_effect=[rejected, uploaded])
+
+        sent = send_history_chart(GRAPH, callback)
+        self.assertFalse(sent.done())
+
+        rejected.set_exception(BadRequest("Wrong file identifier"))
+        uploaded.set_result(get_mock_sent_photo("def"))
+
+        self.assertEqual(2, callback.call_count)
+        self.assertEqual("def", HistoryChart.objects.get().file_id)
+
+    @override_settings(HISTORY_CHART_CACHE_SIZE=2)
+    def test_least_recently_used_chart_is_evicted(self):
+        graphs = [{**GRAPH, "values": [value, 1]} for value in range(1, 4)]
+        callback = MagicMock(return_value=get_mock_sent_photo())
+
+        send_history_chart(graphs[0], callback)
+        send_history_chart(graphs[1], callback)
+        send_history_chart(graphs[0], callback)
+        send_history_chart(graphs[2], callback)
+
+        with patch("meals.graphs.render_history_chart") as render_mock:
+            send_history_chart(graphs[0], callback)
+            send_history_chart(graphs[2], callback)
+        render_mock.assert_not_called()
+        self.assertEqual(2, HistoryChart.objects.count())
@@ -1,7 +1,7 @@
-from datetime import timedelta
-from django.test import TestCase, override_settings
+from datetime import date, datetime, timedelta
+from django.test import override_settings
 from django.utils import timezone
-from unittest.mock import call, MagicMock
+from unittest.mock import call, MagicMock, patch
 
 from telegram import ParseMode
 from meals.handlers import (
@@ -10,25 +10,27 @@ from meals.handlers import (
     reply_to_coca_handler,
     send_birthdays_handler,
 )
+from meals.models import OutboxMessage
+from meals.outbox import deliver_outbox
 from meals.tests.factories import (
     MealFactory,
     MealItemFactory,
     ParticipantFactory,
     SkipFactory,
 )
-from meals.tests.base import get_mock_context, get_mock_update
+from meals.tests.base import CocaTestCase, get_mock_context, get_mock_update
 
 
-class HandlerTest(TestCase):
-    @override_settings(CHAT_ID="")
+class HandlerTest(CocaTestCase):
     def test_send_reminder(self, *args):
         mealitem = MealItemFactory(owner=ParticipantFactory(name="test name"))
         MealItemFactory()
         context = get_mock_context()
         send_reminder(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_called_once_with(
-            "",
+            1,
             """Hola\\!\n\\- *test name* te toca comprar los ingredientes para hacer `test meal`\\.""",
             parse_mode=ParseMode().MARKDOWN_V2,
         )
@@ -37,23 +39,58 @@ class HandlerTest(TestCase):
         self.assertTrue(mealitem.meal.done)
         self.assertEquals(timezone.now().day, mealitem.meal.done_at.day)
 
-    @override_settings(CHAT_ID="")
-    def test_send_reminder_send_message_fails_rollback_is_done(self, *args):
-        def fail(*args, **kwargs):
-            raise Exception()
+    def test_send_reminder_query_count(self, *args):
+        meal = MealFactory()
+        for index in range(5):
+            MealItemFactory(meal=meal, owner=ParticipantFactory(name=f"test{index}"))
+        MealItemFactory()
+        context = get_mock_context()
+
+        # skip, comida, items con sus dueños, guardado, contadores totales y del mes,
+        # comidas restantes, outbox y el savepoint de la transacción dentro del test.
+        with self.assertNumQueries(12):
+            send_reminder(context)
+        deliver_outbox(context.bot)
 
+        self.assertEqual(
+            5, context.bot.send_message.call_args.args[1].count("te toca comprar")
+        )
+
+    def test_send_reminder_send_message_fails_meal_stays_done(self, *args):
         mealitem = MealItemFactory(owner=ParticipantFactory(name="test name"))
         MealItemFactory()
         context = get_mock_context()
-        context.bot.send_message.side_effect = fail
-        with self.assertRaises(Exception):
+        context.bot.send_message.side_effect = Exception()
+        send_reminder(context)
+        deliver_outbox(context.bot)
+
+        mealitem.refresh_from_db()
+        self.assertTrue(mealitem.meal.done)
+        outbox_message = OutboxMessage.objects.get()
+        self.assertEqual(1, outbox_message.attempts)
+        self.assertIsNone(outbox_message.sent_at)
+
+        context.bot.send_message.side_effect = None
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        deliver_outbox(context.bot)
+
+        self.assertEqual(2, context.bot.send_message.call_count)
+        outbox_message.refresh_from_db()
+        self.assertIsNotNone(outbox_message.sent_at)
+
+    def test_send_reminder_failed_enqueue_rollbacks_meal(self, *args):
+        mealitem = MealItemFactory()
+        context = get_mock_context()
+
+        with patch(
+            "meals.handlers.handlers.outbox.enqueue", side_effect=Exception()
+        ), self.assertRaises(Exception):
             send_reminder(context)
 
         mealitem.refresh_from_db()
         self.assertFalse(mealitem.meal.done)
         self.assertEquals(None, mealitem.meal.done_at)
 
-    @override_settings(CHAT_ID="")
     def test_get_next_meal_returns_first_undone_meal(self):
         MealItemFactory(
             owner=ParticipantFactory(name="test"),
@@ -64,76 +101,89 @@ class HandlerTest(TestCase):
 
         context = get_mock_context()
         send_reminder(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_has_calls(
             [
                 call(
-                    "",
+                    1,
                     """Hola\\!\n\\- *test2* te toca comprar los ingredientes para hacer `test2`\\.""",
                     parse_mode=ParseMode().MARKDOWN_V2,
                 ),
                 call(
-                    "",
+                    1,
                     "Además les informo que no hay más comidas configuradas, ponganse a pensar\\.",
                     parse_mode=ParseMode().MARKDOWN_V2,
                 ),
             ]
         )
 
-    @override_settings(CHAT_ID="")
+    def test_send_reminder_ignores_other_chats(self, *args):
+        MealItemFactory(meal=MealFactory(chat_id=2))
+        context = get_mock_context()
+        send_reminder(context)
+        deliver_outbox(context.bot)
+
+        context.bot.send_message.assert_called_once_with(
+            1,
+            "Hola, no hay una comida configurada para mañana, si quieren cenar rico ponganse las pilas\\.",
+        )
+
     def test_send_reminder_no_more_meals(self, *args):
         MealItemFactory(owner=ParticipantFactory(name="test name"))
         context = get_mock_context()
         send_reminder(context)
+        deliver_outbox(context.bot)
 
         self.assertEqual(2, context.bot.send_message.call_count)
         context.bot.send_message.assert_has_calls(
             [
                 call(
-                    "",
+                    1,
                     "Hola\\!\n\\- *test name* te toca comprar los ingredientes para hacer `test meal`\\.",
                     parse_mode=ParseMode().MARKDOWN_V2,
                 ),
                 call(
-                    "",
+                    1,
                     "Además les informo que no hay más comidas configuradas, ponganse a pensar\\.",
                     parse_mode=ParseMode().MARKDOWN_V2,
                 ),
             ]
         )
 
-    @override_settings(CHAT_ID="")
     def test_send_reminder_no_meal(self, *args):
         context = get_mock_context()
         send_reminder(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_called_once_with(
-            "",
+            1,
             "Hola, no hay una comida configurada para mañana, si quieren cenar rico ponganse las pilas\\.",
         )
 
-    @override_settings(CHAT_ID="")
     def test_send_reminder_skip_active(self, *args):
         SkipFactory()
         context = get_mock_context()
         send_reminder(context)
+        deliver_outbox(context.bot)
 
         self.assertEqual(0, context.bot.send_message.call_count)
 
-    @override_settings(CHAT_ID="")
     def test_send_reminders_skip_active(self, *args):
         SkipFactory()
         MealItemFactory()
         context = get_mock_context()
         send_reminder(context)
+        deliver_outbox(context.bot)
 
         self.assertEqual(0, context.bot.send_message.call_count)
 
         send_reminder(context)
+        deliver_outbox(context.bot)
 
         self.assertEqual(2, context.bot.send_message.call_count)
 
-    @override_settings(CHAT_ID="", TELEGRAM_TOKEN="25:test")
+    @override_settings(TELEGRAM_TOKEN="25:test")
     def test_reply_to_coca_handler(self, *args):
         """El id de usuario del bot es la primera parte del token, antes de los :"""
         import random
@@ -152,7 +202,7 @@ class HandlerTest(TestCase):
             "Soy una entidad virtual, no me contestes\\."
         )
 
-    @override_settings(CHAT_ID="", TELEGRAM_TOKEN="25:test")
+    @override_settings(TELEGRAM_TOKEN="25:test")
     def test_reply_to_coca_handler_other_chat(self, *args):
         """El id de usuario del bot es la primera parte del token, antes de los :"""
         import random
@@ -169,7 +219,6 @@ class HandlerTest(TestCase):
 
         update.message.reply_text.assert_not_called()
 
-    @override_settings(CHAT_ID="")
     def test_reply_to_coca_handler_random_high(self, *args):
         import random
 
@@ -180,68 +229,78 @@ class HandlerTest(TestCase):
 
         update.message.reply_text.assert_not_called()
 
-    @override_settings(CHAT_ID="")
+    @patch(
+        "meals.handlers.handlers.timezone.now",
+        side_effect=lambda: datetime.strptime(
+            "2022-09-30 15:27:05.004573 -0300", "%Y-%m-%d %H:%M:%S.%f %z"
+        ),
+    )
     def test_send_history_resume(self, *args):
         p2 = ParticipantFactory(name="test2")
         p1 = ParticipantFactory(name="test")
         MealItemFactory(meal=MealFactory(done=True), owner=p2)
-        MealItemFactory(meal=MealFactory(done=True), owner=p2)
-        MealItemFactory(meal=MealFactory(done=True), owner=p1)
+        MealItemFactory(
+            meal=MealFactory(done=True, done_at=date(2022, 9, 30)), owner=p2
+        )
+        MealItemFactory(
+            meal=MealFactory(done=True, done_at=date(2022, 8, 31)), owner=p1
+        )
 
         context = get_mock_context()
         send_history_resume(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_called_once_with(
-            "",
-            "Hola, les dejo el resumen del histórico de compras: \n\n\\- *test2* compró para `2` comidas\\.\n\\- *test* compró para `1` comida\\.",
+            1,
+            "Hola, les dejo el resumen del histórico de compras: \n\n\\- *test2* compró para `2` comidas, `1` en septiembre\\.\n\\- *test* compró para `1` comida, `0` en septiembre\\.",
         )
 
-    @override_settings(CHAT_ID="")
     def test_send_birthdays_without_participants(self, *args):
         context = get_mock_context()
         send_birthdays_handler(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_not_called()
 
-    @override_settings(CHAT_ID="")
     def test_send_birthdays_no_birthdays_today(self, *args):
         ParticipantFactory(name="test", birthday=timezone.now() - timedelta(days=5))
         context = get_mock_context()
         send_birthdays_handler(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_not_called()
 
-    @override_settings(CHAT_ID="")
     def test_send_birthdays_birthdays_today(self, *args):
         ParticipantFactory(name="test", birthday=timezone.now().replace(year=1990))
         ParticipantFactory(name="test2", birthday=timezone.now())
         context = get_mock_context()
         send_birthdays_handler(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_has_calls(
             [
                 call(
-                    "",
+                    1,
                     "Feliz cumple test\\!\\! La próxima tenes que llevar flan\\.",
                 ),
                 call(
-                    "",
+                    1,
                     "Feliz cumple test2\\!\\! La próxima tenes que llevar flan\\.",
                 ),
             ]
         )
 
-    @override_settings(CHAT_ID="")
     def test_send_birthdays_birthdays_none(self, *args):
         ParticipantFactory(name="test")
         ParticipantFactory(name="test2", birthday=timezone.now())
         context = get_mock_context()
         send_birthdays_handler(context)
+        deliver_outbox(context.bot)
 
         context.bot.send_message.assert_has_calls(
             [
                 call(
-                    "",
+                    1,
                     "Feliz cumple test2\\!\\! La próxima tenes que llevar flan\\.",
                 ),
             ]
@@ -0,0 +1,113 @@
+import re
+from datetime import date
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from meals.benchmarks.views import seed
+from meals.models import Meal, MealItem, Participant
+from meals.tests.base import CocaTestCase
+from meals.tests.factories import MealFactory, MealItemFactory, ParticipantFactory
+from meals.views import (
+    add_meal,
+    add_skip,
+    copy_meal,
+    get_next_meal,
+    get_next_meals,
+    get_previous_meals,
+    get_skip,
+    get_todays_birthdays,
+    history,
+    resolve_meal,
+)
+
+# En SQLite una tabla recorrida sin índice aparece como "SCAN tabla" sin "USING ... INDEX".
+SQLITE_FULL_SCAN = re.compile(r"\bSCAN (\w+)(?! USING)")
+
+
+class IndexUsageTest(CocaTestCase):
+    """
+    Corre las consultas de views.py y verifica con EXPLAIN que ninguna recorre una tabla entera.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.participant = ParticipantFactory(name="test", birthday=date(1990, 5, 2))
+        for index in range(3):
+            MealItemFactory(
+                meal=MealFactory(done=index == 0, done_at=date(2022, 5, 2)),
+                owner=self.participant,
+            )
+
+    def get_view_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            meals, _, has_next = get_next_meals(1, limit=1)
+            get_next_meals(1, after_id=meals[0].id)
+            get_next_meals(1, before_id=meals[0].id)
+            list(get_previous_meals(1, 5))
+            list(history(1))
+            list(history(1, since=date(2022, 1, 1), month=date(2022, 5, 1)))
+            list(get_todays_birthdays(1))
+            add_skip(1)
+            get_skip(1)
+            copy_meal(1, meals[0].id)
+            add_meal(1, [("test", "comida")])
+            resolve_meal(1, meals[0].id)
+            get_next_meal(1)
+
+        return [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("SELECT")
+        ]
+
+    def get_full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = "\n".join(row[-1] for row in cursor.fetchall())
+                return SQLITE_FULL_SCAN.findall(plan)
+
+            cursor.execute(f"EXPLAIN {sql}")
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            return re.findall(r"Seq Scan on (\w+)", plan)
+
+    def test_view_queries_use_indexes(self):
+        if connection.vendor == "postgresql":
+            # Postgres elige el plan según las estadísticas y recorre las tablas chicas aunque
+            # tengan índice, así que se llenan como en producción: 10 chats con 1000 comidas.
+            seed(10**4, 100, 10, timezone.now().date())
+            with connection.cursor() as cursor:
+                for model in (Meal, MealItem, Participant):
+                    cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+        queries = self.get_view_queries()
+
+        self.assertGreater(len(queries), 10)
+        for sql in queries:
+            with self.subTest(sql=sql):
+                self.assertEqual([], self.get_full_scans(sql))
+
+    def test_meal_queues_use_partial_indexes(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Qué índice elige Postgres depende de sus estadísticas.")
+
+        self.assertIn(
+            "meal_pending_idx",
+            Meal.objects.filter(chat_id=1, done=False).order_by("id")[:1].explain(),
+        )
+        self.assertIn("meal_done_idx", get_previous_meals(1, 5).explain())
+        self.assertIn("participant_birthday_idx", get_todays_birthdays(1).explain())
+
+    def test_birthdays_written_without_save_are_found(self):
+        # 1992 es bisiesto, así la fecha existe aunque hoy sea 29 de febrero.
+        birthday = timezone.now().date().replace(year=1992)
+        Participant.objects.bulk_create(
+            [Participant(chat_id=1, name="bulk", birthday=birthday)]
+        )
+        Participant.objects.filter(name="test").update(birthday=birthday)
+
+        self.assertEqual(
+            {"bulk", "test"},
+            set(get_todays_birthdays(1).values_list("name", flat=True)),
+        )
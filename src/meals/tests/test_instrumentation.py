@@ -0,0 +1,113 @@
+import threading
+from unittest.mock import MagicMock
+from telegram.error import BadRequest
+
+from meals.bot import QueuedBot
+from meals.instrumentation import (
+    HandlerMetrics,
+    Histogram,
+    count_telegram_call,
+    get_bucket_index,
+    get_bucket_value,
+)
+from meals.models import CocaSettings
+from meals.sender import OutboundSender
+from meals.tests.base import CocaTestCase
+
+
+class HistogramTest(CocaTestCase):
+    def test_buckets_are_within_one_thirty_second(self):
+        # Los peores casos son los primeros valores de cada bucket ancho, como 2 ** 20.
+        for value in list(range(1, 1000)) + [2**20, 2**20 + 12345, 10**9 + 7]:
+            bucket_value = get_bucket_value(get_bucket_index(value))
+            self.assertGreaterEqual(bucket_value, value)
+            self.assertLess(bucket_value - value, value / 32)
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value)
+
+        self.assertAlmostEqual(500, histogram.percentile(50), delta=500 / 32)
+        self.assertAlmostEqual(950, histogram.percentile(95), delta=950 / 32)
+        self.assertAlmostEqual(990, histogram.percentile(99), delta=990 / 32)
+        self.assertEqual(1000, histogram.count)
+
+    def test_empty_histogram(self):
+        self.assertEqual(0, Histogram().percentile(99))
+
+
+class HandlerMetricsTest(CocaTestCase):
+    def test_measure_counts_queries_and_telegram_calls(self):
+        metrics = HandlerMetrics()
+
+        with metrics.measure("/historial"):
+            CocaSettings.objects.count()
+            CocaSettings.objects.count()
+            count_telegram_call()
+            count_telegram_call(failed=True)
+
+        record = metrics.snapshot()["/historial"]
+        self.assertEqual(1, record.latency.count)
+        self.assertEqual(2, record.queries.percentile(50))
+        self.assertEqual(2, record.telegram_calls)
+        self.assertEqual(1, record.telegram_errors)
+        self.assertEqual(0, record.errors)
+
+    def test_nested_measurements_count_in_the_outer_one(self):
+        metrics = HandlerMetrics()
+
+        with metrics.measure("job:run_scheduled_jobs"):
+            with metrics.measure("job:send_reminder"):
+                count_telegram_call()
+            count_telegram_call()
+
+        records = metrics.snapshot()
+        self.assertEqual(1, records["job:send_reminder"].telegram_calls)
+        self.assertEqual(2, records["job:run_scheduled_jobs"].telegram_calls)
+
+    def test_measure_records_errors(self):
+        metrics = HandlerMetrics()
+
+        with self.assertRaises(ValueError):
+            with metrics.measure("/agregar"):
+                raise ValueError()
+
+        self.assertEqual(1, metrics.snapshot()["/agregar"].errors)
+
+    def test_snapshot_adds_every_thread(self):
+        metrics = HandlerMetrics()
+
+        def run():
+            for _ in range(100):
+                with metrics.measure("/proximas"):
+                    pass
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(400, metrics.snapshot()["/proximas"].latency.count)
+
+    def test_queued_bot_counts_calls(self):
+        metrics = HandlerMetrics()
+        sender = OutboundSender(
+            global_rate=30, chat_rate=10, chat_burst=10, max_retries=1
+        )
+        post = MagicMock(
+            side_effect=[
+                {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "group"}},
+                BadRequest("mal"),
+            ]
+        )
+        bot = QueuedBot("123:test", request=MagicMock(post=post), sender=sender)
+
+        with metrics.measure("/saltear"):
+            bot.send_message(1, "hola")
+            bot.send_message(1, "chau")
+
+        record = metrics.snapshot()["/saltear"]
+        self.assertEqual(2, record.telegram_calls)
+        self.assertEqual(1, record.telegram_errors)
@@ -0,0 +1,256 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import MagicMock, patch
+from django.test import override_settings
+from django.utils import timezone
+
+from meals.jobs import get_next_run, run_due_jobs, sync_scheduled_jobs
+from meals.models import CocaSettings, ScheduledJob
+from meals.tests.base import CocaTestCase
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def get_settings(**kwargs):
+    return CocaSettings(
+        chat_id=1,
+        reminder_hour_utc=kwargs.get("reminder_hour_utc", 14),
+        reminder_day=kwargs.get("reminder_day", 0),
+        history_resume_day=kwargs.get("history_resume_day", 1),
+        random_run_probability=50,
+    )
+
+
+class GetNextRunTest(CocaTestCase):
+    def test_reminder_runs_on_the_reminder_day(self):
+        # 2022-09-06 es martes.
+        coca_settings = get_settings(reminder_day=2)
+        self.assertEqual(
+            utc(2022, 9, 7, 14),
+            get_next_run(ScheduledJob.SEND_REMINDER, coca_settings, utc(2022, 9, 6)),
+        )
+        self.assertEqual(
+            utc(2022, 9, 14, 14),
+            get_next_run(
+                ScheduledJob.SEND_REMINDER, coca_settings, utc(2022, 9, 7, 14)
+            ),
+        )
+
+    def test_history_resume_runs_on_the_last_day_of_short_months(self):
+        coca_settings = get_settings(history_resume_day=31)
+        self.assertEqual(
+            utc(2022, 9, 30, 14),
+            get_next_run(
+                ScheduledJob.SEND_HISTORY_RESUME, coca_settings, utc(2022, 9, 6)
+            ),
+        )
+        self.assertEqual(
+            utc(2022, 10, 31, 14),
+            get_next_run(
+                ScheduledJob.SEND_HISTORY_RESUME, coca_settings, utc(2022, 9, 30, 15)
+            ),
+        )
+        self.assertEqual(
+            utc(2023, 2, 28, 14),
+            get_next_run(
+                ScheduledJob.SEND_HISTORY_RESUME, coca_settings, utc(2023, 2, 1)
+            ),
+        )
+
+    def test_birthdays_run_on_the_next_birthday(self):
+        coca_settings = get_settings()
+        birthday_keys = {1224, 907}
+        self.assertEqual(
+            utc(2022, 9, 7, 14),
+            get_next_run(
+                ScheduledJob.SEND_BIRTHDAYS,
+                coca_settings,
+                utc(2022, 9, 6),
+                birthday_keys,
+            ),
+        )
+        self.assertEqual(
+            utc(2022, 12, 24, 14),
+            get_next_run(
+                ScheduledJob.SEND_BIRTHDAYS,
+                coca_settings,
+                utc(2022, 9, 7, 14),
+                birthday_keys,
+            ),
+        )
+        self.assertEqual(
+            utc(2023, 9, 7, 14),
+            get_next_run(
+                ScheduledJob.SEND_BIRTHDAYS,
+                coca_settings,
+                utc(2022, 12, 25),
+                birthday_keys,
+            ),
+        )
+
+    def test_birthdays_on_february_29_run_on_leap_years(self):
+        self.assertEqual(
+            utc(2024, 2, 29, 14),
+            get_next_run(
+                ScheduledJob.SEND_BIRTHDAYS, get_settings(), utc(2022, 9, 6), {229}
+            ),
+        )
+
+    def test_birthdays_without_birthdays_never_run(self):
+        self.assertIsNone(
+            get_next_run(ScheduledJob.SEND_BIRTHDAYS, get_settings(), utc(2022, 9, 6))
+        )
+
+
+class SyncScheduledJobsTest(CocaTestCase):
+    def test_sync_keeps_existing_jobs(self):
+        created, deleted = sync_scheduled_jobs()
+        self.assertEqual(
+            [
+                "send_birthdays_handler_1",
+                "send_history_resume_1",
+                "send_reminder_1",
+            ],
+            created,
+        )
+        self.assertEqual([], deleted)
+
+        pending = utc(2022, 9, 6, 14)
+        ScheduledJob.objects.update(next_run_at=pending)
+        ScheduledJob.objects.create(
+            name="send_reminder_2",
+            kind=ScheduledJob.SEND_REMINDER,
+            chat_id=2,
+            next_run_at=pending,
+            misfire_grace_time=60,
+        )
+
+        self.assertEqual(([], ["send_reminder_2"]), sync_scheduled_jobs())
+        self.assertEqual(
+            {pending}, set(ScheduledJob.objects.values_list("next_run_at", flat=True))
+        )
+
+    def test_run_soon_only_moves_the_jobs_of_that_chat(self):
+        CocaSettings.objects.create(
+            chat_id=2,
+            reminder_hour_utc=14,
+            reminder_day=0,
+            history_resume_day=1,
+            random_run_probability=50,
+        )
+        sync_scheduled_jobs()
+        before = dict(ScheduledJob.objects.values_list("name", "next_run_at"))
+
+        sync_scheduled_jobs(run_soon_chat_id=1)
+
+        for name, next_run_at in ScheduledJob.objects.values_list(
+            "name", "next_run_at"
+        ):
+            if name.endswith("_1"):
+                self.assertLessEqual(next_run_at, timezone.now() + timedelta(minutes=1))
+            else:
+                self.assertEqual(before[name], next_run_at)
+
+
+class RunDueJobsTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = ScheduledJob.objects.create(
+            name="send_reminder_1",
+            kind=ScheduledJob.SEND_REMINDER,
+            chat_id=1,
+            next_run_at=utc(2022, 9, 5, 14),
+            misfire_grace_time=3600,
+        )
+        self.enqueue_reminder = MagicMock()
+        patcher = patch(
+            "meals.jobs.get_job_functions",
+            return_value={ScheduledJob.SEND_REMINDER: self.enqueue_reminder},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_due_job_runs_once_and_is_rescheduled(self):
+        now = utc(2022, 9, 5, 14, 0, 5)
+
+        self.assertEqual(0, run_due_jobs(now=utc(2022, 9, 5, 13)))
+        self.assertEqual(1, run_due_jobs(now=now))
+        self.assertEqual(0, run_due_jobs(now=now))
+
+        self.enqueue_reminder.assert_called_once_with(1)
+        self.job.refresh_from_db()
+        self.assertEqual(utc(2022, 9, 12, 14), self.job.next_run_at)
+        self.assertEqual(now, self.job.last_run_at)
+        self.assertIsNotNone(self.job.last_success_at)
+
+    def test_missed_job_runs_within_the_grace_time(self):
+        self.assertEqual(1, run_due_jobs(now=utc(2022, 9, 5, 14, 59)))
+        self.enqueue_reminder.assert_called_once_with(1)
+
+    def test_missed_job_is_skipped_after_the_grace_time(self):
+        self.assertEqual(0, run_due_jobs(now=utc(2022, 9, 5, 16)))
+
+        self.enqueue_reminder.assert_not_called()
+        self.job.refresh_from_db()
+        self.assertEqual(utc(2022, 9, 12, 14), self.job.next_run_at)
+        self.assertIsNone(self.job.last_run_at)
+
+    @override_settings(SCHEDULED_JOB_RETRY_DELAY=300)
+    def test_failed_job_is_retried_within_the_grace_time(self):
+        self.enqueue_reminder.side_effect = [Exception("Base caída"), None]
+
+        self.assertEqual(1, run_due_jobs(now=utc(2022, 9, 5, 14, 1)))
+
+        self.job.refresh_from_db()
+        self.assertEqual(utc(2022, 9, 5, 14, 1), self.job.last_run_at)
+        self.assertIsNone(self.job.last_success_at)
+        self.assertEqual(utc(2022, 9, 5, 14, 6), self.job.next_run_at)
+        self.assertEqual(1, self.job.retries)
+
+        self.assertEqual(1, run_due_jobs(now=utc(2022, 9, 5, 14, 6)))
+
+        self.job.refresh_from_db()
+        self.assertIsNotNone(self.job.last_success_at)
+        self.assertEqual(utc(2022, 9, 12, 14), self.job.next_run_at)
+        self.assertEqual(0, self.job.retries)
+
+    @override_settings(SCHEDULED_JOB_RETRY_DELAY=1200)
+    def test_failed_job_waits_for_next_run_after_the_grace_time(self):
+        self.enqueue_reminder.side_effect = Exception("Base caída")
+
+        now = utc(2022, 9, 5, 14)
+        for _ in range(4):
+            self.assertEqual(1, run_due_jobs(now=now))
+            self.job.refresh_from_db()
+            now = self.job.next_run_at
+
+        # Entran tres reintentos de 20 minutos en la hora de margen, el cuarto ya no.
+        self.assertEqual(4, self.enqueue_reminder.call_count)
+        self.assertEqual(utc(2022, 9, 12, 14), self.job.next_run_at)
+        self.assertEqual(0, self.job.retries)
+
+    def test_job_claimed_by_another_process_does_not_run(self):
+        now = utc(2022, 9, 5, 14, 1)
+        original_filter = ScheduledJob.objects.filter
+
+        def claim_first(*args, **kwargs):
+            # Otro proceso reprograma el job entre la lectura y el UPDATE condicional.
+            if "next_run_at" in kwargs:
+                ScheduledJob.objects.update(next_run_at=utc(2022, 9, 12, 14))
+            return original_filter(*args, **kwargs)
+
+        with patch.object(ScheduledJob.objects, "filter", side_effect=claim_first):
+            self.assertEqual(0, run_due_jobs(now=now))
+
+        self.enqueue_reminder.assert_not_called()
+
+    def test_job_of_a_chat_without_settings_is_deleted(self):
+        self.job.chat_id = 2
+        self.job.name = "send_reminder_2"
+        self.job.save()
+
+        self.assertEqual(0, run_due_jobs(now=utc(2022, 9, 5, 14, 1)))
+
+        self.enqueue_reminder.assert_not_called()
+        self.assertFalse(ScheduledJob.objects.exists())
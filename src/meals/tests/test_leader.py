@@ -0,0 +1,144 @@
+import threading
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+from django.db import connection
+from django.db.models import F
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from meals.decorators import leader_only
+from meals.leader import LeaderElection
+from meals.models import SchedulerLease
+from meals.tests.base import CocaTestCase
+from meals.tests.test_sender import FakeClock
+
+
+def get_election(holder, clock=None):
+    return LeaderElection(
+        "scheduler", ttl=15, renew_interval=5, holder=holder, clock=clock or FakeClock()
+    )
+
+
+def wait(seconds):
+    # El lease vence según el reloj de la base, en vez de esperar se adelanta el vencimiento.
+    SchedulerLease.objects.update(
+        expires_at=F("expires_at") - timedelta(seconds=seconds)
+    )
+
+
+class LeaderElectionTest(CocaTestCase):
+    def test_only_one_leader(self):
+        first = get_election("primero")
+        second = get_election("segundo")
+
+        self.assertTrue(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+        self.assertTrue(first.try_acquire())
+
+        self.assertTrue(first.is_leader())
+        self.assertFalse(second.is_leader())
+        self.assertEqual("primero", SchedulerLease.objects.get().holder)
+
+    def test_renewal_keeps_the_lease(self):
+        first = get_election("primero")
+        second = get_election("segundo")
+        first.try_acquire()
+
+        wait(10)
+        first.try_acquire()
+        wait(10)
+        self.assertFalse(second.try_acquire())
+
+    def test_expired_lease_is_taken_over(self):
+        first = get_election("primero")
+        second = get_election("segundo")
+        first.try_acquire()
+
+        wait(16)
+        self.assertTrue(second.try_acquire())
+        self.assertFalse(first.try_acquire())
+
+        self.assertFalse(first.is_leader())
+        self.assertEqual("segundo", SchedulerLease.objects.get().holder)
+
+    def test_clock_of_the_replica_does_not_expire_the_lease(self):
+        first = get_election("primero")
+        second = get_election("segundo")
+        first.try_acquire()
+
+        with patch(
+            "django.utils.timezone.now",
+            return_value=timezone.now() + timedelta(minutes=10),
+        ):
+            self.assertFalse(second.try_acquire())
+
+        self.assertEqual("primero", SchedulerLease.objects.get().holder)
+
+    def test_leader_steps_down_before_its_lease_expires(self):
+        clock = FakeClock()
+        election = get_election("primero", clock)
+        election.try_acquire()
+
+        clock.now = 9
+        self.assertTrue(election.is_leader())
+        # Sin renovar deja de ser líder 5 segundos antes de que otro pueda tomar el lease.
+        clock.now = 10
+        self.assertFalse(election.is_leader())
+
+    def test_release_hands_over_right_away(self):
+        first = get_election("primero")
+        second = get_election("segundo")
+        first.try_acquire()
+
+        first.release()
+
+        self.assertFalse(first.is_leader())
+        self.assertTrue(second.try_acquire())
+
+    def test_leader_only_runs_on_the_leader(self):
+        job = MagicMock(__name__="job")
+        election = get_election("primero")
+
+        with patch("meals.decorators.scheduler_leader", election):
+            leader_only(job)("context")
+            job.assert_not_called()
+
+            election.try_acquire()
+            leader_only(job)("context")
+
+        job.assert_called_once_with("context")
+
+
+class ConcurrentLeaderElectionTest(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest(
+                "La base en memoria de SQLite no deja escribir desde varios threads, hace falta TEST NAME."
+            )
+
+    def test_replicas_racing_for_the_lease_elect_one(self):
+        elections = [get_election(f"replica{index}") for index in range(8)]
+        barrier = threading.Barrier(len(elections), timeout=5)
+        results = {}
+
+        def run(election):
+            try:
+                barrier.wait()
+                results[election.holder] = election.try_acquire()
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=run, args=(election,)) for election in elections
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        leaders = [holder for holder, leader in results.items() if leader]
+        self.assertEqual(1, len(leaders))
+        self.assertEqual(leaders[0], SchedulerLease.objects.get().holder)
@@ -0,0 +1,118 @@
+from concurrent import futures
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+from django.test import override_settings
+from telegram.error import BadRequest
+
+from meals.handlers import rica_handler, skip_handler
+from meals.media import media_registry, UNAUTHORIZED_PHOTO
+from meals.models import MediaFile
+from meals.tests.base import (
+    CocaTestCase,
+    get_mock_context,
+    get_mock_sent_audio,
+    get_mock_update,
+)
+
+
+@override_settings(TELEGRAM_TOKEN="25:test")
+class MediaRegistryTest(CocaTestCase):
+    def test_first_send_uploads_file(self):
+        callback = MagicMock(return_value=get_mock_sent_audio("abc"))
+
+        media_registry.send_audio("rica.mp3", callback, title="rica")
+
+        audio = callback.call_args.args[0]
+        self.assertIsInstance(audio, BytesIO)
+        self.assertEqual("rica.mp3", audio.name)
+        self.assertEqual("rica", callback.call_args.kwargs["title"])
+        self.assertEqual(
+            "abc", MediaFile.objects.get(name="rica.mp3", bot_id="25").file_id
+        )
+
+    def test_second_send_uses_file_id(self):
+        media_registry.send_audio(
+            "rica.mp3", MagicMock(return_value=get_mock_sent_audio("abc"))
+        )
+        callback = MagicMock()
+
+        with self.assertNumQueries(0):
+            media_registry.send_audio("rica.mp3", callback, title="rica")
+
+        callback.assert_called_once_with("abc", title="rica")
+
+    def test_file_ids_survive_restart(self):
+        media_registry.send_audio(
+            "rica.mp3", MagicMock(return_value=get_mock_sent_audio("abc"))
+        )
+        media_registry.clear()
+        media_registry.load()
+        callback = MagicMock()
+
+        media_registry.send_audio("rica.mp3", callback)
+
+        callback.assert_called_once_with("abc")
+
+    def test_file_id_from_other_bot_is_not_used(self):
+        MediaFile.objects.create(name="rica.mp3", bot_id="26", file_id="abc")
+        callback = MagicMock(return_value=get_mock_sent_audio("def"))
+
+        media_registry.send_audio("rica.mp3", callback)
+
+        self.assertIsInstance(callback.call_args.args[0], BytesIO)
+
+    def test_rejected_file_id_is_uploaded_again(self):
+        MediaFile.objects.create(name="rica.mp3", bot_id="25", file_id="abc")
+        callback = MagicMock(
+            side_effect=[
+                BadRequest("Wrong file identifier"),
+                get_mock_sent_audio("def"),
+            ]
+        )
+
+        media_registry.send_audio("rica.mp3", callback)
+
+        self.assertEqual(2, callback.call_count)
+        self.assertIsInstance(callback.call_args.args[0], BytesIO)
+        self.assertEqual("def", MediaFile.objects.get(name="rica.mp3").file_id)
+
+    def test_rejected_file_id_is_uploaded_again_without_waiting(self):
+        MediaFile.objects.create(name="rica.mp3", bot_id="25", file_id="abc")
+        rejected = futures.Future()
+        uploaded = futures.Future()
+        callback = MagicMock(side_effect=[rejected, uploaded])
+
+        sent = media_registry.send_audio("rica.mp3", callback)
+        self.assertFalse(sent.done())
+        callback.assert_called_once_with("abc")
+
+        rejected.set_exception(BadRequest("Wrong file identifier"))
+        self.assertIsInstance(callback.call_args.args[0], BytesIO)
+        uploaded.set_result(get_mock_sent_audio("def"))
+
+        self.assertEqual("def", sent.result(0).audio.file_id)
+        self.assertEqual("def", MediaFile.objects.get(name="rica.mp3").file_id)
+
+    def test_reaction_audio_is_uploaded_once(self):
+        media_registry.send_audio(
+            "rica.mp3", MagicMock(return_value=get_mock_sent_audio("abc"))
+        )
+        update = get_mock_update()
+
+        with patch("meals.decorators.random.randint", return_value=1):
+            rica_handler(update, get_mock_context())
+            rica_handler(update, get_mock_context())
+
+        self.assertEqual(
+            ["abc", "abc"],
+            [call.args[0] for call in update.message.reply_audio.call_args_list],
+        )
+
+    def test_unauthorized_photo_is_sent_by_file_id(self):
+        first_update = get_mock_update(chat_id=2)
+        skip_handler(first_update, get_mock_context())
+        second_update = get_mock_update(chat_id=2)
+        skip_handler(second_update, get_mock_context())
+
+        first_update.message.reply_photo.assert_called_once_with(UNAUTHORIZED_PHOTO)
+        second_update.message.reply_photo.assert_called_once_with("photo-file-id")
@@ -0,0 +1,117 @@
+import shutil
+import tempfile
+from os import listdir, path
+from unittest.mock import patch
+from django.test import override_settings
+
+from meals.instrumentation import HandlerMetrics, Histogram, Metrics
+from meals.metrics import dump, load, render
+from meals.tests.base import CocaTestCase
+
+
+def get_metrics():
+    handler_metrics = HandlerMetrics()
+    for elapsed_us in (800, 3000, 2_000_000):
+        handler_metrics.record(handler_metrics.measure("/agregar"), elapsed_us)
+    handler_metrics.record(
+        handler_metrics.measure("job:send_reminder"), 20000, failed=True
+    )
+
+    metrics = Metrics()
+    metrics.inc("reaction_checks", amount=10)
+    metrics.inc("reaction_hits", (("reaction", "rica_handler"),))
+    metrics.inc("job_misfires", (("job", "send_reminder"),))
+    return patch.multiple(
+        "meals.metrics", handler_metrics=handler_metrics, metrics=metrics
+    )
+
+
+class RenderTest(CocaTestCase):
+    def test_render_counters_and_histograms(self):
+        histogram = Histogram()
+        histogram.record(500)
+        histogram.record(30000)
+        histograms = {("db_query_duration", ()): histogram}
+        counters = {("cache_hits", (("cache", 'con "comillas"'),)): 3}
+
+        self.assertEqual(
+            "# HELP coca_db_query_duration_seconds Cuánto tardó cada query a la base.\n"
+            "# TYPE coca_db_query_duration_seconds histogram\n"
+            'coca_db_query_duration_seconds_bucket{le="0.001"} 1\n'
+            'coca_db_query_duration_seconds_bucket{le="0.0025"} 1\n'
+            'coca_db_query_duration_seconds_bucket{le="0.005"} 1\n'
+            'coca_db_query_duration_seconds_bucket{le="0.01"} 1\n'
+            'coca_db_query_duration_seconds_bucket{le="0.025"} 1\n'
+            'coca_db_query_duration_seconds_bucket{le="0.05"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="0.1"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="0.25"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="0.5"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="1"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="2.5"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="5"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="10"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="30"} 2\n'
+            'coca_db_query_duration_seconds_bucket{le="+Inf"} 2\n'
+            "coca_db_query_duration_seconds_sum 0.0305\n"
+            "coca_db_query_duration_seconds_count 2\n"
+            "# HELP coca_cache_hits_total Aciertos de cada cache.\n"
+            "# TYPE coca_cache_hits_total counter\n"
+            'coca_cache_hits_total{cache="con \\"comillas\\""} 3\n',
+            render(counters, histograms),
+        )
+
+    def test_metrics_view(self):
+        with get_metrics():
+            response = self.client.get("/metrics")
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(
+            response["Content-Type"].startswith("text/plain; version=0.0.4")
+        )
+        body = response.content.decode()
+        self.assertIn('coca_updates_total{handler="/agregar"} 3\n', body)
+        self.assertIn(
+            'coca_update_duration_seconds_bucket{handler="/agregar",le="0.005"} 2\n',
+            body,
+        )
+        self.assertIn('coca_job_errors_total{job="send_reminder"} 1\n', body)
+        self.assertIn('coca_job_misfires_total{job="send_reminder"} 1\n', body)
+        self.assertIn("coca_reaction_checks_total 10\n", body)
+        self.assertIn('coca_reaction_hits_total{reaction="rica_handler"} 1\n', body)
+        self.assertIn('coca_cache_hits_total{cache="settings"}', body)
+
+
+class MultiprocessTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_load_adds_every_process(self):
+        with get_metrics():
+            dump(self.directory)
+        (process_file,) = listdir(self.directory)
+        shutil.copy(
+            path.join(self.directory, process_file),
+            path.join(self.directory, "otra_replica.json"),
+        )
+
+        counters, histograms = load(self.directory)
+
+        self.assertEqual(20, counters[("reaction_checks", ())])
+        histogram = histograms[("update_duration", (("handler", "/agregar"),))]
+        self.assertEqual(6, histogram.count)
+        self.assertEqual(2 * 2_003_800, histogram.total)
+        self.assertEqual(
+            [2, 4, 6], histogram.cumulative_counts([1000, 5000, 3_000_000])
+        )
+
+    def test_metrics_view_reads_the_directory(self):
+        with open(path.join(self.directory, "otra_replica.json"), "w") as other:
+            other.write('{"counters": [["reaction_checks", [], 5]], "histograms": []}')
+
+        with get_metrics(), override_settings(METRICS_DIR=self.directory):
+            response = self.client.get("/metrics")
+
+        self.assertIn("coca_reaction_checks_total 15\n", response.content.decode())
+        self.assertEqual(2, len(listdir(self.directory)))
@@ -0,0 +1,199 @@
+import threading
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest.mock import MagicMock, call
+from django.test import override_settings
+from django.utils import timezone
+
+from meals import outbox
+from meals.models import OutboxMessage
+from meals.outbox import claim_batch, deliver_outbox
+from meals.tests.base import CocaTestCase, get_mock_sent_photo
+
+GRAPH = {"names": ["test1", "test2"], "values": [2, 1], "total": 3}
+
+
+def make_due():
+    OutboxMessage.objects.filter(next_attempt_at__isnull=False).update(
+        next_attempt_at=timezone.now()
+    )
+
+
+class OutboxTest(CocaTestCase):
+    def test_enqueue_ignores_repeated_keys(self):
+        outbox.enqueue(outbox.message(1, "hola", "saludo:1"))
+        outbox.enqueue(outbox.message(1, "hola de nuevo", "saludo:1"))
+
+        self.assertEqual(
+            ["hola"], [m.payload["text"] for m in OutboxMessage.objects.all()]
+        )
+
+    def test_deliver_sends_in_order_and_marks_sent(self):
+        outbox.enqueue(
+            outbox.message(1, "a", "a", parse_mode="MarkdownV2"),
+            outbox.message(2, "b", "b"),
+        )
+        bot = MagicMock()
+
+        self.assertEqual(2, deliver_outbox(bot))
+
+        self.assertEqual(
+            [call(1, "a", parse_mode="MarkdownV2"), call(2, "b")],
+            bot.send_message.call_args_list,
+        )
+        self.assertFalse(OutboxMessage.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(0, deliver_outbox(bot))
+
+    def test_deliver_in_batches(self):
+        outbox.enqueue(
+            *[outbox.message(1, str(index), str(index)) for index in range(5)]
+        )
+        bot = MagicMock()
+
+        self.assertEqual(2, deliver_outbox(bot, batch_size=2))
+        self.assertEqual(2, deliver_outbox(bot, batch_size=2))
+        self.assertEqual(1, deliver_outbox(bot, batch_size=2))
+
+        self.assertEqual(
+            ["0", "1", "2", "3", "4"],
+            [sent.args[1] for sent in bot.send_message.call_args_list],
+        )
+
+    def test_failed_message_holds_back_its_chat(self):
+        outbox.enqueue(
+            outbox.message(1, "primero", "primero"),
+            outbox.message(1, "segundo", "segundo"),
+            outbox.message(2, "otro chat", "otro chat"),
+        )
+        bot = MagicMock()
+        bot.send_message.side_effect = [Exception("caído"), None]
+
+        self.assertEqual(1, deliver_outbox(bot))
+        self.assertEqual(0, deliver_outbox(bot))
+
+        failed = OutboxMessage.objects.get(idempotency_key="primero")
+        self.assertEqual(1, failed.attempts)
+        self.assertEqual("Exception('caído')", failed.last_error)
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+
+        bot.send_message.side_effect = None
+        make_due()
+        self.assertEqual(2, deliver_outbox(bot))
+
+        self.assertEqual(
+            ["primero", "otro chat", "primero", "segundo"],
+            [sent.args[1] for sent in bot.send_message.call_args_list],
+        )
+
+    @override_settings(OUTBOX_RETRY_DELAY=5, OUTBOX_MAX_ATTEMPTS=3)
+    def test_retries_back_off_then_give_up(self):
+        outbox.enqueue(outbox.message(1, "hola", "hola"))
+        bot = MagicMock()
+        bot.send_message.side_effect = Exception()
+
+        delays = []
+        for _ in range(3):
+            make_due()
+            start = timezone.now()
+            deliver_outbox(bot)
+            next_attempt_at = OutboxMessage.objects.get().next_attempt_at
+            if next_attempt_at is not None:
+                delays.append(round((next_attempt_at - start).total_seconds()))
+
+        self.assertEqual([5, 10], delays)
+        discarded = OutboxMessage.objects.get()
+        self.assertEqual(3, discarded.attempts)
+        self.assertIsNone(discarded.sent_at)
+        make_due()
+        self.assertEqual(0, deliver_outbox(bot))
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        outbox.enqueue(outbox.message(1, "hola", "hola"))
+
+        self.assertEqual(1, len(claim_batch(10)))
+        self.assertEqual([], claim_batch(10))
+
+        # Si el proceso que lo tomó se cae, se vuelve a tomar cuando vence la reserva.
+        OutboxMessage.objects.update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(1, len(claim_batch(10)))
+
+    def test_lease_expired_mid_batch_is_not_sent_twice(self):
+        outbox.enqueue(outbox.message(1, "a", "a"), outbox.message(2, "b", "b"))
+        stolen = []
+
+        def send_message(chat_id, text):
+            # Mientras sale el primero, con su reserva recién renovada, se vence la del resto
+            # del lote y otro proceso lo toma.
+            OutboxMessage.objects.filter(sent_at__isnull=True).exclude(
+                chat_id=chat_id
+            ).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+            stolen.extend(m.payload["text"] for m in claim_batch(10))
+
+        bot = MagicMock()
+        bot.send_message.side_effect = send_message
+
+        self.assertEqual(1, deliver_outbox(bot))
+
+        self.assertEqual(
+            ["a"], [sent.args[1] for sent in bot.send_message.call_args_list]
+        )
+        self.assertEqual(["b"], stolen)
+        self.assertIsNotNone(OutboxMessage.objects.get(idempotency_key="a").sent_at)
+        self.assertIsNone(OutboxMessage.objects.get(idempotency_key="b").sent_at)
+
+    def test_chats_are_sent_concurrently(self):
+        outbox.enqueue(
+            outbox.message(1, "a1", "a1"),
+            outbox.message(1, "a2", "a2"),
+            outbox.message(2, "b", "b"),
+        )
+        pending = {}
+
+        def send_message(chat_id, text):
+            pending[text] = Future()
+            if text == "b":
+                # Los dos chats están en vuelo a la vez, salen en cualquier orden.
+                threading.Thread(
+                    target=lambda: [pending[t].set_result(t) for t in ("b", "a1")]
+                ).start()
+            elif text == "a2":
+                pending[text].set_result(text)
+            return pending[text]
+
+        bot = MagicMock()
+        bot.send_message.side_effect = send_message
+
+        self.assertEqual(3, deliver_outbox(bot))
+
+        # El segundo del chat 1 recién se encola cuando salió el primero.
+        self.assertEqual(
+            ["a1", "b", "a2"],
+            [sent.args[1] for sent in bot.send_message.call_args_list],
+        )
+        self.assertFalse(OutboxMessage.objects.filter(sent_at__isnull=True).exists())
+
+    @override_settings(OUTBOUND_RESULT_TIMEOUT=0.05)
+    def test_send_that_does_not_finish_is_retried(self):
+        outbox.enqueue(outbox.message(1, "a", "a"), outbox.message(1, "b", "b"))
+        never_sent = Future()
+        bot = MagicMock()
+        bot.send_message.return_value = never_sent
+
+        self.assertEqual(0, deliver_outbox(bot))
+
+        self.assertTrue(never_sent.cancelled())
+        self.assertEqual(1, bot.send_message.call_count)
+        self.assertEqual(1, OutboxMessage.objects.get(idempotency_key="a").attempts)
+        self.assertEqual(0, OutboxMessage.objects.filter(sent_at__isnull=False).count())
+
+    def test_deliver_history_chart(self):
+        outbox.enqueue(outbox.history_chart(1, GRAPH, "grafico"))
+        bot = MagicMock()
+        bot.send_photo.return_value = get_mock_sent_photo()
+
+        self.assertEqual(1, deliver_outbox(bot))
+
+        self.assertEqual(1, bot.send_photo.call_args.args[0])
+        self.assertEqual(b"\x89PNG", bot.send_photo.call_args.args[1].read()[:4])
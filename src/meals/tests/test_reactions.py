@@ -1,18 +1,29 @@
 import random
-from django.test import TestCase, override_settings
-from unittest.mock import patch
+from django.test import override_settings
+from unittest.mock import MagicMock, patch
+from telegram import Update
 from meals.handlers import (
     rica_handler,
     pegar_handler,
     chocolate_handler,
     intentar_handler,
+    REACTIONS,
+    REACTION_FILTER,
+    reaction_handler,
 )
+from meals.handlers.reactions import ReactionFilter
 
-from meals.tests.base import get_mock_context, get_mock_update
+from meals.tests.base import (
+    CocaTestCase,
+    get_mock_context,
+    get_mock_update,
+    get_recorded_update,
+)
 
 
-class AudioHandlers(TestCase):
+class AudioHandlers(CocaTestCase):
     def setUp(self, *args):
+        super().setUp()
         random.seed(1)
 
     @override_settings(CHAT_ID=1)
@@ -82,3 +93,65 @@ class AudioHandlers(TestCase):
         intentar_handler(update, context)
 
         update.message.reply_audio.assert_not_called()
+
+
+class ReactionRouterTest(CocaTestCase):
+    def get_update(self, text):
+        data = get_recorded_update("chatter")
+        data["message"]["text"] = text
+        return Update.de_json(data, MagicMock())
+
+    def get_reaction(self, text):
+        check = REACTIONS[0].check_update(self.get_update(text))
+        if not check:
+            return None
+        return REACTION_FILTER.get_handler(check["matches"][0])
+
+    def test_routes_each_reaction(self):
+        self.assertIs(rica_handler, self.get_reaction("que RICA la comida"))
+        self.assertIs(pegar_handler, self.get_reaction("hay que comprar pan"))
+        self.assertIs(pegar_handler, self.get_reaction("la compra"))
+        self.assertIs(chocolate_handler, self.get_reaction("traigo chocolate"))
+        self.assertIs(intentar_handler, self.get_reaction("voy a intentarlo"))
+
+    def test_no_reaction(self):
+        self.assertIsNone(self.get_reaction("alguien sabe que hay de postre?"))
+        self.assertIsNone(self.get_reaction("compramos ayer"))
+
+    def test_commands_do_not_trigger_reactions(self):
+        data = get_recorded_update("proximas")
+        data["message"]["text"] = "/proximas rica"
+
+        self.assertFalse(REACTIONS[0].check_update(Update.de_json(data, MagicMock())))
+
+    def test_first_reaction_in_the_list_wins(self):
+        self.assertIs(rica_handler, self.get_reaction("chocolate rica"))
+        self.assertIs(pegar_handler, self.get_reaction("intentar comprar chocolate"))
+
+    def test_first_reaction_wins_when_matches_overlap(self):
+        first, second = MagicMock(), MagicMock()
+        reaction_filter = ReactionFilter(
+            [(r"\bmundo\b", first), (r"\bhola mundo", second)]
+        )
+
+        self.assertIs(
+            first, reaction_filter.get_handler(reaction_filter.match("hola mundo"))
+        )
+        self.assertIs(
+            second, reaction_filter.get_handler(reaction_filter.match("hola mundos"))
+        )
+        self.assertIsNone(reaction_filter.match("chau"))
+
+    @override_settings(CHAT_ID=1)
+    @patch("meals.decorators.random.randint", return_value=1)
+    def test_reaction_handler_runs_matched_reaction(self, *args):
+        update = get_mock_update()
+        context = get_mock_context()
+        context.match = REACTION_FILTER.match("tengo chocolate")
+
+        reaction_handler(update, context)
+
+        update.message.reply_audio.assert_called_once()
+        self.assertEqual(
+            "chocolate", update.message.reply_audio.call_args.kwargs["title"]
+        )
@@ -0,0 +1,71 @@
+import json
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+
+from meals.models import CocaSettings, HistoryChart, Meal, MediaFile, settings_cache
+from meals.replay import FAKE_TOKEN, UpdateFactory, load_updates
+from meals.tests.base import CocaTestCase, get_recorded_update
+
+UPDATES_DIR = path.join(path.dirname(__file__), "updates")
+
+
+class UpdateFactoryTest(CocaTestCase):
+    def test_remap_moves_recorded_updates_to_load_chats(self):
+        factory = UpdateFactory([-1, -2], {"id": 1000, "is_bot": True})
+
+        updates = factory.remap([get_recorded_update("proximas")], 3)
+
+        self.assertEqual(
+            [-1, -2, -1], [update["message"]["chat"]["id"] for update in updates]
+        )
+        self.assertEqual([1, 2, 3], [update["update_id"] for update in updates])
+
+    def test_load_updates_reads_objects_and_lines(self):
+        with TemporaryDirectory() as directory:
+            lines = path.join(directory, "updates.jsonl")
+            with open(lines, "w") as lines_file:
+                lines_file.write(json.dumps(get_recorded_update("saltear")) + "\n\n")
+                lines_file.write(json.dumps(get_recorded_update("chatter")) + "\n")
+
+            updates = load_updates([path.join(UPDATES_DIR, "proximas.json"), lines])
+
+        self.assertEqual(
+            ["/proximas", "/saltear"],
+            [update["message"]["text"] for update in updates[:2]],
+        )
+        self.assertEqual(3, len(updates))
+
+
+class ReplayUpdatesCommandTest(TransactionTestCase):
+    # La migración 0012 crea la configuración, hay que restaurarla después de vaciar las tablas.
+    serialized_rollback = True
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest(
+                "La base en memoria de SQLite no deja escribir desde varios threads, hace falta TEST NAME."
+            )
+        settings_cache.clear()
+
+    def test_replays_synthetic_updates_and_cleans_up(self):
+        out = StringIO()
+
+        call_command("replay_updates", count=40, workers=2, chats=2, seed=1, stdout=out)
+
+        result = json.loads(out.getvalue())
+        self.assertEqual(40, result["updates"])
+        self.assertEqual(0, result["errors"])
+        self.assertEqual(0, result["out_of_order"])
+        self.assertGreater(result["telegram_calls_per_update"], 0)
+        self.assertEqual(
+            [1], list(CocaSettings.objects.values_list("chat_id", flat=True))
+        )
+        self.assertFalse(Meal.objects.exists())
+        fake_bot_id = FAKE_TOKEN.split(":")[0]
+        self.assertFalse(MediaFile.objects.filter(bot_id=fake_bot_id).exists())
+        self.assertFalse(HistoryChart.objects.filter(bot_id=fake_bot_id).exists())
@@ -0,0 +1,148 @@
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch
+
+from meals.jobs import sync_scheduled_jobs
+from meals.models import CocaSettings, ScheduledJob
+from meals.scheduler import EventQueue, JobScheduler
+from meals.tests.base import CocaTestCase
+from meals.tests.factories import ParticipantFactory
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def at(now):
+    return patch("meals.jobs.timezone.now", return_value=now)
+
+
+class EventQueueTest(CocaTestCase):
+    def test_pops_due_events_in_order(self):
+        events = EventQueue()
+        events.push(1, utc(2022, 9, 7))
+        events.push(2, utc(2022, 9, 5))
+        events.push(3, utc(2022, 9, 6))
+
+        self.assertEqual([2, 3], events.pop_due(utc(2022, 9, 6)))
+        self.assertEqual([], events.pop_due(utc(2022, 9, 6)))
+        self.assertEqual(1, len(events))
+
+    def test_rescheduled_event_only_fires_at_its_new_time(self):
+        events = EventQueue()
+        events.push(1, utc(2022, 9, 5))
+        events.push(1, utc(2022, 9, 7))
+        events.push(2, utc(2022, 9, 5))
+        events.push(2, None)
+
+        self.assertEqual([], events.pop_due(utc(2022, 9, 6)))
+        self.assertEqual([1], events.pop_due(utc(2022, 9, 7)))
+
+
+class JobSchedulerTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        sync_scheduled_jobs()
+        self.scheduler = JobScheduler(sync_margin=60)
+        patcher = patch("meals.scheduler.run_due_jobs", return_value=1)
+        self.run_due_jobs = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tick_runs_due_jobs_from_the_heap(self):
+        now = utc(2022, 9, 5, 14)
+        ScheduledJob.objects.update(next_run_at=utc(2022, 10, 1, 14))
+        ScheduledJob.objects.filter(name="send_reminder_1").update(next_run_at=now)
+        job = ScheduledJob.objects.get(name="send_reminder_1")
+
+        self.assertEqual(0, self.scheduler.tick(now - timedelta(seconds=1)))
+        self.run_due_jobs.assert_not_called()
+
+        self.assertEqual(1, self.scheduler.tick(now))
+        self.run_due_jobs.assert_called_once_with(now=now, job_ids=[job.id])
+
+    def test_tick_only_reads_changed_jobs(self):
+        now = utc(2022, 9, 6)
+        ScheduledJob.objects.update(next_run_at=now + timedelta(days=1), updated_at=now)
+        self.scheduler.tick(now)
+        self.assertEqual(3, len(self.scheduler.events))
+
+        later = now + timedelta(minutes=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(0, self.scheduler.tick(later))
+
+        ScheduledJob.objects.filter(name="send_reminder_1").update(
+            next_run_at=later, updated_at=later
+        )
+        self.scheduler.tick(later + timedelta(seconds=10))
+
+        self.run_due_jobs.assert_called_once_with(
+            now=later + timedelta(seconds=10),
+            job_ids=[ScheduledJob.objects.get(name="send_reminder_1").id],
+        )
+
+    def test_failed_tick_reloads_every_job(self):
+        self.run_due_jobs.side_effect = Exception("Base caída")
+        job = ScheduledJob.objects.get(name="send_reminder_1")
+
+        with self.assertRaises(Exception):
+            self.scheduler.tick(job.next_run_at)
+
+        self.run_due_jobs.side_effect = None
+        self.assertEqual(1, self.scheduler.tick(job.next_run_at))
+
+
+class ScheduleSignalsTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        sync_scheduled_jobs()
+
+    def get_birthdays_job(self, chat_id=1):
+        return ScheduledJob.objects.get(
+            name=ScheduledJob.get_name(ScheduledJob.SEND_BIRTHDAYS, chat_id)
+        )
+
+    def test_birthdays_job_follows_participant_birthdays(self):
+        self.assertIsNone(self.get_birthdays_job().next_run_at)
+
+        with at(utc(2022, 9, 6)):
+            participant = ParticipantFactory(birthday=date(1990, 12, 24))
+            self.assertEqual(
+                utc(2022, 12, 24, 14), self.get_birthdays_job().next_run_at
+            )
+
+            ParticipantFactory(birthday=date(1992, 10, 1))
+            self.assertEqual(utc(2022, 10, 1, 14), self.get_birthdays_job().next_run_at)
+
+            participant.birthday = date(1990, 9, 10)
+            participant.save()
+            self.assertEqual(utc(2022, 9, 10, 14), self.get_birthdays_job().next_run_at)
+
+            participant.delete()
+            self.assertEqual(utc(2022, 10, 1, 14), self.get_birthdays_job().next_run_at)
+
+    def test_participant_without_birthday_does_not_reschedule(self):
+        with self.assertNumQueries(1):
+            participant = ParticipantFactory()
+
+        participant.name = "Jane"
+        with self.assertNumQueries(1):
+            participant.save(update_fields=["name"])
+
+    def test_coca_settings_jobs_follow_their_settings(self):
+        coca_settings = CocaSettings.objects.create(
+            chat_id=2,
+            reminder_hour_utc=14,
+            reminder_day=0,
+            history_resume_day=1,
+            random_run_probability=50,
+        )
+        self.assertEqual(
+            {
+                "send_birthdays_handler_2",
+                "send_history_resume_2",
+                "send_reminder_2",
+            },
+            set(ScheduledJob.objects.filter(chat_id=2).values_list("name", flat=True)),
+        )
+
+        coca_settings.delete()
+        self.assertFalse(ScheduledJob.objects.filter(chat_id=2).exists())
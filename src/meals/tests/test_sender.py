@@ -0,0 +1,302 @@
+import threading
+from concurrent import futures
+from queue import Queue
+from unittest.mock import MagicMock
+from django.test import override_settings
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import TypeHandler
+
+from meals.bot import QueuedBot, wait_for_message
+from meals.dispatcher import ChatOrderedDispatcher
+from meals.sender import OutboundSender, TokenBucket
+from meals.tests.base import CocaTestCase, get_recorded_update
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeBot:
+    """
+    Guarda los mensajes enviados con el momento en que se enviaron.
+    Antes de enviar levanta los errores de `errors`, uno por llamada.
+    """
+
+    def __init__(self, clock=None, errors=None):
+        self.clock = clock
+        self.errors = list(errors or [])
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text, self.clock() if self.clock else None))
+        return text
+
+
+def get_sender(clock, global_rate=30, chat_rate=1, chat_burst=1, max_retries=3):
+    return OutboundSender(
+        global_rate=global_rate,
+        chat_rate=chat_rate,
+        chat_burst=chat_burst,
+        max_retries=max_retries,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+
+class TokenBucketTest(CocaTestCase):
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+
+        bucket.consume()
+        bucket.consume()
+
+        self.assertEqual(0.5, bucket.get_wait())
+        clock.now = 0.5
+        self.assertEqual(0, bucket.get_wait())
+
+
+class OutboundSenderTest(CocaTestCase):
+    def test_chat_rate_limit(self):
+        clock = FakeClock()
+        sender = get_sender(clock, chat_rate=1, chat_burst=2)
+        bot = FakeBot(clock)
+
+        for text in ["a", "b", "c", "d"]:
+            sender.submit(1, bot.send_message, 1, text)
+
+        self.assertEqual([(1, "a", 0), (1, "b", 0), (1, "c", 1), (1, "d", 2)], bot.sent)
+
+    def test_global_rate_limit(self):
+        clock = FakeClock()
+        sender = get_sender(clock, global_rate=2, chat_rate=10, chat_burst=10)
+        bot = FakeBot(clock)
+
+        for chat_id in [1, 2, 3, 4]:
+            sender.submit(chat_id, bot.send_message, chat_id, "hola")
+
+        self.assertEqual([0, 0, 0.5, 1], [sent_at for _, _, sent_at in bot.sent])
+
+    def test_retry_after_keeps_chat_order(self):
+        clock = FakeClock()
+        sender = get_sender(clock, chat_rate=10, chat_burst=10)
+        bot = FakeBot(clock, errors=[RetryAfter(3)])
+
+        first = sender.submit(1, bot.send_message, 1, "a")
+        second = sender.submit(1, bot.send_message, 1, "b")
+
+        self.assertEqual("a", first.result())
+        self.assertEqual("b", second.result())
+        self.assertEqual([(1, "a", 3), (1, "b", 3)], bot.sent)
+        self.assertEqual([3], clock.sleeps)
+
+    def test_retry_after_gives_up(self):
+        clock = FakeClock()
+        sender = get_sender(clock, max_retries=1)
+        bot = FakeBot(clock, errors=[RetryAfter(1), RetryAfter(1)])
+
+        future = sender.submit(1, bot.send_message, 1, "a")
+
+        with self.assertRaises(RetryAfter):
+            future.result()
+        self.assertEqual([], bot.sent)
+
+    def test_error_is_returned_in_future(self):
+        clock = FakeClock()
+        sender = get_sender(clock)
+        bot = FakeBot(clock, errors=[BadRequest("mal")])
+
+        future = sender.submit(1, bot.send_message, 1, "a")
+
+        with self.assertRaises(BadRequest):
+            future.result()
+
+    def get_running_sender(self, workers):
+        sender = OutboundSender(
+            global_rate=100,
+            chat_rate=100,
+            chat_burst=100,
+            max_retries=3,
+            workers=workers,
+        )
+        sender.start()
+        self.addCleanup(sender.stop)
+        return sender
+
+    def test_worker_alternates_chats_in_order(self):
+        sender = self.get_running_sender(workers=1)
+        bot = FakeBot()
+        sending = threading.Event()
+        release = threading.Event()
+
+        def blocking_send(chat_id, text):
+            sending.set()
+            release.wait(5)
+            return bot.send_message(chat_id, text)
+
+        sender.submit(1, blocking_send, 1, "a")
+        sending.wait(5)
+        futures = [
+            sender.submit(1, bot.send_message, 1, "b"),
+            sender.submit(1, bot.send_message, 1, "c"),
+            sender.submit(2, bot.send_message, 2, "x"),
+        ]
+        release.set()
+        for future in futures:
+            future.result(5)
+
+        self.assertEqual(["a", "b", "x", "c"], [text for _, text, _ in bot.sent])
+
+    def test_other_chats_send_while_one_is_in_flight(self):
+        sender = self.get_running_sender(workers=2)
+        bot = FakeBot()
+        sending = threading.Event()
+        release = threading.Event()
+
+        def blocking_send(chat_id, text):
+            sending.set()
+            release.wait(5)
+            return bot.send_message(chat_id, text)
+
+        first = sender.submit(1, blocking_send, 1, "a")
+        sending.wait(5)
+        second = sender.submit(1, bot.send_message, 1, "b")
+        other_chat = sender.submit(2, bot.send_message, 2, "x")
+
+        other_chat.result(5)
+        self.assertFalse(first.done())
+        self.assertFalse(second.done())
+        release.set()
+        second.result(5)
+
+        self.assertEqual(["x", "a", "b"], [text for _, text, _ in bot.sent])
+
+    def test_cancelled_message_is_not_sent(self):
+        sender = self.get_running_sender(workers=1)
+        bot = FakeBot()
+        sending = threading.Event()
+        release = threading.Event()
+
+        def blocking_send(chat_id, text):
+            sending.set()
+            release.wait(5)
+            return bot.send_message(chat_id, text)
+
+        first = sender.submit(1, blocking_send, 1, "a")
+        sending.wait(5)
+        second = sender.submit(1, bot.send_message, 1, "b")
+
+        with override_settings(OUTBOUND_RESULT_TIMEOUT=0.01):
+            with self.assertRaises(futures.TimeoutError):
+                wait_for_message(lambda: second)
+        release.set()
+        first.result(5)
+        sender.stop()
+
+        self.assertTrue(second.cancelled())
+        self.assertEqual(["a"], [text for _, text, _ in bot.sent])
+
+
+class QueuedBotTest(CocaTestCase):
+    def get_bot(self, sender, post):
+        return QueuedBot("123:test", request=MagicMock(post=post), sender=sender)
+
+    def test_send_message_goes_through_sender(self):
+        clock = FakeClock()
+        sender = get_sender(clock)
+        post = MagicMock(
+            side_effect=[
+                RetryAfter(2),
+                {
+                    "message_id": 10,
+                    "date": 0,
+                    "chat": {"id": 1, "type": "group"},
+                    "text": "hola",
+                },
+            ]
+        )
+        bot = self.get_bot(sender, post)
+
+        message = wait_for_message(bot.send_message, 1, "hola")
+
+        self.assertIsInstance(message, Message)
+        self.assertEqual(10, message.message_id)
+        self.assertEqual(2, post.call_count)
+        self.assertEqual([2], clock.sleeps)
+
+    def test_send_message_does_not_wait_for_sender(self):
+        sender = OutboundSender(
+            global_rate=100, chat_rate=100, chat_burst=100, max_retries=3
+        )
+        release = threading.Event()
+
+        def post(*args, **kwargs):
+            release.wait(5)
+            return {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "group"}}
+
+        bot = self.get_bot(sender, post)
+        sender.start()
+        try:
+            sent = bot.send_message(1, "hola")
+            self.assertFalse(sent.done())
+            release.set()
+            self.assertEqual(1, sent.result(5).message_id)
+        finally:
+            release.set()
+            sender.stop()
+
+    def test_other_endpoints_skip_sender(self):
+        sender = MagicMock()
+        bot = self.get_bot(sender, MagicMock(return_value=True))
+
+        bot.answer_callback_query("query-id")
+
+        sender.submit.assert_not_called()
+
+    @override_settings(DEVELOPER_CHAT_ID=99)
+    def test_failed_send_goes_to_error_handlers_with_its_update(self):
+        error = BadRequest("Can't parse entities")
+        bot = self.get_bot(get_sender(FakeClock()), MagicMock(side_effect=error))
+        dispatcher = ChatOrderedDispatcher(bot, Queue(), workers=1, update_workers=1)
+        bot.dispatcher = dispatcher
+        errors = []
+        dispatcher.add_handler(
+            TypeHandler(
+                Update,
+                lambda update, context: bot.send_message(update.effective_chat.id, "*"),
+            )
+        )
+        dispatcher.add_error_handler(
+            lambda update, context: errors.append((update, context.error))
+        )
+        update = Update.de_json(get_recorded_update("chatter"), bot)
+
+        dispatcher.process_update(update)
+        dispatcher.stop()
+
+        self.assertEqual([(update, error)], errors)
+
+    @override_settings(DEVELOPER_CHAT_ID=99)
+    def test_waited_and_developer_chat_sends_skip_error_handlers(self):
+        bot = self.get_bot(
+            get_sender(FakeClock()), MagicMock(side_effect=BadRequest("Bad"))
+        )
+        bot.dispatcher = MagicMock()
+
+        with self.assertRaises(BadRequest):
+            wait_for_message(bot.send_message, 1, "hola")
+        bot.send_message(99, "error")
+
+        bot.dispatcher.dispatch_error.assert_not_called()
@@ -0,0 +1,145 @@
+import json
+from queue import Queue
+from unittest.mock import MagicMock, patch
+from django.test import override_settings
+from telegram.ext import Dispatcher
+
+from meals.management.commands.run_coca import add_handlers
+from meals.models import Skip
+from meals.tests.base import CocaTestCase, get_recorded_update
+
+
+def get_mock_updater():
+    updater = MagicMock()
+    updater.bot.username = "coca_bot"
+    updater.bot.defaults = None
+    updater.update_queue = Queue()
+    return updater
+
+
+@override_settings(TELEGRAM_TOKEN="25:test")
+class WebhookTest(CocaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.updater = get_mock_updater()
+        patcher = patch("meals.webhook.get_running_updater", return_value=self.updater)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_update(self, name, token="25:test"):
+        return self.client.post(
+            f"/telegram/{token}/",
+            data=json.dumps(get_recorded_update(name)),
+            content_type="application/json",
+        )
+
+    def process_queue(self):
+        dispatcher = Dispatcher(self.updater.bot, self.updater.update_queue, workers=0)
+        add_handlers(dispatcher)
+        while not self.updater.update_queue.empty():
+            dispatcher.process_update(self.updater.update_queue.get_nowait())
+
+    async def test_webhook_enqueues_update(self):
+        response = await self.async_client.post(
+            "/telegram/25:test/",
+            data=json.dumps(get_recorded_update("proximas")),
+            content_type="application/json",
+        )
+
+        self.assertEqual(200, response.status_code)
+        update = self.updater.update_queue.get_nowait()
+        self.assertEqual(500000001, update.update_id)
+        self.assertEqual("/proximas", update.message.text)
+        self.assertEqual(1, update.message.chat.id)
+
+    async def test_webhook_invalid_token(self):
+        response = await self.async_client.post(
+            "/telegram/26:test/",
+            data=json.dumps(get_recorded_update("proximas")),
+            content_type="application/json",
+        )
+
+        self.assertEqual(403, response.status_code)
+        self.assertTrue(self.updater.update_queue.empty())
+
+    async def test_webhook_invalid_body(self):
+        response = await self.async_client.post(
+            "/telegram/25:test/", data="no json", content_type="application/json"
+        )
+
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(self.updater.update_queue.empty())
+
+    async def test_webhook_body_that_is_not_an_object(self):
+        for body in ("[]", "1", "null"):
+            with self.subTest(body=body):
+                response = await self.async_client.post(
+                    "/telegram/25:test/", data=body, content_type="application/json"
+                )
+
+                self.assertEqual(400, response.status_code)
+        self.assertTrue(self.updater.update_queue.empty())
+
+    async def test_webhook_empty_update(self):
+        response = await self.async_client.post(
+            "/telegram/25:test/", data="{}", content_type="application/json"
+        )
+
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(self.updater.update_queue.empty())
+
+    async def test_webhook_malformed_message(self):
+        for message in ({"text": "hola"}, "hola", [1]):
+            with self.subTest(message=message):
+                response = await self.async_client.post(
+                    "/telegram/25:test/",
+                    data=json.dumps({"update_id": 1, "message": message}),
+                    content_type="application/json",
+                )
+
+                self.assertEqual(400, response.status_code)
+        self.assertTrue(self.updater.update_queue.empty())
+
+    async def test_webhook_without_running_updater(self):
+        with patch("meals.webhook.get_running_updater", return_value=None), patch(
+            "meals.webhook.get_updater"
+        ) as get_updater:
+            response = await self.async_client.post(
+                "/telegram/25:test/",
+                data=json.dumps(get_recorded_update("proximas")),
+                content_type="application/json",
+            )
+
+        self.assertEqual(503, response.status_code)
+        get_updater.assert_not_called()
+
+    async def test_webhook_get_not_allowed(self):
+        response = await self.async_client.get("/telegram/25:test/")
+
+        self.assertEqual(405, response.status_code)
+
+    @override_settings(CHAT_ID=1)
+    def test_recorded_command_reaches_handler(self):
+        self.post_update("proximas")
+        self.process_queue()
+
+        self.updater.bot.send_message.assert_called_once()
+        self.assertEqual(
+            "No hay próximas comidas\\.",
+            self.updater.bot.send_message.call_args.kwargs["text"],
+        )
+
+    @override_settings(CHAT_ID=1)
+    def test_recorded_updates_are_processed_in_order(self):
+        for name in ("saltear", "chatter", "proximas"):
+            self.assertEqual(200, self.post_update(name).status_code)
+        self.process_queue()
+
+        self.assertEqual(1, Skip.objects.count())
+        self.assertEqual(
+            ["Perfecto, me salteo una comida\\.", "No hay próximas comidas\\."],
+            [
+                call.kwargs["text"]
+                for call in self.updater.bot.send_message.call_args_list
+            ],
+        )
@@ -1,19 +1,41 @@
 import random
-from django.db import transaction
-from django.db.models import Count
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from meals.exceptions import NoMealConfigured
-from meals.models import Meal, MealItem, Participant, Skip
-
+from meals.exceptions import NoMealConfigured, UnknownParticipants
+from meals.models import Meal, MealItem, MonthlyCounter, Participant, Skip
+
+NEXT_MEALS_PAGE_SIZE = 10
+
+
+def add_meal(chat_id, meals_to_create):
+    """
+    Crea la comida con un item por cada (dueño, descripción).
+    Los dueños se buscan entre todos los participantes del chat con una sola consulta.
+    :raises UnknownParticipants: Con todos los nombres que no son participantes del chat.
+    """
+    participants = list(Participant.objects.filter(chat_id=chat_id).order_by("id"))
+    participants_by_name = {
+        participant.name.lower(): participant for participant in participants
+    }
+
+    unknown_names = []
+    for owner, _ in meals_to_create:
+        if owner.lower() not in participants_by_name and owner not in unknown_names:
+            unknown_names.append(owner)
+    if unknown_names:
+        raise UnknownParticipants(
+            unknown_names, [participant.name for participant in participants]
+        )
 
-def add_meal(meals_to_create):
     with transaction.atomic():
-        meal = Meal.objects.create()
+        meal = Meal.objects.create(chat_id=chat_id)
 
         MealItem.objects.bulk_create(
             [
                 MealItem(
-                    owner=Participant.objects.get(name__iexact=owner),
+                    owner=participants_by_name[owner.lower()],
                     description=description,
                     meal=meal,
                 )
@@ -24,74 +46,167 @@ def add_meal(meals_to_create):
         return meal
 
 
-def get_next_meal():
-    meal = Meal.objects.filter(done=False).first()
+def get_next_meal(chat_id):
+    """
+    Reclama la próxima comida del chat. Si hay varios procesos mandando recordatorios
+    cada comida la reclama uno solo.
+    """
+    meal = _claim_first(
+        _with_items(Meal.objects.filter(chat_id=chat_id, done=False)),
+        lambda meal: meal.claim(),
+    )
     if meal is None:
         raise NoMealConfigured()
 
-    meal.mark_as_done()
-    meal.save()
+    return meal, _remaining_meals(chat_id)
 
-    return meal, _remaining_meals()
 
-
-def delete_meal(meal_id):
-    meal = Meal.objects.get(pk=meal_id)
+def delete_meal(chat_id, meal_id):
+    meal = Meal.objects.get(chat_id=chat_id, pk=meal_id)
 
     meal.delete()
 
     return meal
 
 
-def history():
-    return (
-        Participant.objects.filter(mealitem__meal__done=True)
-        .annotate(total_meals=Count("mealitem__meal__pk"))
-        .order_by("-total_meals")
-    )
+def history(chat_id, since=None, month=None):
+    """
+    Los participantes que compraron con la cantidad de comidas en total_meals.
+    Se lee de los contadores, sin recorrer las comidas.
+    :param date since: Primer día del mes desde el que se cuenta, todo el historial si es None.
+    :param date month: Si se pasa, agrega en month_meals las comidas de ese mes.
+    """
+    if since is None:
+        participants = Participant.objects.filter(
+            chat_id=chat_id, counter__total_meals__gt=0
+        ).annotate(total_meals=F("counter__total_meals"))
+    else:
+        participants = (
+            Participant.objects.filter(
+                chat_id=chat_id, monthlycounter__month__gte=since
+            )
+            .annotate(total_meals=Sum("monthlycounter__total_meals"))
+            .filter(total_meals__gt=0)
+        )
+
+    if month is not None:
+        month_meals = MonthlyCounter.objects.filter(
+            participant=OuterRef("pk"), month=month
+        ).values("total_meals")
+        participants = participants.annotate(
+            month_meals=Coalesce(Subquery(month_meals), 0)
+        )
+
+    return participants.order_by("-total_meals")
 
 
-def _remaining_meals():
-    return Meal.objects.filter(done=False).count()
+def _remaining_meals(chat_id):
+    return Meal.objects.filter(chat_id=chat_id, done=False).count()
 
 
-def get_skip():
-    skip = Skip.objects.first()
+def get_skip(chat_id):
+    """
+    Consume un skip del chat, cada skip lo consume un solo proceso.
+    """
+    return _claim_first(
+        Skip.objects.filter(chat_id=chat_id),
+        lambda skip: Skip.objects.filter(id=skip.id).delete()[0] > 0,
+    )
 
-    if skip:
-        skip.delete()
 
-    return skip
+def _claim_first(queryset, claim):
+    """
+    Devuelve el primer objeto de `queryset` para el que `claim(objeto)` dio True, o None si no queda ninguno.
+    `claim` tiene que cambiar la fila con un UPDATE o DELETE condicional, así aunque dos procesos
+    lean el mismo objeto solo uno lo reclama; el otro sigue con el siguiente.
+    Donde se puede la fila además se bloquea con FOR UPDATE SKIP LOCKED,
+    así los procesos toman filas distintas sin esperarse.
+    """
+    if not connection.features.has_select_for_update_skip_locked:
+        # SQLite no tiene SKIP LOCKED, se lee sin bloquear y decide el claim condicional.
+        # Dentro de una transacción, como la de enqueue_reminder, si otra conexión escribe
+        # a la vez el claim falla con database is locked en vez de esperarla.
+        while True:
+            obj = queryset.first()
+            if obj is None or claim(obj):
+                return obj
+
+    queryset = queryset.select_for_update(skip_locked=True)
+    while True:
+        with transaction.atomic(savepoint=False):
+            obj = queryset.first()
+            if obj is None or claim(obj):
+                return obj
+
+
+def add_skip(chat_id):
+    Skip.objects.create(chat_id=chat_id)
+
+
+def get_next_meals(chat_id, after_id=None, before_id=None, limit=NEXT_MEALS_PAGE_SIZE):
+    """
+    Devuelve una página de próximas comidas y si hay páginas antes y después.
+    Pagina por id: la página siguiente arranca después de `after_id` y la anterior
+    termina antes de `before_id`, así cada página cuesta lo mismo sin importar la cola.
+    """
+    meals = Meal.objects.filter(chat_id=chat_id, done=False)
+
+    if before_id is not None:
+        page = list(
+            _with_items(meals.filter(id__lt=before_id).order_by("-id")[: limit + 1])
+        )
+        page.reverse()
+        return page[-limit:], len(page) > limit, True
 
+    if after_id is not None:
+        meals = meals.filter(id__gt=after_id)
 
-def add_skip():
-    Skip.objects.create()
+    page = list(_with_items(meals[: limit + 1]))
+    return page[:limit], after_id is not None, len(page) > limit
 
 
-def get_next_meals():
-    return Meal.objects.filter(done=False)
+def get_previous_meals(chat_id, limit):
+    return _with_items(
+        Meal.objects.filter(chat_id=chat_id, done=True).order_by("-id")[:limit]
+    )
 
 
-def get_previous_meals(limit):
-    return Meal.objects.filter(done=True).order_by("-id")[:limit]
+def get_meal_items(meal):
+    return meal.mealitem_set.select_related("owner").order_by("id")
 
 
-def resolve_meal(meal_id):
-    meal = Meal.objects.get(id=meal_id)
-    meal.mark_as_done()
-    meal.save()
+def _with_items(meals):
+    """
+    Trae los items de cada comida con su dueño, en dos queries en total.
+    """
+    return meals.prefetch_related(
+        Prefetch(
+            "mealitem_set",
+            queryset=MealItem.objects.select_related("owner").order_by("id"),
+        )
+    )
+
+
+def resolve_meal(chat_id, meal_id):
+    """
+    Marca la comida como hecha con Meal.claim, así si el recordatorio u otro /resolver la marcan
+    a la vez los contadores suman una sola vez. Una comida ya hecha queda como estaba.
+    """
+    meal = Meal.objects.get(chat_id=chat_id, id=meal_id)
+    meal.claim()
 
     return meal
 
 
-def copy_meal(meal_id):
-    new_meal = Meal.objects.create()
+def copy_meal(chat_id, meal_id):
+    meal = Meal.objects.get(chat_id=chat_id, id=meal_id)
+
+    new_meal = Meal.objects.create(chat_id=chat_id)
 
-    meal = Meal.objects.get(id=meal_id)
     possible_owners = set(
-        Participant.objects.exclude(
-            id__in=meal.mealitem_set.values("owner_id")
-        ).values_list("id", flat=True)
+        Participant.objects.filter(chat_id=chat_id)
+        .exclude(id__in=meal.mealitem_set.values("owner_id"))
+        .values_list("id", flat=True)
     )
 
     new_items = []
@@ -111,6 +226,8 @@ def copy_meal(meal_id):
     return new_meal
 
 
-def get_todays_birthdays():
-    now = timezone.now()
-    return Participant.objects.filter(birthday__month=now.month, birthday__day=now.day)
+def get_todays_birthdays(chat_id):
+    today = timezone.now()
+    return Participant.objects.filter(
+        chat_id=chat_id, birthday__month=today.month, birthday__day=today.day
+    )
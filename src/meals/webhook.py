@@ -0,0 +1,100 @@
+import json
+import logging
+import threading
+from hmac import compare_digest
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+)
+from django.urls import reverse
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+_updater = None
+_updater_lock = threading.Lock()
+
+
+def get_updater():
+    """
+    Devuelve el Updater del proceso, armado con los mismos handlers y jobs que run_coca.
+    """
+    global _updater
+
+    if _updater is None:
+        with _updater_lock:
+            if _updater is None:
+                from meals.management.commands.run_coca import build_updater
+
+                _updater = build_updater()
+
+    return _updater
+
+
+def get_running_updater():
+    """
+    El Updater que armó start_webhook, o None si este proceso no recibe updates por webhook.
+    A diferencia de get_updater no lo arma, así se puede llamar desde una vista async.
+    """
+    return _updater
+
+
+def start_webhook():
+    updater = get_updater()
+
+    url = f"{settings.WEBHOOK_URL.rstrip('/')}{reverse('telegram_webhook', args=[settings.TELEGRAM_TOKEN])}"
+    updater.bot.set_webhook(url)
+    logger.info("Webhook configurado.")
+
+    updater.job_queue.start()
+    threading.Thread(
+        target=updater.dispatcher.start, name="dispatcher", daemon=True
+    ).start()
+
+    return updater
+
+
+async def telegram_webhook(request, token):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    if not compare_digest(token, settings.TELEGRAM_TOKEN):
+        logger.warning("Recibido update con un token inválido.")
+        return HttpResponseForbidden()
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        logger.info("Recibido update que no es json.")
+        return HttpResponseBadRequest()
+
+    if not isinstance(data, dict):
+        logger.info("Recibido update que no es un objeto json.")
+        return HttpResponseBadRequest()
+
+    updater = get_running_updater()
+    if updater is None:
+        logger.warning("Recibido update sin el webhook andando, falta WEBHOOK_URL.")
+        return HttpResponse(status=503)
+
+    try:
+        update = Update.de_json(data, updater.bot)
+    except Exception:
+        # de_json no valida, un campo con otra forma termina en cualquier excepción.
+        logger.info("Recibido update que no se puede leer.", exc_info=True)
+        return HttpResponseBadRequest()
+
+    if update is None:
+        logger.info("Recibido update vacío.")
+        return HttpResponseBadRequest()
+
+    updater.update_queue.put(update)
+
+    return HttpResponse()
+
+
+# Telegram no manda el token CSRF, y csrf_exempt no soporta vistas async en Django 4.0.
+telegram_webhook.csrf_exempt = True